@@ -10,7 +10,14 @@ This is an open source software. It's my great pleasure that my thoughts and wor
 If you have any questions or suggestions, please don't hesitate to contact me. The email address is shown upwards.
 """
 
-from instruments import strategy
+import sys
+
+from instruments import cli
 
 if __name__ == "__main__":
-    strategy.guide_through("documents/", "outputs/")
+
+    # Without any argument, runs the interactive guide. Otherwise runs a subcommand, e.g. "python automate.py render
+    # documents/OpmlExample.opml", or the batch mode with a manifest file, e.g. "python automate.py manifest.json",
+    # and with "--watch" following it, keeps rebuilding the documents whenever they're saved. See "--help".
+
+    sys.exit(cli.main())
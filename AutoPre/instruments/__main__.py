@@ -0,0 +1,7 @@
+import sys
+
+from . import cli
+
+# Runs the command line of AutoPre, e.g. "python -m instruments render documents/OpmlExample.opml".
+
+sys.exit(cli.main())
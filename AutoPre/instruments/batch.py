@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import contextlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from . import load
+from . import strategy
+from . import incremental
+from . import imagelibrary
+from . import packaging
+from . import parsecache
+from . import profiler
+from . import sectionpool
+from . import templateregistry
+
+# The default output parameters of a document. The title defaults to the file's name without extension.
+
+DEFAULT_SPEC = {
+    'title': None,
+    'date': '',
+    'author': '',
+    'template': 'Marxist',
+    'level_mode': True,
+    'img_mode': False,
+    'incremental': False,
+    'streaming': False,
+    'engine': 'pptx',
+    'prune': False,
+    'section_workers': 1
+    }
+
+
+def load_manifest(location):
+    """Loads a batch manifest from a json file.
+
+    The manifest is a dictory with two optional entries:
+        defaults: A dictory of output parameters applied to every document.
+        documents: A dictory maps each file name to its own output parameters, which override the defaults.
+
+    The output parameters are the keys of DEFAULT_SPEC, i.e. title, date, author, template, level_mode and img_mode.
+    With incremental set, only the slides of the nodes changed since the last run are made, see incremental.rebuild().
+    With streaming set, the slides are written into the output as they are made, see strategy.stream_presentation().
+    With engine set to 'xml', the slides are filled from precompiled slide XML, see xmlrender.XmlRenderer.
+    With prune set, the layouts no slide uses are dropped from the output, see packaging.prune_layouts(), which is
+    ignored for an incremental job, whose output is filled again on the next run.
+    With section_workers set beyond 1, the first level sections of a non-incremental document are rendered on that many
+    worker processes of its own, see sectionpool.SectionPool.
+    An optional "workers" entry sets the number of worker processes used by run_batch(),
+    and an optional "parse_cache" entry sets the folder of the parse cache, see parsecache.ParseCache.
+    An optional "images" entry sets the folder of the images the notes reference, see imagelibrary.ImageLibrary.
+    An optional "profile" entry turns on the instrumentation of each document, see profiler.Capture. It's a dictory
+    of "location", the folder the reports are written into, and the booleans "cprofile" and "tracemalloc".
+
+    Args:
+        location: A string that contains the location of the manifest file.
+
+    Returns:
+        The manifest dictory.
+    """
+
+    with open(location, 'r', encoding='UTF-8') as file:
+        manifest = json.load(file)
+
+    return manifest
+
+
+def to_bool(value):
+    """Converts 'Y'/'N' answers, as used by the interactive guide, or booleans to a boolean."""
+
+    if isinstance(value, str):
+        return value.strip().upper() in ['Y', 'YES', 'TRUE', '1']
+
+    return bool(value)
+
+
+def plan_jobs(loc_in, manifest):
+    """Plans the output parameters of every valid document in the input folder and its subfolders.
+
+    Args:
+        loc_in: A string that indicates folder that contains the content files (.opml, .docx or .md).
+        manifest: A manifest dictory, see load_manifest().
+
+    Returns:
+        A list of job dictories, each one contains the file name relative to the input folder, the output name and its
+        output parameters.
+        The output names are unique and depend only on the manifest and the file names, so that parallel
+        runs always write the same files.
+    """
+
+    defaults = dict(DEFAULT_SPEC)
+    defaults.update(manifest.get('defaults', {}))
+    documents = manifest.get('documents', {})
+
+    jobs = []
+    outputs = set()
+
+    # The temporary files and the files of unsupported formats are skipped, see load.scan_files().
+
+    for file in load.scan_files(loc_in):
+
+        job = dict(defaults)
+        job.update(documents.get(file, {}))
+        job['file'] = file
+        job['parse_cache'] = manifest.get('parse_cache')
+        job['images'] = manifest.get('images')
+        job['profile'] = manifest.get('profile')
+
+        if job['title'] is None:
+            job['title'] = os.path.splitext(os.path.basename(file))[0]
+
+        if job['template'] not in templateregistry.names():
+            print("  {}: template {} is invalid. Now using default template Marxist.".format(file, job['template']))
+            job['template'] = 'Marxist'
+
+        if job['engine'] not in strategy.ENGINES:
+            print("  {}: render engine {} is invalid. Now using default engine pptx.".format(file, job['engine']))
+            job['engine'] = 'pptx'
+
+        job['level_mode'] = to_bool(job['level_mode'])
+        job['img_mode'] = to_bool(job['img_mode'])
+        job['incremental'] = to_bool(job['incremental'])
+        job['streaming'] = to_bool(job['streaming'])
+        job['prune'] = to_bool(job['prune'])
+        job['section_workers'] = int(job['section_workers'])
+
+        # Documents sharing the same title are numbered in the order of their file names.
+
+        output = job['title']
+        num = 2
+        while output in outputs:
+            output = '{} ({})'.format(job['title'], num)
+            num += 1
+
+        outputs.add(output)
+        job['output'] = output
+
+        jobs.append(job)
+
+    return jobs
+
+
+def run_job(job, loc_in, loc_out):
+    """Runs a job, see fill_job(), and captures its instrumentation report if the job is profiled.
+
+    The presentation is already saved when the report is written, so a report that can't be written doesn't fail the
+    job, its error is given in the result instead.
+
+    Returns:
+        The result dictory of fill_job(), which contains the report as well if the job is profiled.
+    """
+
+    if not job['profile']:
+        return fill_job(job, loc_in, loc_out)
+
+    options = job['profile']
+
+    with profiler.Capture(job['output'], options.get('cprofile', False), options.get('tracemalloc', False)) as capture:
+        result = fill_job(job, loc_in, loc_out)
+
+    result['report'] = capture.report
+
+    if options.get('location'):
+
+        try:
+            capture.write(options['location'])
+
+        except OSError as error:
+            result['report_error'] = str(error)
+
+    return result
+
+
+def fill_job(job, loc_in, loc_out):
+    """Loads, fills and saves the presentation of a single document without any prompt.
+
+    Args:
+        job: A job dictory, see plan_jobs().
+        loc_in: A string that indicates folder that contains the content files (.opml, .docx or .md).
+        loc_out: A string that indicates folder that contains the output files (.pptx).
+
+    Returns:
+        A dictory that contains the file name, the output location, the number of slides
+        and the seconds spent on loading, rendering and saving. For an incremental or a streaming job, the saving is
+        counted into the rendering, and the number of nodes whose slides are made again is given as well.
+        With the parse cache, whether the tree is read from the cache is given too.
+    """
+
+    start = time.perf_counter()
+
+    # The parse cache is only used for the document of the job, see parsecache.using().
+
+    if job['parse_cache'] is not None:
+        with parsecache.using(job['parse_cache']) as cache:
+            hits = cache.hits
+            root_node = load.read_file(loc_in + job['file'])
+
+    else:
+        root_node = load.read_file(loc_in + job['file'])
+
+    loaded = time.perf_counter()
+
+    prs_info = {
+        'title': job['title'],
+        'date': job['date'],
+        'part_num': 0,
+        'part_title': None,
+        'color': templateregistry.color(job['template']),
+        'author': job['author']
+        }
+
+    if job['images'] is not None:
+        prs_info['images'] = imagelibrary.open_library(job['images'])
+
+    output = loc_out + job['output'] + '.pptx'
+
+    with contextlib.ExitStack() as stack:
+
+        if job['section_workers'] > 1 and not job['incremental']:
+            pool = stack.enter_context(sectionpool.SectionPool(job['template'], job['engine'], job['section_workers']))
+        else:
+            pool = None
+
+        if job['incremental']:
+            prs, rebuilt = incremental.rebuild(root_node, prs_info, job['template'], job['level_mode'], job['img_mode'],
+                                               output, job['engine'])
+            rendered = time.perf_counter()
+
+        elif job['streaming']:
+            prs = strategy.stream_presentation(root_node, prs_info, job['template'], job['level_mode'], job['img_mode'],
+                                               output, job['engine'], job['prune'], pool)
+            rendered = time.perf_counter()
+
+        else:
+            prs = strategy.make_presentation(root_node, prs_info, job['template'], job['level_mode'], job['img_mode'],
+                                             job['engine'], pool)
+            rendered = time.perf_counter()
+
+            packaging.save(prs, output, job['prune'])
+
+    saved = time.perf_counter()
+
+    result = {
+        'file': job['file'],
+        'output': output,
+        'slides': len(prs.slides),
+        'load': loaded - start,
+        'render': rendered - loaded,
+        'save': saved - rendered,
+        'total': saved - start
+        }
+
+    if job['incremental']:
+        result['rebuilt'] = rebuilt
+
+    if job['parse_cache'] is not None:
+        result['cached'] = cache.hits > hits
+
+    return result
+
+
+def run_job_safely(job, loc_in, loc_out):
+    """Runs a job like run_job(), but returns the failure as a result instead of raising it.
+
+    So that a broken document doesn't stop the other documents of the batch.
+
+    Returns:
+        The result dictory of run_job(), or a dictory that contains the file name and the error message.
+    """
+
+    try:
+        return run_job(job, loc_in, loc_out)
+
+    except Exception:
+        return {'file': job['file'], 'error': traceback.format_exc()}
+
+
+def run_batch(loc_in, loc_out, manifest, workers=None):
+    """Outputs the presentations of all the valid documents in the input folder without any prompt.
+
+    It's the non-interactive counterpart of strategy.guide_through(). The timing of each document
+    and a throughput summary are reported at the end.
+
+    Args:
+        loc_in: A string that indicates folder that contains the content files (.opml, .docx or .md).
+        loc_out: A string that indicates folder that contains the output files (.pptx).
+        manifest: A manifest dictory, see load_manifest().
+        workers: An integer count of the worker processes. The documents are processed one by one in
+            the current process if it's 1. Defaults to the manifest's "workers" entry, or 1.
+
+    Returns:
+        A list of the result dictories in the order of the jobs, see run_job_safely().
+    """
+
+    print("AutoPre:")
+
+    jobs = plan_jobs(loc_in, manifest)
+
+    if workers is None:
+        workers = manifest.get('workers', 1)
+
+    start = time.perf_counter()
+
+    # Each document is loaded, filled and saved independently, so they can be sent to a process pool as a whole.
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_job_safely, job, loc_in, loc_out) for job in jobs]
+            results = [future.result() for future in futures]
+
+    else:
+        results = [run_job_safely(job, loc_in, loc_out) for job in jobs]
+
+    for result in results:
+
+        if 'error' in result:
+            print("  {} failed:\n{}".format(result['file'], result['error']))
+
+        else:
+            print("  {} -> {}  {} slides  load {:.3f}s  render {:.3f}s  save {:.3f}s".format(
+                result['file'], result['output'], result['slides'], result['load'], result['render'], result['save']))
+
+            if 'rebuilt' in result:
+                print("    {} nodes made again.".format(result['rebuilt']))
+
+            if 'report_error' in result:
+                print("    Report not written: {}".format(result['report_error']))
+
+    report_summary(results, time.perf_counter() - start)
+
+    return results
+
+
+def report_summary(results, wall_time):
+    """Prints the throughput summary of a batch.
+
+    Args:
+        results: A list of the result dictories, see run_job().
+        wall_time: The seconds the whole batch takes.
+    """
+
+    done = [result for result in results if 'error' not in result]
+    slides = sum(result['slides'] for result in done)
+
+    print("\n  {} documents, {} slides in {:.3f}s. {} failed.".format(len(done), slides, wall_time, len(results) - len(done)))
+
+    cached = [result['cached'] for result in done if 'cached' in result]
+
+    if cached:
+        print("  Parse cache: {} hits, {} misses.".format(sum(cached), len(cached) - sum(cached)))
+
+    if wall_time > 0:
+        print("  Throughput: {:.2f} documents/s, {:.1f} slides/s.\n".format(len(done) / wall_time, slides / wall_time))
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    run_batch("../documents/", "../outputs/", {'defaults': {'date': 'Date  30/7/2021', 'author': 'Reporter Kirov'}})
@@ -0,0 +1,620 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from xml.sax.saxutils import quoteattr
+
+from . import load
+from . import packaging
+from . import slidemaker
+from . import strategy
+from . import templatecache
+from . import templateregistry
+
+
+class PlainNode(object):
+    """The former layout of OutlineNode, with a per-instance dictory and an empty child list for every node.
+
+    It's only kept as the reference of node_memory().
+    """
+
+    def __init__(self, title, note, layer):
+
+        self.title = title
+        self.note = note
+        self.layer = int(layer)
+
+        self.child = []
+        self.father = None
+
+
+def build_tree(node_class, count, breadth=4):
+    """Builds a nodes' tree of the indicated size, in which every node has at most breadth children.
+
+    The title and note strings are shared by all the nodes, so that only the memory of the nodes themselves is counted.
+
+    Returns:
+        The list of all the nodes, of which the first one is the root node.
+    """
+
+    nodes = [node_class('', '', 0)]
+
+    for n in range(1, count):
+        father = nodes[(n - 1) // breadth]
+        node = node_class('title', 'note', father.layer + 1)
+        node.father = father
+
+        if isinstance(node, load.OutlineNode):
+            father.add_child(node)
+        else:
+            father.child.append(node)
+
+        nodes.append(node)
+
+    return nodes
+
+
+def node_memory(count=100000):
+    """Measures the memory taken by each node of a nodes' tree, as objects and as a columnar store, see
+    load.OutlineTree.
+
+    Args:
+        count: An integer count of the nodes in the tree.
+
+    Returns:
+        A dictory maps the name of the node class to the bytes taken per node.
+    """
+
+    result = {}
+
+    for node_class in [PlainNode, load.OutlineNode]:
+        tracemalloc.start()
+
+        root_node = build_tree(node_class, count)[0] # Only the tree is kept, without the list of the nodes.
+        result[node_class.__name__] = tracemalloc.get_traced_memory()[0] / count
+
+        tracemalloc.stop()
+
+        del root_node
+
+    # The same tree as the columns of parsecache.flatten(), whose lists are dropped once the store is built.
+
+    tracemalloc.start()
+
+    fathers = [-1] + [(n - 1) // 4 for n in range(1, count)]
+    layers = [0]
+
+    for n in range(1, count):
+        layers.append(layers[fathers[n]] + 1)
+
+    root_node = load.OutlineTree(['title'] * count, ['note'] * count, layers, fathers).node()
+    del fathers, layers
+    result[load.OutlineTree.__name__] = tracemalloc.get_traced_memory()[0] / count
+
+    tracemalloc.stop()
+
+    del root_node
+
+    return result
+
+
+# Synthetic outlines.
+
+def make_outline(sections=10, depth=3, breadth=3, note_length=200):
+    """Makes the content of a synthetic outline.
+
+    The root has the indicated count of sections, and every other node has breadth children until the depth is reached.
+
+    Args:
+        sections: An integer count of the layer 1 nodes.
+        depth: An integer count of the layers below the root.
+        breadth: An integer count of the children of each node below layer 1.
+        note_length: An integer count of the characters in each note.
+
+    Returns:
+        A list of tuples of (layer, title, note) in pre-order, of which the first one is the root.
+    """
+
+    words = 'AutoPre fills the slides from the outline so that we can focus on the content itself '
+    note = (words * (note_length // len(words) + 1))[:note_length]
+
+    outline = [(0, 'Synthetic Outline', '')]
+    stack = [(1, str(n + 1)) for n in reversed(range(sections))]
+
+    while stack:
+        layer, number = stack.pop()
+        outline.append((layer, 'Heading ' + number, note))
+
+        if layer < depth:
+            stack.extend((layer + 1, number + '.' + str(n + 1)) for n in reversed(range(breadth)))
+
+    return outline
+
+
+def write_opml(location, outline):
+    """Writes a synthetic outline as a Dynalist styled opml file."""
+
+    lines = ['<?xml version="1.0" encoding="utf-8"?>', '<opml version="2.0">', '  <head>', '    <title></title>',
+             '  </head>', '  <body>']
+    layers = []
+
+    for layer, title, note in outline:
+
+        while layers and layers[-1] >= layer:
+            lines.append('  ' * (layers.pop() + 2) + '</outline>')
+
+        lines.append('  ' * (layer + 2) + '<outline text={} _note={}>'.format(
+            quoteattr(title), quoteattr(note, {'\n': '&#10;'})))
+        layers.append(layer)
+
+    while layers:
+        lines.append('  ' * (layers.pop() + 2) + '</outline>')
+
+    lines.extend(['  </body>', '</opml>'])
+
+    with open(location, 'w', encoding='UTF-8') as file:
+        file.write('\n'.join(lines))
+
+
+def write_docx(location, outline):
+    """Writes a synthetic outline as a docx file, in which the layer of a node is its heading level.
+
+    Noted that python-docx is only needed here.
+    """
+
+    import docx
+
+    document = docx.Document()
+
+    for layer, title, note in outline[1:]:
+        document.add_heading(title, min(layer, 9))
+
+        if note:
+            document.add_paragraph(note)
+
+    document.save(location)
+
+
+def write_markdown(location, outline):
+    """Writes a synthetic outline as a markdown file, in which the layer of a node is the count of "#" of its title."""
+
+    lines = []
+
+    for layer, title, note in outline[1:]:
+        lines.append('#' * min(layer, 6) + ' ' + title)
+
+        if note:
+            lines.extend(['', note, ''])
+
+    with open(location, 'w', encoding='UTF-8') as file:
+        file.write('\n'.join(lines))
+
+
+def make_tree(outline):
+    """Builds the nodes' tree of a synthetic outline and returns its root node."""
+
+    nodes = []
+
+    for layer, title, note in outline:
+        node = load.OutlineNode(title, note, layer)
+
+        while nodes and nodes[-1].layer >= layer:
+            nodes.pop()
+
+        if nodes:
+            node.set_father(nodes[-1])
+            nodes[-1].add_child(node)
+
+        nodes.append(node)
+
+    return nodes[0]
+
+
+# Measurements.
+
+def measure(function, *args, repeat=3):
+    """Measures a function call.
+
+    The call is timed a few times without tracing, then called once more under tracemalloc for the peak memory.
+
+    Returns:
+        A dictory that contains the best seconds and the peak bytes of the call.
+    """
+
+    seconds = []
+
+    for n in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'seconds': min(seconds), 'peak_bytes': peak}
+
+
+def prs_info(template):
+    """Returns the presentation information used by the benchmarks."""
+
+    return {
+        'title': 'Benchmark',
+        'date': 'Date  1/1/2021',
+        'part_num': 1,
+        'part_title': 'Part',
+        'color': templateregistry.color(template),
+        'author': 'Report  AutoPre'
+        }
+
+
+def slide_makers(root_node):
+    """Returns the slide makers to measure, each one as a function making a single slide."""
+
+    node = root_node.child[0]
+
+    # A note with a formula and a highlighted code block, see notemarkup.
+
+    markup_node = load.OutlineNode('Markup', 'Euler:\n$$e^{i\\pi} + 1 = 0$$\n```python\nimport cmath\n'
+                                   'print(cmath.exp(1j * cmath.pi) + 1)\n```', 3)
+
+    return {
+        'CoverSlideMaker': lambda info, prs: slidemaker.CoverSlideMaker(root_node, info, prs),
+        'SectionSlideMaker/1': lambda info, prs: slidemaker.SectionSlideMaker(node, info, prs, 1),
+        'SectionSlideMaker/2': lambda info, prs: slidemaker.SectionSlideMaker(node, info, prs, 2),
+        'TextSlideMaker': lambda info, prs: slidemaker.TextSlideMaker(node, info, prs),
+        'TextSlideMaker/markup': lambda info, prs: slidemaker.TextSlideMaker(markup_node, info, prs),
+        'ImgTextSlideMaker': lambda info, prs: slidemaker.ImgTextSlideMaker(node, info, prs),
+        'BackCoverSlideMaker': lambda info, prs: slidemaker.BackCoverSlideMaker(prs)
+        }
+
+
+def run(location=None, sections=10, depth=3, breadth=3, note_length=200, slides=50, repeat=3):
+    """Runs the whole benchmark suite.
+
+    The stages are measured separately: loading the synthetic opml, docx and markdown files, introspecting the
+    templates, making each kind of slide, filling the whole presentation with the standard strategy on each render
+    engine, and saving it by python-pptx and by the packaging stage, on each template.
+
+    Args:
+        location: A string that indicates folder for the synthetic files. Defaults to the system's temporary folder.
+        sections, depth, breadth, note_length: The size of the synthetic outline, see make_outline().
+        slides: An integer count of the slides made for each kind of slide maker.
+        repeat: An integer count of the timed runs of each stage, of which the best one is reported.
+
+    Returns:
+        A dictory of the environment, the parameters and the results keyed by the stage names.
+    """
+
+    if location is None:
+        location = tempfile.gettempdir()
+
+    outline = make_outline(sections, depth, breadth, note_length)
+    opml_location = os.path.join(location, 'benchmark.opml')
+    docx_location = os.path.join(location, 'benchmark.docx')
+    markdown_location = os.path.join(location, 'benchmark.md')
+
+    write_opml(opml_location, outline)
+    write_docx(docx_location, outline)
+    write_markdown(markdown_location, outline)
+
+    results = {}
+
+    results['load/opml'] = measure(load.read_opml.__wrapped__, opml_location, repeat=repeat)
+    results['load/docx'] = measure(load.read_docx.__wrapped__, docx_location, repeat=repeat)
+    results['load/markdown'] = measure(load.read_markdown.__wrapped__, markdown_location, repeat=repeat)
+
+    # Introspecting the templates from their package XML, and reading them back from the registry's index file.
+
+    location_index = os.path.join(location, 'benchmark_templates.json')
+    templateregistry.TemplateRegistry(templateregistry.REGISTRY.location, location_index).refresh()
+
+    results['templates/inspect'] = measure(
+        lambda: templateregistry.TemplateRegistry(templateregistry.REGISTRY.location, None).refresh(), repeat=repeat)
+    results['templates/index'] = measure(
+        lambda: templateregistry.TemplateRegistry(templateregistry.REGISTRY.location, location_index).refresh(),
+        repeat=repeat)
+
+    root_node = make_tree(outline)
+
+    for template in templateregistry.names():
+
+        # Each kind of slide, the seconds are given per slide.
+
+        for name, make in slide_makers(root_node).items():
+
+            def make_slides():
+                info = prs_info(template)
+                prs = templatecache.open_template(template)
+
+                for n in range(slides):
+                    make(info, prs)
+
+            result = measure(make_slides, repeat=repeat)
+            result['seconds'] /= slides
+            results['slide/{}/{}'.format(name, template)] = result
+
+        # The whole presentation.
+
+        def make_presentation():
+            info = prs_info(template)
+            info['part_num'] = 0
+            return strategy.make_presentation(root_node, info, template, True, False)
+
+        results['strategy/{}'.format(template)] = measure(make_presentation, repeat=repeat)
+
+        def make_xml_presentation():
+            info = prs_info(template)
+            info['part_num'] = 0
+            return strategy.make_presentation(root_node, info, template, True, False, 'xml')
+
+        results['strategy/xml/{}'.format(template)] = measure(make_xml_presentation, repeat=repeat)
+
+        prs = make_presentation()
+        output = io.BytesIO()
+
+        def save():
+            output.seek(0)
+            output.truncate()
+            prs.save(output)
+
+        results['save/{}'.format(template)] = measure(save, repeat=repeat)
+        results['save/{}'.format(template)]['bytes'] = len(output.getvalue())
+
+        # The packaging stage, which drops the unused layouts of the presentation as well.
+
+        def save_packaged():
+            output.seek(0)
+            output.truncate()
+            packaging.save(prs, output, prune=True)
+
+        results['save/packaged/{}'.format(template)] = measure(save_packaged, repeat=repeat)
+        results['save/packaged/{}'.format(template)]['bytes'] = len(output.getvalue())
+
+    import pptx
+
+    return {
+        'environment': {'python': platform.python_version(), 'python-pptx': pptx.__version__, 'machine': platform.machine()},
+        'parameters': {'nodes': len(outline), 'sections': sections, 'depth': depth, 'breadth': breadth,
+                       'note_length': note_length, 'slides': slides, 'repeat': repeat},
+        'results': results
+        }
+
+
+def folder_times(location=None, count=2000, workers=None, sections=2, depth=2, breadth=3,
+                 note_length=200):
+    """Measures loading a folder of many small synthetic files, one by one and concurrently, see load.read_files().
+
+    The files are spread over a few subfolders, a third of each format, so that the recursive scanning is measured too.
+
+    Args:
+        location: A string that indicates folder for the synthetic files, which is filled once. Defaults to the
+            benchmark_folder in the system's temporary folder.
+        count: An integer count of the files.
+        workers: An integer count of the threads or the processes.
+        sections, depth, breadth, note_length: The size of each synthetic outline, see make_outline().
+
+    Returns:
+        A dictory maps the way of loading, i.e. 'serial', 'threads' and 'processes', to its seconds.
+    """
+
+    if location is None:
+        location = os.path.join(tempfile.gettempdir(), 'benchmark_folder')
+
+    outline = make_outline(sections, depth, breadth, note_length)
+    writers = [('.opml', write_opml), ('.docx', write_docx), ('.md', write_markdown)]
+
+    if len(load.scan_files(location)) != count:
+
+        for n in range(count):
+            extension, write = writers[n % len(writers)]
+            folder = os.path.join(location, 'part{}'.format(n % 10))
+
+            os.makedirs(folder, exist_ok=True)
+            write(os.path.join(folder, 'outline{}{}'.format(n, extension)), outline)
+
+    times = {}
+
+    start = time.perf_counter()
+    for file in load.scan_files(location):
+        load.read_file(os.path.join(location, file))
+    times['serial'] = time.perf_counter() - start
+
+    for way, processes in [('threads', False), ('processes', True)]:
+        start = time.perf_counter()
+        for file, root_node in load.read_files(location, workers=workers, processes=processes):
+            pass
+        times[way] = time.perf_counter() - start
+
+    return times
+
+
+# The modules import_times() measures, of which the first one, the command line, is given the budget, and the heavy
+# dependencies it shouldn't import before a subcommand needs them.
+
+IMPORT_MODULES = ['instruments.cli', 'instruments.templateregistry', 'instruments.load', 'instruments.strategy',
+                  'instruments.batch']
+HEAVY_MODULES = ['pptx', 'docx', 'lxml', 'PIL']
+
+
+def import_times(modules=IMPORT_MODULES, repeat=5):
+    """Measures the time each module takes to import, in a fresh interpreter every run.
+
+    Returns:
+        A dictory maps the module name to a tuple of (the best seconds of the runs, the list of the heavy modules,
+        see HEAVY_MODULES, it imports).
+    """
+
+    code = ('import sys, time\n'
+            'start = time.perf_counter()\n'
+            'import {}\n'
+            'seconds = time.perf_counter() - start\n'
+            'print(seconds, *[name for name in {!r} if name in sys.modules])')
+
+    times = {}
+
+    for module in modules:
+        best = None
+
+        for n in range(repeat):
+
+            # Runs in the AutoPre folder, where the instruments package is.
+
+            result = subprocess.run([sys.executable, '-c', code.format(module, HEAVY_MODULES)], capture_output=True,
+                                    text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+            seconds, *heavy = result.stdout.split()
+
+            if best is None or float(seconds) < best:
+                best = float(seconds)
+
+        times[module] = (best, heavy)
+
+    return times
+
+
+def compare(old, new, threshold=0.1):
+    """Compares two runs of the benchmark suite.
+
+    Args:
+        old: The dictory of the reference run, see run().
+        new: The dictory of the new run.
+        threshold: The ratio of the slowdown, or the growth of the peak memory, that counts as a regression.
+
+    Returns:
+        A list of tuples of (stage, measurement, old value, new value) of the regressions.
+    """
+
+    regressions = []
+
+    for stage, result in new['results'].items():
+
+        if stage not in old['results']:
+            continue
+
+        for measurement in ['seconds', 'peak_bytes']:
+            before = old['results'][stage][measurement]
+            after = result[measurement]
+
+            if before > 0 and after > before * (1 + threshold):
+                regressions.append((stage, measurement, before, after))
+
+    return regressions
+
+
+def main(argv=None, prog='benchmark'):
+    """Runs the benchmark suite from the command line, e.g. "python -m instruments.benchmark run -o new.json",
+    or compares two runs, e.g. "python -m instruments.benchmark compare old.json new.json", or checks the import time
+    budget, e.g. "python automate.py bench imports --budget 0.05", or measures loading a folder of many files, e.g.
+    "python automate.py bench folder --count 2000". The import time budget is checked as a gate of the continuous
+    integration by "python automate.py bench imports --check", whose exit status is 1 once the budget is exceeded.
+
+    Args:
+        argv: A list of the arguments. Defaults to the command line's.
+        prog: A string of the program's name shown in the help, e.g. "automate.py bench".
+    """
+
+    parser = argparse.ArgumentParser(prog=prog, description='AutoPre benchmark suite.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='runs the benchmark suite and prints or writes the results as json')
+    run_parser.add_argument('-o', '--output', help='the json file to write the results into')
+    run_parser.add_argument('--location', help='the folder for the synthetic files, the temporary folder by default')
+    run_parser.add_argument('--sections', type=int, default=10)
+    run_parser.add_argument('--depth', type=int, default=3)
+    run_parser.add_argument('--breadth', type=int, default=3)
+    run_parser.add_argument('--note-length', type=int, default=200)
+    run_parser.add_argument('--slides', type=int, default=50)
+    run_parser.add_argument('--repeat', type=int, default=3)
+
+    compare_parser = commands.add_parser('compare', help='flags the regressions between two runs')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+
+    memory_parser = commands.add_parser('memory', help='measures the memory taken by each outline node')
+    memory_parser.add_argument('--count', type=int, default=100000)
+
+    folder_parser = commands.add_parser('folder', help='measures loading a folder of many small files concurrently')
+    folder_parser.add_argument('--location', help='the folder for the synthetic files, benchmark_folder in the '
+                               'temporary folder by default')
+    folder_parser.add_argument('--count', type=int, default=2000)
+    folder_parser.add_argument('--workers', type=int)
+
+    imports_parser = commands.add_parser('imports', help='measures the import time of the modules, and fails if the '
+                                         'command line takes longer than the budget or imports the heavy dependencies')
+    imports_parser.add_argument('--budget', type=float, default=0.05, help='the seconds the command line may take')
+    imports_parser.add_argument('--repeat', type=int, default=5)
+    imports_parser.add_argument('--check', action='store_true', help='only measures the command line, e.g. as a gate '
+                                'of the continuous integration, which fails with the exit status 1')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.location, args.sections, args.depth, args.breadth, args.note_length, args.slides, args.repeat)
+        content = json.dumps(report, indent=2)
+
+        if args.output:
+            with open(args.output, 'w', encoding='UTF-8') as file:
+                file.write(content)
+        else:
+            print(content)
+
+    elif args.command == 'compare':
+        with open(args.old, 'r', encoding='UTF-8') as file:
+            old = json.load(file)
+        with open(args.new, 'r', encoding='UTF-8') as file:
+            new = json.load(file)
+
+        regressions = compare(old, new, args.threshold)
+
+        for stage, measurement, before, after in regressions:
+            print("  {} {}: {:.6g} -> {:.6g} (+{:.1%})".format(stage, measurement, before, after, after / before - 1))
+
+        print("  {} regressions.".format(len(regressions)))
+
+        return 1 if regressions else 0
+
+    elif args.command == 'folder':
+        for way, seconds in folder_times(args.location, args.count, args.workers).items():
+            print("  {}: {:.3f}s, {:.1f} files/s".format(way, seconds, args.count / seconds))
+
+    elif args.command == 'imports':
+
+        try:
+            times = import_times(IMPORT_MODULES[:1] if args.check else IMPORT_MODULES, args.repeat)
+
+        except subprocess.CalledProcessError as error: # A module fails to import, e.g. a dependency is missing.
+            print("  {}".format(error.stderr.strip().splitlines()[-1]))
+            return 1
+
+        for module, (seconds, heavy) in times.items():
+            print("  {}: {:.1f}ms{}".format(module, seconds * 1000, '  imports ' + ', '.join(heavy) if heavy else ''))
+
+        seconds, heavy = times[IMPORT_MODULES[0]]
+
+        if seconds > args.budget or heavy:
+            print("  {} is over the budget of {:.1f}ms.".format(IMPORT_MODULES[0], args.budget * 1000))
+            return 1
+
+        print("  {} is within the budget of {:.1f}ms.".format(IMPORT_MODULES[0], args.budget * 1000))
+
+    else:
+        for name, size in node_memory(args.count).items():
+            print("{}: {:.1f} bytes per node".format(name, size))
+
+    return 0
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import os
+import sys
+import argparse
+
+# Only the standard library is imported above. Each subcommand imports the instruments it needs when it runs, so that
+# "--help" and the light subcommands never pay for python-pptx, lxml and Pillow, see benchmark.import_times().
+
+COMMANDS = ['render', 'batch', 'detect', 'bench']
+
+
+def folder(location):
+    """Returns the location of a folder ending with a separator, as the instruments join the file names to it."""
+
+    return os.path.join(location, '')
+
+
+def render_command(args):
+    """Outputs the presentation of a single content file, see strategy.stream_presentation()."""
+
+    from . import templateregistry
+
+    if args.template not in templateregistry.names():
+        print("AutoPre: template {} is invalid, which should be one of {}.".format(
+            args.template, templateregistry.names()), file=sys.stderr)
+        return 2
+
+    from . import load
+    from . import strategy
+
+    title = args.title
+
+    if title is None:
+        title = os.path.splitext(os.path.basename(args.file))[0]
+
+    output = args.output
+
+    if output is None:
+        output = folder('outputs') + title + '.pptx'
+
+    root_node = load.read_file(args.file)
+
+    if root_node is None:
+        print("AutoPre: {} is empty or of an unsupported format.".format(args.file), file=sys.stderr)
+        return 1
+
+    prs_info = {
+        'title': title,
+        'date': args.date,
+        'part_num': 0,
+        'part_title': None,
+        'color': templateregistry.color(args.template),
+        'author': args.author
+        }
+
+    if args.images is not None:
+        from . import imagelibrary
+
+        prs_info['images'] = imagelibrary.open_library(folder(args.images))
+
+    if args.section_workers > 1:
+        from . import sectionpool
+
+        with sectionpool.SectionPool(args.template, args.engine, args.section_workers) as pool:
+            strategy.stream_presentation(root_node, prs_info, args.template, args.level_mode, args.img_mode, output,
+                                         args.engine, args.prune, pool)
+
+    else:
+        strategy.stream_presentation(root_node, prs_info, args.template, args.level_mode, args.img_mode, output,
+                                     args.engine, args.prune)
+
+    print("AutoPre: {} -> {}".format(args.file, output))
+
+    return 0
+
+
+def batch_command(args):
+    """Outputs the presentations of all the documents in the input folder, see batch.run_batch(), or keeps rebuilding
+    them, see watcher.watch()."""
+
+    from . import batch
+
+    manifest = batch.load_manifest(args.manifest)
+
+    if args.watch:
+        from . import watcher
+
+        watcher.watch(folder(args.input), folder(args.output), manifest, args.workers or manifest.get('workers', 2))
+        return 0
+
+    results = batch.run_batch(folder(args.input), folder(args.output), manifest, args.workers)
+
+    return 1 if any('error' in result for result in results) else 0
+
+
+def detect_command(args):
+    """Reports the layouts and placeholders of a template, see detecter.report_placeholders(), and outputs them into a
+    presentation if asked, see detecter.detect_placeholders()."""
+
+    from . import detecter
+
+    location = args.template
+
+    if not location.endswith('.pptx'):
+        location = folder(args.templates) + location + '.pptx'
+
+    lines = detecter.report_placeholders(location)
+    print('\n'.join(lines))
+
+    if args.output is not None:
+        detecter.detect_placeholders(location, args.output)
+
+    return 0 if lines[-1] == 'Valid.' else 1
+
+
+def program_name():
+    """Returns the name AutoPre is run by, e.g. 'automate.py' or 'python -m instruments', for the help."""
+
+    name = os.path.basename(sys.argv[0])
+
+    if name == '__main__.py':
+        return 'python -m ' + __package__
+
+    return name
+
+
+def make_parser():
+    """Returns the argument parser of the subcommands."""
+
+    parser = argparse.ArgumentParser(prog=program_name(), description='AutoPre, a PPT automatic filler based on '
+                                     'Dynalist notes and Word documents. Without any argument, it guides you through '
+                                     'interactively.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    render_parser = commands.add_parser('render', help='outputs the presentation of a content file')
+    render_parser.add_argument('file', help='the content file (.opml, .docx or .md)')
+    render_parser.add_argument('-o', '--output', help='the output file, outputs/[title].pptx by default')
+    render_parser.add_argument('--title', help='the title of the presentation, the file name by default')
+    render_parser.add_argument('--date', default='')
+    render_parser.add_argument('--author', default='')
+    render_parser.add_argument('--template', default='Marxist')
+    render_parser.add_argument('--level-mode', action=argparse.BooleanOptionalAction, default=True,
+                               help='uses the second level section slides')
+    render_parser.add_argument('--img-mode', action=argparse.BooleanOptionalAction, default=False,
+                               help='uses the text with image slides')
+    render_parser.add_argument('--engine', default='pptx', help='the render engine, pptx or xml')
+    render_parser.add_argument('--images', help='the folder of the images the notes reference')
+    render_parser.add_argument('--prune', action='store_true', help='drops the layouts no slide uses')
+    render_parser.add_argument('--section-workers', type=int, default=1,
+                               help='renders the first level sections on this many worker processes')
+    render_parser.set_defaults(handler=render_command)
+
+    batch_parser = commands.add_parser('batch', help='outputs the presentations of all the documents in a folder')
+    batch_parser.add_argument('manifest', help='the manifest file (.json)')
+    batch_parser.add_argument('--watch', action='store_true', help='keeps rebuilding the documents whenever saved')
+    batch_parser.add_argument('-i', '--input', default='documents/', help='the folder of the content files')
+    batch_parser.add_argument('-o', '--output', default='outputs/', help='the folder of the output files')
+    batch_parser.add_argument('--workers', type=int,
+                              help='the count of the worker processes, defaults to the "workers" of the manifest')
+    batch_parser.set_defaults(handler=batch_command)
+
+    detect_parser = commands.add_parser('detect', help='reports the layouts and placeholders of a template')
+    detect_parser.add_argument('template', help='the template file (.pptx), or the name of a template')
+    detect_parser.add_argument('--templates', default='templates/', help='the folder of the templates')
+    detect_parser.add_argument('-o', '--output', help='also outputs a presentation of the placeholders filled with '
+                               'their indices and positions')
+    detect_parser.set_defaults(handler=detect_command)
+
+    # Only listed here, the arguments are parsed by benchmark.main().
+
+    commands.add_parser('bench', help='runs the benchmark suite, e.g. "bench run -o new.json" or "bench imports"')
+
+    return parser
+
+
+def main(argv=None):
+    """Runs AutoPre from the command line, and returns the exit status.
+
+    Without any argument, it runs the interactive guide, see strategy.guide_through(). The former form of the batch
+    mode, i.e. "python automate.py manifest.json [--watch]", still works the same as the batch subcommand.
+    """
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if not argv:
+        from . import strategy
+
+        strategy.guide_through(folder('documents'), folder('outputs'))
+        return 0
+
+    if argv[0] not in COMMANDS and not argv[0].startswith('-'):
+        argv = ['batch'] + argv
+
+    # The benchmark suite parses its own arguments, including "--help".
+
+    if argv[0] == 'bench':
+        from . import benchmark
+
+        return benchmark.main(argv[1:], program_name() + ' bench')
+
+    args = make_parser().parse_args(argv)
+
+    if args.command is None:
+        make_parser().print_help()
+        return 0
+
+    try:
+        return args.handler(args)
+
+    except (OSError, ValueError) as error:
+        print("AutoPre: {}".format(error), file=sys.stderr)
+        return 1
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    sys.exit(main())
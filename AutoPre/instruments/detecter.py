@@ -1,6 +1,8 @@
 from pptx import Presentation
 
-def detect_placeholders(location):
+from . import templateregistry
+
+def detect_placeholders(location, output='DetectPlaceholders.pptx'):
     """Detects the index of all the pages and placeholders in a ppt template.
     
     Loads a ppt template and add all the pages to it. Then fill each placeholder with its index and positions.
@@ -17,13 +19,45 @@ def detect_placeholders(location):
         pos = (shape.left, shape.top, shape.width, shape.height)
         shape.text = str(idx) + '#' + str(pos)
     
-    prs.save('DetectPlaceholders.pptx')
+    prs.save(output)
+
+
+def report_placeholders(location):
+    """Reports the layouts and placeholders of a ppt template introspected by the registry, see
+    templateregistry.inspect_template(), without adding any slide to it.
+
+    Returns:
+        A list of the lines of the report, the last of which tells whether the template has every role the slide
+        makers need.
+    """
+
+    info = templateregistry.inspect_template(location)
+    lines = []
+
+    if info['color'] is not None:
+        lines.append('Accent color: {}, theme accents: {}'.format(info['color'], ' '.join(map(str, info['accents']))))
+
+    for layout_idx, layout in enumerate(info['layouts']):
+        lines.append('Layout {}: {}'.format(layout_idx, layout['name']))
+
+        for placeholder in layout['placeholders']:
+            pos = (placeholder['left'], placeholder['top'], placeholder['width'], placeholder['height'])
+            lines.append('  ' + str(placeholder['idx']) + '#' + str(pos) + ' ' + placeholder['type'] + ' ' +
+                         placeholder['name'])
+
+    if info['problems']:
+        lines.append('Invalid, it misses {}.'.format(', '.join(info['problems'])))
+    else:
+        lines.append('Valid.')
+
+    return lines
 
 
 # Functions testing.
 
 if __name__ == '__main__':
     
+    print('\n'.join(report_placeholders('../templates/Marxist.pptx')))
     detect_placeholders('../templates/Marxist.pptx')
     
     
\ No newline at end of file
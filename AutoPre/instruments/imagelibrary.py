@@ -0,0 +1,491 @@
+import io
+import os
+import re
+import json
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml.shapes.picture import CT_Picture
+from pptx.parts.image import Image as PackageImage
+from pptx.parts.image import ImagePart
+from pptx.shapes.placeholder import PicturePlaceholder
+
+from . import profiler
+
+# The image files the library indexes, and the optional file in the library's folder that tags them.
+
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff')
+TAGS_FILE = 'tags.json'
+
+# A line of a note like "![name]" or "![#tag]" references an image of the library.
+
+REFERENCE = re.compile('!\\[(#?)([^\\[\\]]+)\\]')
+
+# The words of a file name, each one is a tag of the image, e.g. '飘扬的党旗-高清放大版' is tagged by both parts.
+
+SEPARATORS = re.compile('[-_\\s.]+')
+
+# Increases it whenever the way of preparing the pictures changes, so that the older cached pictures are dropped.
+
+IMAGE_VERSION = 1
+
+
+class ImageLibrary(object):
+    """Class of the library of the images that the notes reference by name or by tag.
+
+    The folder is indexed once, and again whenever it changes, see refresh(): each image is named by its file name
+    without extension, as well as its path relative to the folder, and tagged by the words of its file name, the
+    folders it's in and its entry in the optional tags.json, which maps the relative path to a list of tags.
+
+    Before an image is embedded, it's cropped to the aspect of the placeholder, downscaled to the placeholder's size
+    at the given resolution and recompressed, a photo as JPEG and an image with transparency as PNG. The prepared
+    pictures are kept in a cache keyed by the hash of the image's content and the size, so an image is prepared once
+    however many slides and presentations use it, and is embedded only once into each presentation, see insert().
+
+    Attributes:
+        location: A string that indicates folder that contains the images.
+        cache_location: A string that indicates folder that contains the prepared pictures, or None to keep them
+            in memory only.
+        dpi: An integer count of the pixels per inch the pictures are downscaled to.
+        quality: An integer JPEG quality of the recompressed photos.
+        names: A dictory maps the casefolded name of an image to its location.
+        tags: A dictory maps the casefolded tag to the sorted list of locations of its images.
+        digest: The hash string of the indexed files, which changes whenever an image or tags.json is added, removed or
+            modified.
+        hits: An integer count of the pictures read from the cache.
+        misses: An integer count of the pictures prepared from the images.
+    """
+
+    def __init__(self, location, cache_location='.autopre_cache/images/', dpi=150, quality=85):
+
+        self.location = location
+        self.cache_location = cache_location
+        self.dpi = dpi
+        self.quality = quality
+
+        self.names = {}
+        self.tags = {}
+        self.digest = None
+
+        self.hits = 0
+        self.misses = 0
+
+        self._sources = {}
+        self._pictures = OrderedDict()
+        self._lock = threading.Lock()
+
+        if cache_location is not None:
+            os.makedirs(cache_location, exist_ok=True)
+
+        self.index()
+
+    def scan(self):
+        """Lists the images of the library's folder.
+
+        Returns:
+            A tuple of (a sorted list of tuples of (path, path relative to the folder) of the images, the hash string
+            of their paths, sizes and modified times together with those of tags.json).
+        """
+
+        images = []
+        digest = hashlib.sha1()
+
+        for folder, folders, files in os.walk(self.location):
+            folders.sort()
+
+            for file in sorted(files):
+
+                path = os.path.join(folder, file)
+                relative = os.path.relpath(path, self.location).replace(os.sep, '/')
+
+                is_image = os.path.splitext(file)[1].lower() in EXTENSIONS
+
+                if not is_image and relative != TAGS_FILE:
+                    continue
+
+                try:
+                    stat = os.stat(path)
+                except OSError: # Removed since it's listed.
+                    continue
+
+                if is_image:
+                    images.append((path, relative))
+
+                digest.update('{}:{}:{}\n'.format(relative, stat.st_size, stat.st_mtime_ns).encode('UTF-8'))
+
+        return images, digest.hexdigest()
+
+    def index(self, scanned=None):
+        """Indexes the images of the library's folder.
+
+        Args:
+            scanned: The result of scan() to index, which is scanned again if it isn't given.
+        """
+
+        with profiler.stage('images'):
+
+            images, digest = scanned if scanned is not None else self.scan()
+
+            try:
+                with open(os.path.join(self.location, TAGS_FILE), 'r', encoding='UTF-8') as file:
+                    extra_tags = json.load(file)
+
+            except (OSError, ValueError):
+                extra_tags = {}
+
+            names = {}
+            tags = {}
+
+            for path, relative in images:
+
+                stem = os.path.splitext(os.path.basename(path))[0]
+
+                names.setdefault(stem.casefold(), path)
+                names.setdefault(os.path.splitext(relative)[0].casefold(), path)
+
+                image_tags = set(SEPARATORS.split(stem)) | set(relative.split('/')[:-1])
+                image_tags.update(extra_tags.get(relative, []))
+
+                for tag in image_tags:
+                    if tag:
+                        tags.setdefault(tag.casefold(), []).append(path)
+
+            # An image named after the tag comes first, e.g. '#飘扬的党旗' takes 飘扬的党旗.png before its enlarged version.
+
+            for tag, paths in tags.items():
+                paths.sort(key=lambda path: os.path.splitext(os.path.basename(path))[0].casefold() != tag)
+
+            # Replaces the index at once, so that a thread resolving a reference never sees it half built.
+
+            self.names, self.tags, self.digest = names, tags, digest
+
+    def refresh(self):
+        """Indexes the folder again if an image or tags.json has been added, removed or modified since it's indexed.
+
+        Returns:
+            A boolean indicates if the folder is indexed again.
+        """
+
+        scanned = self.scan()
+
+        if scanned[1] == self.digest:
+            return False
+
+        self.index(scanned)
+
+        return True
+
+    def resolve(self, reference):
+        """Returns the location of the image a reference stands for, or None if there is no such image.
+
+        Args:
+            reference: A string of the image's name, or its tag after '#', of which the first image is taken.
+        """
+
+        reference = reference.strip().casefold()
+
+        if reference.startswith('#'):
+            paths = self.tags.get(reference[1:].strip())
+            return paths[0] if paths else None
+
+        return self.names.get(reference)
+
+    def split(self, note):
+        """Takes the image references out of a note.
+
+        Only a reference that takes a whole line and resolves to an image is taken out, the others are left in the
+        note as they are, so that a misspelt reference shows up on the slide.
+
+        Returns:
+            A tuple of (the location of the first image referenced, or None, the note without the references).
+        """
+
+        image = None
+        lines = []
+
+        for line in note.split('\n'):
+
+            match = REFERENCE.fullmatch(line.strip())
+            path = self.resolve(match.group(1) + match.group(2)) if match else None
+
+            if path is None:
+                lines.append(line)
+                continue
+
+            if image is None:
+                image = path
+
+        if image is None:
+            return None, note
+
+        return image, '\n'.join(lines)
+
+    def source_key(self, path):
+        """Returns the hash string of an image's content, which is only read again once the file changes."""
+
+        stat = os.stat(path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+
+        known = self._sources.get(path)
+
+        if known is not None and known[0] == stamp:
+            return known[1]
+
+        with open(path, 'rb') as file:
+            key = hashlib.sha256(file.read()).hexdigest()
+
+        self._sources[path] = (stamp, key)
+
+        return key
+
+    def picture(self, path, width, height):
+        """Returns the picture of an image prepared for a box.
+
+        Args:
+            path: A string that contains the location of the image.
+            width, height: The size of the box in EMU.
+
+        Returns:
+            A tuple of (the bytes of the picture, its file extension).
+        """
+
+        size = (max(1, round(width / 914400 * self.dpi)), max(1, round(height / 914400 * self.dpi)))
+
+        content = '{}:{}:{}x{}:{}'.format(IMAGE_VERSION, self.source_key(path), size[0], size[1], self.quality)
+        key = hashlib.sha256(content.encode('UTF-8')).hexdigest()
+
+        with self._lock:
+            picture = self._pictures.get(key)
+
+            if picture is not None:
+                self._pictures.move_to_end(key)
+                self.hits += 1
+                return picture
+
+        picture = self.read(key)
+
+        if picture is None:
+
+            with profiler.stage('images'):
+                picture = prepare(path, size, self.quality)
+
+            self.write(key, picture)
+
+            with self._lock:
+                self.misses += 1
+
+        else:
+            with self._lock:
+                self.hits += 1
+
+        with self._lock:
+            self._pictures[key] = picture
+
+            # Keeps the recent pictures of the process only, since the cache folder keeps all of them.
+
+            while len(self._pictures) > 64:
+                self._pictures.popitem(last=False)
+
+        return picture
+
+    def read(self, key):
+        """Reads a prepared picture from the cache folder, or returns None if it isn't there."""
+
+        if self.cache_location is None:
+            return None
+
+        for extension in FORMATS.values():
+
+            try:
+                with open(os.path.join(self.cache_location, key + extension), 'rb') as file:
+                    return file.read(), extension
+
+            except OSError:
+                continue
+
+        return None
+
+    def write(self, key, picture):
+        """Writes a prepared picture into the cache folder."""
+
+        if self.cache_location is None:
+            return
+
+        blob, extension = picture
+        path = os.path.join(self.cache_location, key + extension)
+
+        # Writes a temporary file first, so that other processes never read a partial picture.
+
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(temporary, 'wb') as file:
+            file.write(blob)
+
+        os.replace(temporary, path)
+
+    def insert(self, slide, shapes, info, path):
+        """Fills a picture placeholder on a slide newly added with the layout with an image.
+
+        Args:
+            slide: The slide object.
+            shapes: The list of the shape elements of the slide.
+            info: The PlaceholderInfo object of the picture placeholder, see layoutschema.
+            path: A string that contains the location of the image.
+        """
+
+        blob, extension = self.picture(path, info.width, info.height)
+        name = os.path.splitext(os.path.basename(path))[0] + extension
+
+        image_part = embed(slide.part.package, blob, name)
+        rId = slide.part.relate_to(image_part, RT.IMAGE)
+
+        # The same as PicturePlaceholder.insert_picture(), but with the image part found above.
+
+        placeholder = PicturePlaceholder(shapes[info.ordinal], slide.shapes)
+
+        pic = CT_Picture.new_ph_pic(placeholder.shape_id, placeholder.name, image_part.desc, rId)
+        pic.crop_to_fit(image_part._px_size, (info.width, info.height))
+
+        placeholder._replace_placeholder_with(pic)
+
+
+# The extensions of the image formats a prepared picture is kept in, see prepare() and ImageLibrary.read().
+
+FORMATS = {'JPEG': '.jpg', 'PNG': '.png'}
+
+
+def prepare(path, size, quality):
+    """Crops an image to the aspect of the size, downscales it to fit the size and recompresses it.
+
+    The image is cropped around its center, the way a picture placeholder crops it anyway. A photo is saved as JPEG and
+    an image with transparency as PNG. If the image needs neither cropping nor downscaling, and the recompressed picture
+    isn't smaller, a JPEG or PNG image is taken as it is, with the extension of its format, so that the cache folder
+    only ever holds .jpg and .png pictures. An image of any other format, e.g. GIF or BMP, is always recompressed.
+
+    Args:
+        path: A string that contains the location of the image.
+        size: A tuple of the width and height in pixels.
+        quality: An integer JPEG quality.
+
+    Returns:
+        A tuple of (the bytes of the picture, its file extension).
+    """
+
+    with open(path, 'rb') as file:
+        original = file.read()
+
+    with Image.open(io.BytesIO(original)) as image:
+
+        original_extension = FORMATS.get(image.format)
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+
+        # Crops the image to the aspect of the box.
+
+        if width * size[1] > height * size[0]:
+            cropped = round(height * size[0] / size[1])
+            box = ((width - cropped) // 2, 0, (width - cropped) // 2 + cropped, height)
+        else:
+            cropped = round(width * size[1] / size[0])
+            box = (0, (height - cropped) // 2, width, (height - cropped) // 2 + cropped)
+
+        changed = box != (0, 0, width, height)
+
+        if changed:
+            image = image.crop(box)
+
+        if image.size[0] > size[0]:
+            image = image.resize(size, Image.LANCZOS)
+            changed = True
+
+        transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+        output = io.BytesIO()
+
+        if transparent:
+            image.save(output, 'PNG', optimize=True)
+            extension = '.png'
+
+        else:
+            image.convert('RGB').save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+            extension = '.jpg'
+
+    if not changed and original_extension is not None and len(original) <= output.tell():
+        return original, original_extension
+
+    return output.getvalue(), extension
+
+
+# The image parts of the presentations keyed by their packages, which are dropped with the presentations.
+
+EMBEDDED = weakref.WeakKeyDictionary()
+
+
+def embed(package, blob, name):
+    """Returns the image part of a picture in the package, which is only added on its first use.
+
+    python-pptx looks for an identical image among all the parts of the package on every picture, so the image parts
+    are looked up by the hash of their content instead. The image parts already in the package, e.g. of a previous
+    output reopened by incremental.rebuild(), are gathered on the first call.
+    """
+
+    parts = EMBEDDED.get(package)
+
+    if parts is None:
+        parts = {part.sha1: part for part in package.iter_parts() if isinstance(part, ImagePart)}
+        EMBEDDED[package] = parts
+
+    image = PackageImage.from_blob(blob, name)
+    image_part = parts.get(image.sha1)
+
+    if image_part is None:
+        image_part = ImagePart.new(package, image)
+        parts[image.sha1] = image_part
+        profiler.count('images_embedded')
+
+    return image_part
+
+
+# The image libraries of the process, keyed by their folders.
+
+LIBRARIES = {}
+
+
+def open_library(location, cache_location='.autopre_cache/images/'):
+    """Returns the image library of the folder, which is indexed on the first call of the process, and indexed again
+    on a later call once its images change, see ImageLibrary.refresh(). So that a long-running process, e.g. a worker
+    of the watch mode or the service, sees the images added or modified since it started."""
+
+    library = LIBRARIES.get(location)
+
+    if library is None:
+        library = ImageLibrary(location, cache_location)
+        LIBRARIES[location] = library
+
+    else:
+        library.refresh()
+
+    return library
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import time
+
+    library = ImageLibrary('../templates/logos/', None)
+    print("{} names, {} tags.".format(len(library.names), len(library.tags)))
+
+    for reference in ['飘扬的党旗', '#高清放大版', '#马恩列斯毛', '#unknown']:
+        print("  {} -> {}".format(reference, library.resolve(reference)))
+
+    for path in sorted(set(library.names.values())):
+        start = time.perf_counter()
+        blob, extension = library.picture(path, 3552825, 4810125)
+        print("  {}  {} -> {} bytes{}  {:.3f}s".format(os.path.basename(path), os.path.getsize(path), len(blob), extension,
+                                                      time.perf_counter() - start))
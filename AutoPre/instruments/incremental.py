@@ -0,0 +1,221 @@
+import os
+import json
+import hashlib
+
+from pptx import Presentation
+
+from . import notemarkup
+from . import packaging
+from . import slidemaker
+from . import strategy
+from . import templatecache
+
+# Increases it whenever the slides made for the same node may change, so that the older manifests are dropped.
+
+MANIFEST_VERSION = 4
+
+
+def manifest_location(output):
+    """Returns the location of the manifest file of an output presentation file."""
+
+    return os.path.splitext(output)[0] + '.manifest.json'
+
+
+def digest(*items):
+    """Returns the hash string of a few json serializable items."""
+
+    content = json.dumps(items, ensure_ascii=False)
+    return hashlib.sha1(content.encode('UTF-8')).hexdigest()
+
+
+def node_keys(root_node, prs_info):
+    """Computes the key of every node of the tree in pre-order.
+
+    The key of a node covers everything its slides are made from: its own content and layer, the part it belongs to,
+    and, for the cover slide, the titles of its children in the abstract. So that two nodes of the same key always make
+    the same slides, and a node whose part number changes, e.g. after a section is inserted before it, is made again.
+
+    Returns:
+        A list of tuples of (key, node, part_num, part_title).
+    """
+
+    entries = []
+
+    for node, part_num, part_title in root_node.walk(prs_info['part_num'], prs_info['part_title']):
+
+        if node.layer == 0:
+            abstract = [child.title for child in node.child]
+        else:
+            abstract = None
+
+        key = digest(node.layer, node.title, node.note, part_num, part_title, abstract)
+        entries.append((key, node, part_num, part_title))
+
+    return entries
+
+
+def context_key(prs_info, template, level_mode, img_mode):
+    """Returns the hash string of the settings shared by all the slides of the presentation.
+
+    It covers the images of the image library as well, so a changed image makes the whole presentation again, and the
+    way the code and the formulas are rendered, see notemarkup.style_key().
+    """
+
+    if prs_info.get('images') is not None:
+        images = prs_info['images'].digest
+    else:
+        images = None
+
+    return digest(MANIFEST_VERSION, prs_info['title'], prs_info['date'], prs_info['author'], prs_info['color'],
+                  template, level_mode, img_mode, images, notemarkup.style_key())
+
+
+def read_manifest(location):
+    """Reads the manifest file, or returns None if it doesn't exist or can't be read."""
+
+    try:
+        with open(location, 'r', encoding='UTF-8') as file:
+            return json.load(file)
+
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(location, context, entries, slide_ids, back_cover_id):
+    """Writes the manifest file which maps the key of each node to the ids of the slides made for it.
+
+    Args:
+        location: A string that contains the location of the manifest file.
+        context: The hash string of the shared settings, see context_key().
+        entries: The list of the nodes' keys, see node_keys().
+        slide_ids: A list that contains the list of slide ids made for each entry.
+        back_cover_id: The slide id of the back cover slide.
+    """
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'context': context,
+        'tree': digest([entry[0] for entry in entries]),
+        'nodes': [{'key': entry[0], 'slides': ids} for entry, ids in zip(entries, slide_ids)],
+        'back_cover': back_cover_id
+        }
+
+    with open(location, 'w', encoding='UTF-8') as file:
+        json.dump(manifest, file)
+
+
+def render_entry(entry, prs_info, prs, level_mode, img_mode, renderer=None):
+    """Makes the slides of a single node and returns their slide ids."""
+
+    key, node, part_num, part_title = entry
+
+    prs_info['part_num'] = part_num
+    prs_info['part_title'] = part_title
+
+    sldIdLst = prs.part._element.get_or_add_sldIdLst()
+    count = len(sldIdLst)
+
+    strategy.make_slides(node, prs_info, prs, level_mode, img_mode, renderer)
+    return [sldId.id for sldId in sldIdLst[count:]]
+
+
+def rebuild(root_node, prs_info, template, level_mode, img_mode, output, engine='pptx'):
+    """Outputs the presentation, making only the slides of the nodes changed since the last output.
+
+    A manifest file is kept next to the output file. It maps the key of each node, see node_keys(), to the slides made
+    for it. On the next call, the previous output is opened, the slides of the unchanged nodes are kept as they are,
+    the slides of the changed and added nodes are made again, the slides of the removed nodes are dropped, and all
+    the slides are put back into the order of the tree. Without a valid manifest, or once the shared settings change,
+    the whole presentation is made again.
+
+    Args:
+        root_node: The root OutlineNode object of the nodes' tree.
+        prs_info: A dictory that contains the basic information of the presentation for content filling.
+        template: A string contains the name of the template.
+        level_mode: A boolean indicates if we use second level sections or not.
+        img_mode: A boolean indicates if we use image in text pages or not.
+        output: A string that contains the location of the output presentation file.
+        engine: A string contains the render engine, see strategy.ENGINES.
+
+    Returns:
+        A tuple of (the presentation object, the count of nodes whose slides are made).
+    """
+
+    location = manifest_location(output)
+    context = context_key(prs_info, template, level_mode, img_mode)
+    entries = node_keys(root_node, prs_info)
+
+    manifest = read_manifest(location)
+
+    if manifest is None or manifest.get('context') != context or not os.path.exists(output):
+        manifest = None
+
+    # Nothing changed at all.
+
+    if manifest is not None and manifest['tree'] == digest([entry[0] for entry in entries]):
+        return Presentation(output), 0
+
+    # Opens the previous output, or a fresh template if the whole presentation will be made again.
+
+    if manifest is None:
+        prs = templatecache.open_template(template)
+        previous = {}
+        back_cover_id = None
+
+    else:
+        prs = Presentation(output)
+        previous = {}
+        for item in manifest['nodes']:
+            previous.setdefault(item['key'], []).append(item['slides'])
+        back_cover_id = manifest['back_cover']
+
+    sldIdLst = prs.slides._sldIdLst
+    existing = {sldId.id: sldId for sldId in sldIdLst}
+
+    renderer = strategy.make_renderer(prs, template, engine)
+
+    # Reuses the slides of the unchanged nodes and makes the others, which are appended at the end for now.
+
+    slide_ids = []
+    rendered = 0
+
+    for entry in entries:
+
+        candidates = previous.get(entry[0])
+
+        if candidates and all(slide_id in existing for slide_id in candidates[0]):
+            slide_ids.append(candidates.pop(0))
+
+        else:
+            slide_ids.append(render_entry(entry, prs_info, prs, level_mode, img_mode, renderer))
+            rendered += 1
+
+    if back_cover_id not in existing:
+
+        if renderer is None:
+            strategy.make(slidemaker.BackCoverSlideMaker, prs)
+        else:
+            renderer.make(slidemaker.BackCoverSlideMaker, prs)
+
+        back_cover_id = sldIdLst[-1].id
+
+    # Puts the slides into the order of the tree, and drops the slides that are no longer used.
+
+    existing = {sldId.id: sldId for sldId in sldIdLst}
+    order = [slide_id for ids in slide_ids for slide_id in ids] + [back_cover_id]
+
+    for sldId in list(sldIdLst):
+        sldIdLst.remove(sldId)
+
+    for slide_id in order:
+        sldIdLst.append(existing.pop(slide_id))
+
+    for sldId in existing.values():
+        prs.part.drop_rel(sldId.rId)
+
+    # The layouts are kept, since the output is opened and filled again on the next call.
+
+    packaging.save(prs, output)
+    write_manifest(location, context, entries, slide_ids, back_cover_id)
+
+    return prs, rendered
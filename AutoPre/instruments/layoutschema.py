@@ -0,0 +1,125 @@
+import weakref
+
+from pptx.text.text import TextFrame
+
+# The placeholder roles the slide makers fill, keyed by the layout index, and the placeholder index of each role.
+# The indices come from detecter.report_placeholders(), and are validated for each template by templateregistry.
+
+ROLES = {
+    0: {'title': 10, 'date': 19, 'abstract': 22},                     # The cover slide.
+    1: {'header': 11, 'section': 13},                                 # The first level section slide.
+    2: {'header': 13, 'section': 11},                                 # The second level section slide.
+    3: {'header': 11, 'main_body': 13},                               # The pure text slide.
+    4: {'header': 11, 'legend': 12, 'main_body': 13, 'picture': 15},  # The text with image slide.
+    5: {}                                                             # The back cover slide.
+    }
+
+
+class PlaceholderInfo(object):
+    """Class of a placeholder's information in a layout.
+
+    Attributes:
+        idx: An integer index of the placeholder.
+        ordinal: An integer position of the placeholder among the shapes of a slide newly added with the layout.
+        left, top, width, height: The position and size of the placeholder in EMU.
+    """
+
+    __slots__ = ('idx', 'ordinal', 'left', 'top', 'width', 'height')
+
+    def __init__(self, idx, ordinal, left, top, width, height):
+
+        self.idx = idx
+        self.ordinal = ordinal
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+
+class LayoutSchema(object):
+    """Class of the placeholder map of a template.
+
+    The layouts are introspected once: for each layout the slide makers use, each role in ROLES is mapped to its
+    placeholder's information. So that a slide maker reaches a placeholder directly by its position, instead of
+    looking it up among the slide's shapes by index on every call. A template missing a placeholder fails when its
+    schema is built, instead of halfway through a presentation.
+
+    Attributes:
+        layouts: A dictory maps the layout index to a dictory that maps the role to its PlaceholderInfo object.
+    """
+
+    def __init__(self, prs, name='template'):
+
+        self.layouts = {}
+
+        missing = []
+
+        for layout_idx, roles in ROLES.items():
+
+            if layout_idx >= len(prs.slide_layouts):
+                missing.append('layout {}'.format(layout_idx))
+                continue
+
+            layout = prs.slide_layouts[layout_idx]
+
+            # A slide added with the layout gets the cloneable placeholders of the layout in the same order.
+
+            placeholders = {}
+
+            for ordinal, placeholder in enumerate(layout.iter_cloneable_placeholders()):
+                idx = placeholder.placeholder_format.idx
+                placeholders[idx] = PlaceholderInfo(idx, ordinal, placeholder.left, placeholder.top,
+                                                    placeholder.width, placeholder.height)
+
+            self.layouts[layout_idx] = {}
+
+            for role, idx in roles.items():
+
+                if idx not in placeholders:
+                    missing.append('placeholder {} ({}) in layout {}'.format(idx, role, layout_idx))
+                    continue
+
+                self.layouts[layout_idx][role] = placeholders[idx]
+
+        if missing:
+            raise ValueError("{} misses {}.".format(name, ', '.join(missing)))
+
+    def placeholder(self, layout_idx, role):
+        """Returns the PlaceholderInfo object of the role in the layout."""
+
+        return self.layouts[layout_idx][role]
+
+
+# The schemas of the presentations keyed by their presentation parts, which are dropped with the presentations.
+
+SCHEMAS = weakref.WeakKeyDictionary()
+
+
+def register(prs, schema):
+    """Registers the schema of a presentation, e.g. a copy of a template whose schema has been built."""
+
+    SCHEMAS[prs.part] = schema
+
+
+def schema_of(prs):
+    """Returns the schema of a presentation, which is built on the first call if it isn't registered."""
+
+    schema = SCHEMAS.get(prs.part)
+
+    if schema is None:
+        schema = LayoutSchema(prs)
+        SCHEMAS[prs.part] = schema
+
+    return schema
+
+
+def first_paragraph(slide, shapes, info):
+    """Returns the first paragraph of a placeholder on a slide newly added with the layout.
+
+    Args:
+        slide: The slide object.
+        shapes: The list of the shape elements of the slide.
+        info: The PlaceholderInfo object of the placeholder.
+    """
+
+    return TextFrame(shapes[info.ordinal].get_or_add_txBody(), slide.shapes).paragraphs[0]
@@ -1,6 +1,32 @@
-import re
+import io
 import os
-import docx
+import re
+import glob
+import array
+import zipfile
+import functools
+import contextlib
+from xml.parsers import expat
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from . import profiler
+
+# Increases it whenever the trees built by the readers may change, so that the cached trees are dropped.
+
+PARSER_VERSION = 2
+
+# The parse cache used by the readers, see parsecache.ParseCache. The files are always parsed if it's None.
+
+PARSE_CACHE = None
+
+# The reader plugins, see register_reader(). Maps the format to a dictory of its reader, extensions and sniffer.
+
+READERS = {}
+
+# The count of the first bytes of a file looked at by the sniffers.
+
+SNIFF_BYTES = 1024
 
 class OutlineNode(object):
     """Class of outline document's node. 
@@ -11,29 +37,54 @@ class OutlineNode(object):
         title: A string contains the title of the node.
         note: A String contains the note content of the node.
         layer: An integer count of the layer of the node.
-        child: A list of OutlineNode objects that are children of this node.
+        child: A list of OutlineNode objects that are children of this node. It's an empty tuple for a leaf node.
         father: A OutlineNode object that is the father of this node.
+    
+    Noted that large outlines produce hundreds of thousands of nodes. Therefore the attributes are kept in slots
+    instead of a per-instance dictory, and the leaf nodes share an empty tuple instead of owning an empty list.
     """
     
-    def __init__(self, title, note, layer):
+    __slots__ = ('title', 'note', 'layer', 'child', 'father')
+    
+    def __init__(self, title, note, layer, entities=True):
         
-        self.title = self.content_tidy(title)
-        self.note = self.content_tidy(note)
+        self.title = self.content_tidy(title, entities)
+        self.note = self.content_tidy(note, entities)
         self.layer = int(layer)
         
-        self.child = []
+        self.child = ()
         self.father = None
 
-    def content_tidy(self, content):
-        """Execute content replacement to tidy it up."""
+    @classmethod
+    def restore(cls, title, note, layer):
+        """Creates a node from the content that has been tidied up, e.g. the content of a cached tree."""
+        
+        node = cls.__new__(cls)
+        
+        node.title = title
+        node.note = note
+        node.layer = layer
+        
+        node.child = ()
+        node.father = None
+        
+        return node
+
+    def content_tidy(self, content, entities=True):
+        """Execute content replacement to tidy it up.
+        
+        The xml entities are decoded as well, unless entities is False, i.e. the content has been decoded by a xml parser.
+        """
+        
+        if entities:
+            content = content.replace('&#10;', '\n')
+            content = content.replace('&quot;', '"')
+            content = content.replace('&lt;', '<')
+            content = content.replace('&gt;', '>')
+            content = content.replace('&apos;', "'")
+            content = content.replace('&amp;', "&")
         
-        content = content.replace('&#10;', '\n')
-        content = content.replace('&quot;', '"')
         content = content.replace('$$^i$$', '')
-        content = content.replace('&lt;', '<')
-        content = content.replace('&gt;', '>')
-        content = content.replace('&apos;', "'")
-        content = content.replace('&amp;', "&")
         content = content.replace('?', '')
         
         return content
@@ -44,7 +95,10 @@ class OutlineNode(object):
 
     def add_child(self, childSet):
         
-        self.child.append(childSet)
+        if self.child:
+            self.child.append(childSet)
+        else:
+            self.child = [childSet]
 
     def have_code(self):
         
@@ -65,257 +119,829 @@ class OutlineNode(object):
         note = ' '*self.layer*2 + self.note
         return title + note
     
+    def walk(self, part_num=0, part_title=None):
+        """Traverses the nodes' tree from this node in pre-order.
+        
+        An explicit stack is used instead of recursion, so that the depth of the tree isn't limited.
+        
+        Args:
+            part_num: An integer count of the parts before this node.
+            part_title: A string contains the title of the part before this node.
+        
+        Yields:
+            Tuples of (node, part_num, part_title), in which part_num and part_title indicate the part the node belongs to.
+            A layer 1 node starts a new part.
+        """
+        
+        stack = [self]
+        
+        while stack:
+            node = stack.pop()
+            
+            if node.layer == 1:
+                part_num += 1
+                part_title = node.title
+            
+            yield node, part_num, part_title
+            
+            stack.extend(reversed(node.child))
+    
     def traversal_print(self):
         """Traversally prints the whole nodes' tree."""
+        
+        for node, part_num, part_title in self.walk():
+            print(node)
+
 
-        print(self)
+class OutlineTree(object):
+    """Class of a nodes' tree in a columnar store.
+    
+    Instead of an object per node, the tree is kept as parallel columns indexed by the nodes' positions in pre-order:
+    the titles and the notes as lists of the shared strings, the layers as an array of shorts, and the links as arrays
+    of integers: the father, the first child and the next sibling of each node, or -1 if there is none. So a node takes
+    about 30 bytes besides its strings, several times less than an OutlineNode with its child list. The nodes are read
+    through TreeNode views, which the strategy and the slide makers use the same as OutlineNode objects.
+    
+    Attributes:
+        titles: A list of the titles of the nodes.
+        notes: A list of the notes of the nodes.
+        layers: An array of the layers of the nodes.
+        fathers: An array of the index of each node's father.
+        first_children: An array of the index of each node's first child.
+        next_siblings: An array of the index of each node's next sibling.
+    """
+    
+    __slots__ = ('titles', 'notes', 'layers', 'fathers', 'first_children', 'next_siblings')
+    
+    def __init__(self, titles, notes, layers, fathers):
+        """Builds the store from the lists made by parsecache.flatten(), of which the titles and notes are kept."""
+        
+        count = len(titles)
         
-        for child in self.child:
-            child.traversal_print()
+        self.titles = titles
+        self.notes = notes
+        self.layers = array.array('h', layers)
+        self.fathers = array.array('i', fathers)
+        self.first_children = array.array('i', [-1]) * count
+        self.next_siblings = array.array('i', [-1]) * count
+        
+        # Links the children backwards, so that each one is put before its younger siblings.
+        
+        for n in range(count - 1, -1, -1):
+            father = fathers[n]
+            
+            if father >= 0:
+                self.next_siblings[n] = self.first_children[father]
+                self.first_children[father] = n
+    
+    def __len__(self):
+        
+        return len(self.titles)
+    
+    def node(self, index=0):
+        """Returns the view of a node, the root node by default."""
+        
+        return TreeNode(self, index)
+
+
+class TreeNode(object):
+    """Class of the lightweight view of a node in an OutlineTree, which reads the same as an OutlineNode.
+    
+    A view only holds the store and the node's index, and is made whenever a node is reached, so two views of the same
+    node are equal rather than identical. The views are read-only.
+    
+    Attributes:
+        tree: The OutlineTree object the node is in.
+        index: An integer index of the node in the store.
+    """
+    
+    __slots__ = ('tree', 'index')
+    
+    def __init__(self, tree, index):
+        
+        self.tree = tree
+        self.index = index
+    
+    @property
+    def title(self):
+        
+        return self.tree.titles[self.index]
+    
+    @property
+    def note(self):
+        
+        return self.tree.notes[self.index]
+    
+    @property
+    def layer(self):
+        
+        return self.tree.layers[self.index]
+    
+    @property
+    def child(self):
+        """A tuple of the views of the node's children."""
+        
+        tree = self.tree
+        children = []
+        
+        n = tree.first_children[self.index]
+        while n >= 0:
+            children.append(TreeNode(tree, n))
+            n = tree.next_siblings[n]
+        
+        return tuple(children)
+    
+    @property
+    def father(self):
+        
+        father = self.tree.fathers[self.index]
+        
+        return TreeNode(self.tree, father) if father >= 0 else None
+    
+    def __eq__(self, other):
+        
+        return isinstance(other, TreeNode) and self.tree is other.tree and self.index == other.index
+    
+    def __hash__(self):
+        
+        return hash((id(self.tree), self.index))
+    
+    have_code = OutlineNode.have_code
+    have_formula = OutlineNode.have_formula
+    __str__ = OutlineNode.__str__
+    walk = OutlineNode.walk
+    traversal_print = OutlineNode.traversal_print
             
             
+def open_source(source):
+    """Opens a content source as a binary file object.
+    
+    Args:
+        source: A string that contains the location of the file, the bytes of the file, or a binary file object.
+        
+    Returns:
+        A context manager of the binary file object. The bytes are wrapped without being copied, and a file object
+        is used as it is, from its current position, and is left open.
+    """
+    
+    if isinstance(source, str):
+        return open(source, 'rb')
+    
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    
+    return contextlib.nullcontext(source)
+
+
+def cached(reader):
+    """Decorates a reader, so that it looks up PARSE_CACHE before parsing the file."""
+    
+    @functools.wraps(reader)
+    def read(location):
+        
+        if PARSE_CACHE is None:
+            return reader(location)
+        
+        return PARSE_CACHE.read(location, reader)
+    
+    return read
+
+
+def register_reader(format, extensions, sniff=None):
+    """Registers a reader as the plugin of a format, which is used as a decorator.
+    
+    Args:
+        format: A string that names the format, as given to read_file(), e.g. 'opml'.
+        extensions: A list of the extensions of the format's files with the dot, e.g. ['.opml'].
+        sniff: A function that takes the first bytes of a file and returns True if it's of the format. It's only used
+            for the bytes and the file objects whose format isn't given, see detect_format(). Optional.
+    """
+    
+    def register(reader):
+        
+        READERS[format] = {
+            'reader': reader,
+            'extensions': [extension.lower() for extension in extensions],
+            'sniff': sniff
+            }
+        
+        return reader
+    
+    return register
+
+
+def detect_format(location):
+    """Detects the format of a content file among the registered ones.
+    
+    A location is detected by its extension, while the bytes and the file objects are detected by their first bytes,
+    which are looked at by the sniffers in the order the readers are registered. A file object is put back to its
+    position afterwards, so it should be seekable.
+    
+    Args:
+        location: A string that contains the location of the content file, the bytes of the file,
+            or a binary file object.
+        
+    Returns:
+        A string of the format, or None if it's of none of the registered formats.
+    """
+    
+    if isinstance(location, str):
+        
+        extension = os.path.splitext(location)[1].lower()
+        
+        for format, plugin in READERS.items():
+            if extension in plugin['extensions']:
+                return format
+        
+        return None
+    
+    if isinstance(location, (bytes, bytearray, memoryview)):
+        head = bytes(location[:SNIFF_BYTES])
+        
+    else:
+        position = location.tell()
+        head = location.read(SNIFF_BYTES)
+        location.seek(position)
+    
+    for format, plugin in READERS.items():
+        if plugin['sniff'] is not None and plugin['sniff'](head):
+            return format
+    
+    return None
+
+
+def sniff_opml(head):
+    """Checks if the first bytes of a file are of an opml file."""
+    
+    return b'<opml' in head
+
+
+@register_reader('opml', ['.opml'], sniff_opml)
+@cached
 def read_opml(location):
-    """Reads the opml file and analyses it to build a nodes' tree of its content."""
+    """Reads the opml file and analyses it to build a nodes' tree of its content.
+    
+    The file is streamed through an expat parser in a single pass, so that only the chain of nodes from the root
+    to the current one is kept besides the tree itself. The layer of a node is the nesting depth of its <outline>
+    element, therefore the indentation of the file doesn't matter. And the entities are decoded by the parser.
+    
+    Noted that the basic element of the nodes' tree is OutlineNode.
     
-    def analyse_opml(opml_content):
-        """Analyses the opml codes and builds a nodes' tree for it.
+    Args:
+        location: A string that contains the location of the opml file, the bytes of the file, or a binary file object.
         
-        Noted that the basic element of the nodes' tree is OutlineNode.
+    Returns:
+        The root node of the nodes' tree.
+    """
+    
+    root_node = None
+    path = [] # The chain of the nodes from the root to the current node.
+    
+    def start_element(tag, attributes):
+        """Creates the node of an <outline> element as the child of the innermost open one.
         
-        Attributes:
-            opml_content: A string contains the whole content of the opml code.
-            
-        Returns:
-            The root node of the nodes' tree.
+        If there isn't any open node, it should be the root node.
         """
         
-        # The content of the opml code is split and analysed line by line.
+        nonlocal root_node
+        
+        if tag != 'outline':
+            return
+        
+        new_node = OutlineNode(attributes.get('text', ''), attributes.get('_note', ''), len(path), entities=False)
+        
+        if path:
+            new_node.set_father(path[-1])
+            path[-1].add_child(new_node)
+        else:
+            root_node = new_node
+        
+        path.append(new_node)
+    
+    def end_element(tag):
+        """Closes the node of an <outline> element."""
         
-        opml_content = re.split('\n', opml_content)
+        if tag == 'outline':
+            path.pop()
     
-        for content in opml_content:
-            
-            # Only the lines that contain "outline" or "text" are valuable.
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    
+    with open_source(location) as file:
+        parser.ParseFile(file)
+    
+    return root_node
+
+
+# The namespace of WordprocessingML, as it's prefixed to the tag names by expat.
+
+WORD_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main '
+
+# The names of the heading styles in a few languages, which are followed by the level, e.g. "heading 1" or "标题 1".
+
+HEADING_NAMES = ['heading', 'überschrift', 'titre', 'título', 'titolo', 'kop', 'nagłówek', 'заголовок', '标题', '標題', '見出し', '제목']
+
+
+@functools.lru_cache(maxsize=64)
+def docx_heading_levels(styles_content):
+    """Resolves the heading level of each paragraph style from the styles.xml of a docx file.
+    
+    A style is a heading if its name is one of HEADING_NAMES followed by the level, or if it has an outline level,
+    either of its own or inherited from the style it's based on.
+    
+    Noted that parsing styles.xml takes most of the time reading a short document, while the documents made from the
+    same template share the same styles.xml. Therefore the levels are cached by its content, and shouldn't be modified.
+    
+    Args:
+        styles_content: The bytes of word/styles.xml.
+        
+    Returns:
+        A dictory maps the style id of each heading style to its level, i.e. 1 for "Heading 1".
+    """
+    
+    w = '{' + WORD_NAMESPACE.strip() + '}'
+    
+    names = {}
+    outline_levels = {}
+    based_on = {}
+    
+    for style in ElementTree.fromstring(styles_content).iter(w + 'style'):
+        
+        if style.get(w + 'type') != 'paragraph':
+            continue
+        
+        style_id = style.get(w + 'styleId')
+        
+        name = style.find(w + 'name')
+        if name is not None:
+            names[style_id] = name.get(w + 'val', '').lower()
+        
+        outline_level = style.find(w + 'pPr/' + w + 'outlineLvl')
+        if outline_level is not None:
+            outline_levels[style_id] = int(outline_level.get(w + 'val')) + 1
+        
+        basis = style.find(w + 'basedOn')
+        if basis is not None:
+            based_on[style_id] = basis.get(w + 'val')
+    
+    levels = {}
+    
+    for style_id, name in names.items():
+        
+        # Matchs the name of the style first.
+        
+        words = name.split()
+        if len(words) == 2 and words[0] in HEADING_NAMES and words[1].isdigit():
+            levels[style_id] = int(words[1])
+            continue
+        
+        # Then looks up the outline level along the chain of the styles it's based on.
+        
+        current = style_id
+        visited = set()
+        
+        while current is not None and current not in visited:
             
-            if 'outline' not in content:
-                continue
+            if current in outline_levels:
+                
+                if outline_levels[current] <= 9: # Outline level 9 stands for the body text.
+                    levels[style_id] = outline_levels[current]
+                break
             
-            if 'text' not in content:
-                continue
+            visited.add(current)
+            current = based_on.get(current)
     
-            # Split the content of the line again which creates a list contains: [spaces, title, note, useless content]
-            # The number of spaces is related to the layer of the node: layer = number of spaces / 2 - 2
-            # Then creates an outline node object.
-            
-            node_split = re.split('<outline text="|" _note="|" heading="1"|" heading="2"|" heading="3"|"/>|">|>',content)
-            layer = len(node_split[0])/2 - 2
-            new_node = OutlineNode(node_split[1], node_split[2], layer)
+    return levels
+
+
+def stream_docx(location):
+    """Streams the paragraphs of a docx file without building the whole document.
+    
+    Only the paragraphs directly in the body are yielded, i.e. the same ones as python-docx's Document.paragraphs,
+    and their text is joined from the runs directly in the paragraph or in its hyperlinks.
+    
+    Args:
+        location: A string that contains the location of the docx file, the bytes of the file, or a binary file object.
+        
+    Yields:
+        Tuples of (text, level), in which level is the heading level of the paragraph or 0 if it isn't a heading.
+    """
+    
+    paragraphs = []
+    path = [] # The tag names from the document element to the current element.
     
-            # If the new node is in layer 0, then it should be the root node.
-            # Saves it as the root node and current node and turns to the next loop.
+    current = {}
+    
+    def start_element(tag, attributes):
+        
+        path.append(tag)
+        
+        if tag == WORD_NAMESPACE + 'p' and len(path) == 3: # w:document > w:body > w:p
+            current['text'] = []
+            current['style'] = None
+            current['level'] = 0
             
-            if layer == 0:
-                root_node = new_node
-                current_node = new_node
-                continue
+        if 'text' not in current:
+            return
+            
+        if tag == WORD_NAMESPACE + 'pStyle' and path[-2] == WORD_NAMESPACE + 'pPr' and len(path) == 5:
+            current['style'] = attributes.get(WORD_NAMESPACE + 'val')
             
-            # If the layer of the new node is larger than the current node, then it should be the current node's child.
+        elif tag == WORD_NAMESPACE + 'outlineLvl' and path[-2] == WORD_NAMESPACE + 'pPr' and len(path) == 5:
+            level = int(attributes.get(WORD_NAMESPACE + 'val', 9)) + 1
+            current['level'] = level if level <= 9 else 0
             
-            if layer > current_node.layer:
-                new_node.set_father(current_node)
-                current_node.add_child(new_node)
+        elif in_run():
+            
+            if tag == WORD_NAMESPACE + 'tab' or tag == WORD_NAMESPACE + 'ptab':
+                current['text'].append('\t')
+                
+            elif tag == WORD_NAMESPACE + 'br':
+                if attributes.get(WORD_NAMESPACE + 'type', 'textWrapping') == 'textWrapping':
+                    current['text'].append('\n')
+                    
+            elif tag == WORD_NAMESPACE + 'cr':
+                current['text'].append('\n')
+                
+            elif tag == WORD_NAMESPACE + 'noBreakHyphen':
+                current['text'].append('-')
     
-            # If the layer of the new node is equal to the current node, then they should share the same father.
+    def end_element(tag):
+        
+        path.pop()
+        
+        if tag == WORD_NAMESPACE + 'p' and len(path) == 2 and 'text' in current:
+            paragraphs.append((''.join(current.pop('text')), current['style'], current['level']))
     
-            if layer == current_node.layer:
-                new_node.set_father(current_node.father)
-                current_node.father.add_child(new_node)
-            
-            # If the layer of the new node is smaller than the current node, then find the node, from the current node's fathers serial,
-            # in the same layer with the new node. They should share the same father.
+    def character_data(data):
+        
+        if 'text' in current and path[-1] == WORD_NAMESPACE + 't' and in_run():
+            current['text'].append(data)
+    
+    def in_run():
+        """Checks if the element at the end of path is in a run directly in the paragraph or in its hyperlinks."""
+        
+        run = path[3:-1]
+        return run == [WORD_NAMESPACE + 'r'] or run == [WORD_NAMESPACE + 'hyperlink', WORD_NAMESPACE + 'r']
+    
+    with open_source(location) as source, zipfile.ZipFile(source) as archive:
+        
+        try:
+            levels = docx_heading_levels(archive.read('word/styles.xml'))
+        except KeyError:
+            levels = {}
+        
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+        
+        with archive.open('word/document.xml') as file:
             
-            if layer < current_node.layer:
-                gap = current_node.layer - layer
+            for chunk in iter(lambda: file.read(2**16), b''):
+                parser.Parse(chunk, False)
+                
+                # Yields the paragraphs parsed so far, so that the document is never held as a whole.
                 
-                while gap > 0:
-                    current_node = current_node.father
-                    gap -= 1
+                for text, style, level in paragraphs:
+                    yield text, level or levels.get(style, 0)
                     
-                new_node.set_father(current_node.father)
-                current_node.father.add_child(new_node)
+                paragraphs.clear()
             
-            # Refresh the current node.
+            parser.Parse(b'', True)
             
-            current_node = new_node
-        
-        return root_node
+            for text, style, level in paragraphs:
+                yield text, level or levels.get(style, 0)
 
-    with open (location, 'r', encoding='UTF-8') as file:
-        opml_content = file.read()
 
-    root_node = analyse_opml(opml_content)
-    return root_node
+def sniff_docx(head):
+    """Checks if the first bytes of a file are of a docx file, i.e. of a zip archive."""
+    
+    return head.startswith(b'PK\x03\x04')
 
 
+@register_reader('docx', ['.docx'], sniff_docx)
+@cached
 def read_docx(location):
-    """Reads the opml file and analyses it to build a nodes' tree of its content."""
+    """Reads the docx file and analyses it to build a nodes' tree of its content.
+    
+    The paragraphs are streamed from word/document.xml, see stream_docx(). A heading paragraph becomes a node whose
+    layer is its heading level, and the other paragraphs following it become the note of the node. The paragraphs
+    before the first heading become the note of the root node.
     
-    def sorting_docx(location):
-        """Sorting the docx content for the following analysing.
+    Noted that the basic element of the nodes' tree is OutlineNode.
+    
+    Args:
+        location: A string that contains the location of the docx file, the bytes of the file, or a binary file object.
         
-        The main targets are distinguishing the titles and the corresponding notes and the layer they belong to.
+    Returns:
+        The root node of the nodes' tree.
+    """
+    
+    root_node = OutlineNode('', '', 0)
+    current_node = root_node
+    notes = [] # The paragraphs of the current node's note.
+    
+    for text, level in stream_docx(location):
         
-        Attributes:
-            location: The string that contains the location of the docx file. 
-            
-        Returns:
-            A list of the OutlineNodes.
-        """
+        if level == 0:
+            notes.append(text + '\n')
+            continue
+        
+        current_node.note = current_node.content_tidy(''.join(notes))
+        notes = []
+        
+        new_node = OutlineNode(text, '', level)
+        
+        # Finds the nearest node, from the current node's fathers serial, in the upper layer of the new node.
+        # The new node should be its child.
+        
+        while current_node.layer >= new_node.layer:
+            current_node = current_node.father
         
-        # Loads the whole content of the docx file into a docx document object.
-        # Distinguishs the titles and the corresponding notes and the layer they belong to.
+        new_node.set_father(current_node)
+        current_node.add_child(new_node)
         
-        titles = []
-        notes  = []
-        layers = []
+        current_node = new_node
+    
+    current_node.note = current_node.content_tidy(''.join(notes))
+    
+    return root_node
+
+
+# The ATX heading of markdown, i.e. 1 to 6 "#" followed by the title, whose closing "#" are dropped.
+
+MARKDOWN_HEADING = re.compile('^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+
+# The fence of a markdown code block, within which a line is never a heading.
+
+MARKDOWN_FENCE = re.compile('^ {0,3}(`{3,}|~{3,})')
+
+
+def sniff_markdown(head):
+    """Checks if the first bytes of a file are of a markdown outline, i.e. its first line is a heading."""
+    
+    lines = head.decode('UTF-8', errors='ignore').lstrip('\ufeff').lstrip().splitlines()
+    
+    return bool(lines) and MARKDOWN_HEADING.match(lines[0]) is not None
+
+
+def markdown_note(lines):
+    """Joins the lines of a markdown note the same as the paragraphs of a docx note, without the blank lines around."""
+    
+    while lines and not lines[-1].strip():
+        lines.pop()
+    
+    start = 0
+    while start < len(lines) and not lines[start].strip():
+        start += 1
+    
+    return ''.join(line + '\n' for line in lines[start:])
+
+
+@register_reader('markdown', ['.md', '.markdown'], sniff_markdown)
+@cached
+def read_markdown(location):
+    """Reads the markdown file and analyses it to build a nodes' tree of its content.
+    
+    The file is read line by line. An ATX heading, e.g. "## Title", becomes a node whose layer is the count of its "#",
+    and the other lines following it become the note of the node, the same as the paragraphs of a docx file, see
+    read_docx(). The lines before the first heading become the note of the root node, and the lines of a fenced code
+    block are always kept in the note.
+    
+    Noted that the basic element of the nodes' tree is OutlineNode.
+    
+    Args:
+        location: A string that contains the location of the markdown file, the bytes of the file,
+            or a binary file object.
         
-        docx_content = docx.Document(location)
+    Returns:
+        The root node of the nodes' tree.
+    """
+    
+    root_node = OutlineNode('', '', 0, entities=False)
+    current_node = root_node
+    notes = [] # The lines of the current node's note.
+    fence = None # The fence of the open code block, if any.
+    
+    with open_source(location) as file:
         
-        for paragraph in docx_content.paragraphs:
+        for number, line in enumerate(file):
             
-            # If the style of the paragraph is not "Normal" then it is a title.
+            line = line.decode('UTF-8').rstrip('\r\n')
             
-            if paragraph.style != docx_content.styles['Normal']:
-                titles.append(paragraph.text)
-                notes.append('')
-                
-                # Matchs the layer of the tiele.
-                
-                try:
-                    if paragraph.style == docx_content.styles['Heading 1']:
-                        layers.append(1)
-                        
-                except:
-                    pass
+            if number == 0:
+                line = line.lstrip('\ufeff')
+            
+            match = MARKDOWN_FENCE.match(line)
+            
+            if fence is not None:
                 
-                try:
-                    if paragraph.style == docx_content.styles['Heading 2']:
-                        layers.append(2)
-                except:
-                    pass
+                if match is not None and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence):
+                    fence = None
                 
-                try:
-                    if paragraph.style == docx_content.styles['Heading 3']:
-                        layers.append(3)
-                except:
-                    pass
+                notes.append(line)
+                continue
             
-            # Otherwise, it's a part of the note.
+            if match is not None:
+                fence = match.group(1)
             
-            else:
-                notes[len(titles) - 1] = notes[len(titles) - 1] + paragraph.text + '\n'
-        
-        # Creates a list that contains the nodes and returns it.
-        
-        nodes = []        
-        for n in range(len(titles)):
-            node = OutlineNode(titles[n], notes[n], layers[n])
-            nodes.append(node)
+            heading = MARKDOWN_HEADING.match(line) if fence is None else None
+            
+            if heading is None:
+                notes.append(line)
+                continue
+            
+            current_node.note = current_node.content_tidy(markdown_note(notes), entities=False)
+            notes = []
+            
+            new_node = OutlineNode(heading.group(2) or '', '', len(heading.group(1)), entities=False)
+            
+            # Finds the nearest node in the upper layer of the new node, as read_docx() does.
+            
+            while current_node.layer >= new_node.layer:
+                current_node = current_node.father
             
-        return nodes
+            new_node.set_father(current_node)
+            current_node.add_child(new_node)
             
+            current_node = new_node
+    
+    current_node.note = current_node.content_tidy(markdown_note(notes), entities=False)
+    
+    return root_node
+
+
+def read_file(location, format=None):
+    """Reads a single content file according to its format.
     
-    def analyse_docx(nodes):
-        """Analyses the nodes' structure and builds a nodes' tree for it.
+    Args:
+        location: A string that contains the location of the content file, e.g. an .opml, .docx or .md file, the bytes
+            of the file, or a binary file object, e.g. an upload that is never written to the disk.
+        format: A string that indicates the format of the file, i.e. one of READERS, e.g. 'opml'. Defaults to the
+            format detected by the location's extension or the file's first bytes, see detect_format().
         
-        Noted that the basic element of the nodes' tree is OutlineNode.
+    Returns:
+        The root node of the nodes' tree, or None if the file's format isn't supported.
+    """
+    
+    if format is None:
+        format = detect_format(location)
+    
+    plugin = READERS.get(format)
+    
+    if plugin is None:
+        return None
+    
+    with profiler.stage('load'):
+        return plugin['reader'](location)
+
+
+def scan_files(location, pattern='**/*', recursive=True):
+    """Scans a folder for the content files of the registered formats.
+    
+    Args:
+        location: A string that contains the location of the folder.
+        pattern: A string of the glob pattern of the files relative to the folder, in which "**" matches the
+            subfolders at any depth if recursive is True.
+        recursive: A boolean indicates if the subfolders are scanned.
         
-        Attributes:
-            nodes: A list of the OutlineNodes.
-            
-        Returns:
-            The root node of the nodes' tree.
-        """
+    Returns:
+        A sorted list of the locations of the files relative to the folder. The temporary files, e.g. the "~$" lock
+        files of MS Word, the hidden files and folders, and the files of unregistered formats are skipped.
+    """
+    
+    files = []
+    
+    for path in glob.iglob(os.path.join(glob.escape(location), pattern), recursive=recursive):
         
-        root_node = OutlineNode('', '', 0)
-        current_node = root_node
+        if '~$' in os.path.basename(path) or detect_format(path) is None:
+            continue
         
-        for new_node in nodes:
-            
-            # If the layer of the new node is larger than the current node, then it should be the current node's child.
-            
-            if new_node.layer > current_node.layer:
-                new_node.set_father(current_node)
-                current_node.add_child(new_node)
+        if os.path.isfile(path):
+            files.append(os.path.relpath(path, location))
     
-            # If the layer of the new node is equal to the current node, then they should share the same father.
+    return sorted(files)
+
+
+def start_reader(cache):
+    """Enables the parse cache of a worker process once it starts, as the one of the process that reads the files."""
     
-            if new_node.layer == current_node.layer:
-                new_node.set_father(current_node.father)
-                current_node.father.add_child(new_node)
-            
-            # If the layer of the new node is smaller than the current node, then find the node, from the current node's fathers serial,
-            # in the same layer with the new node. They should share the same father.
+    if cache is not None:
+        from . import parsecache
+        
+        parsecache.enable(*cache)
+
+
+def read_flattened(location):
+    """Reads a content file on a worker process, and returns its tree flattened by parsecache.flatten(), or None."""
+    
+    from . import parsecache
+    
+    root_node = read_file(location)
+    
+    if root_node is None:
+        return None
+    
+    return parsecache.flatten(root_node)
+
+
+def read_files(location, files=None, workers=None, processes=False):
+    """Reads the content files of a folder concurrently, and yields their trees as soon as each one is read.
+    
+    The files are read on a pool of threads by default, which overlaps the reading from the disk. With processes set,
+    they're read on a pool of processes, which parses them in parallel as well, and the trees are sent back as the
+    lists of parsecache.flatten(). Only a few files per worker are in flight at a time, so that the trees are never held
+    beyond what the caller hasn't taken yet, however many files there are.
+    
+    Args:
+        location: A string that contains the location of the folder.
+        files: A list of the locations of the files relative to the folder. Defaults to all the files found by
+            scan_files().
+        workers: An integer count of the threads or the processes. Defaults to the executor's own default.
+        processes: A boolean indicates if the files are read on processes instead of threads.
+        
+    Yields:
+        Tuples of (file, root node) in the order the files are read, in which the root node is None for an empty file.
+        
+    Raises:
+        The error the reader raises for a broken file, once it's read.
+    """
+    
+    if files is None:
+        files = scan_files(location)
+    
+    if processes:
+        cache = None if PARSE_CACHE is None else (PARSE_CACHE.location, PARSE_CACHE.max_bytes)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=start_reader, initargs=(cache,))
+        read = read_flattened
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        read = read_file
+    
+    window = 4 * (workers or os.cpu_count() or 1)
+    pending = {}
+    
+    def finished():
+        """Waits for the pending files until any one is read, and returns the (file, root node) of those read."""
+        
+        done = wait(pending, return_when=FIRST_COMPLETED)[0]
+        trees = []
+        
+        for future in done:
+            file = pending.pop(future)
+            root_node = future.result()
             
-            if new_node.layer < current_node.layer:
-                gap = current_node.layer - new_node.layer
+            if processes and root_node is not None:
+                from . import parsecache
                 
-                while gap > 0:
-                    current_node = current_node.father
-                    gap -= 1
-                    
-                new_node.set_father(current_node.father)
-                current_node.father.add_child(new_node)
+                root_node = parsecache.unflatten(*root_node)
             
-            # Refresh the current node.
+            trees.append((file, root_node))
+        
+        return trees
+    
+    try:
+        for file in files:
+            pending[executor.submit(read, os.path.join(location, file))] = file
             
-            current_node = new_node
+            if len(pending) >= window:
+                yield from finished()
         
-        return root_node
+        while pending:
+            yield from finished()
     
-    nodes = sorting_docx(location)
-    rootNode = analyse_docx(nodes)
-    return rootNode
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
-def load_files(location):
-    """Loads all the valid files from an indicated folder.
+def load_files(location, workers=None, processes=False):
+    """Loads all the valid files from an indicated folder and its subfolders.
     
-    It analyses all the valid files from the provided location and creates OutlineNodes' tree for each one.'
+    It analyses all the valid files from the provided location and creates OutlineNodes' tree for each one.
+    The files are read concurrently, see read_files(), and the empty ones are skipped.
     
     Args:
         location: A string that contains the folder location of the target file.
+        workers, processes: The same as read_files()'s.
         
     Returns:
         A list that contains the root nodes.
-        A list of the file names."""
-
-    file_list = os.listdir(location)
+        A list of the file names, relative to the folder, in the order of the names."""
     
-    # Loads the files according to its format.
+    trees = {}
     
-    root_nodes = []
-    name_list = []
-    for file in file_list:
+    for file, root_node in read_files(location, workers=workers, processes=processes):
         
-        if '.opml' in file:
-            
-            root_nodes.append(read_opml(location + file))
-            name_list.append(file)
-            print("  {} has been loaded.".format(file))
-            
-        elif '.docx' in file:
-            
-            if '~$' in file: # Which indicates that this is a temporary file of no value.
-                break
-            
-            root_nodes.append(read_docx(location + file))
-            name_list.append(file)
-            print("  {} has been loaded.".format(file))
-            
-        else:
-            
-            pass
+        if root_node is None:
+            continue
+        
+        trees[file] = root_node
+        print("  {} has been loaded.".format(file))
+    
+    name_list = sorted(trees)
+    root_nodes = [trees[file] for file in name_list]
     
     return root_nodes, name_list
 
@@ -328,4 +954,6 @@ if __name__ == '__main__':
     root_nodes, name_list = load_files(location)
     root_nodes[0].traversal_print()
     
+    print(detect_format(b'# Outline\n\n## Part\n'), [format for format in READERS])
+    
     
\ No newline at end of file
@@ -0,0 +1,399 @@
+import io
+import os
+import re
+import copy
+import hashlib
+import functools
+import threading
+import importlib.util
+from collections import OrderedDict
+
+from pptx.dml.color import RGBColor
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls, qn
+from pptx.parts.image import Image as PackageImage
+from pptx.text.text import _Paragraph
+from pptx.util import Pt
+
+from . import profiler
+
+# The markup of a note: a fenced code block with an optional language, an inline code span, or a formula between "$$"
+# within a line. The code is matched first, so that a "$$" in the code is kept as it is.
+
+MARKUP = re.compile('```(?P<language>[\\w+#.-]*)[ \\t]*\\n?(?P<block>.*?)\\n?```'
+                    '|`(?P<span>[^`\\n]+)`'
+                    '|\\$\\$(?P<formula>(?:(?!\\$\\$)[^\\n])+)\\$\\$', re.S)
+
+LANGUAGE = re.compile('[\\w+#.-]*')
+
+# The style of the highlighted code, one of Pygments' styles, and the font of the code.
+
+CODE_STYLE = 'default'
+CODE_FONT = 'Consolas'
+
+# The font of the formulas shown as their TeX source, i.e. those not rendered into pictures.
+
+FORMULA_FONT = 'Cambria Math'
+
+# Increases it whenever the way of rendering the formulas changes, so that the older cached pictures are dropped.
+
+FORMULA_VERSION = 1
+
+
+def has_markup(note):
+    """Checks if a note contains any code or formula, see MARKUP."""
+
+    return ('`' in note or '$$' in note) and MARKUP.search(note) is not None
+
+
+def style_key():
+    """Returns the settings the rendered markup depends on, i.e. the code style, the way of rendering the formulas and
+    whether matplotlib is installed to render them, see incremental.context_key()."""
+
+    return [CODE_STYLE, FORMULA_VERSION, importlib.util.find_spec('matplotlib') is not None]
+
+
+def split(note):
+    """Splits a note into its segments of text, code and formulas.
+
+    Returns:
+        A list of tuples of (kind, content, option) in the order of the note. The kind is 'text', 'code' or 'formula'.
+        The option of a code block is its language, which is '' if it isn't given, while a code span's is None.
+        The option of a formula is the number of its paragraph, i.e. its line of the note, if it takes the whole line,
+        i.e. is a display formula, or None.
+    """
+
+    segments = []
+    position = 0
+
+    for match in MARKUP.finditer(note):
+
+        if match.start() > position:
+            segments.append(('text', note[position:match.start()], None))
+
+        if match.group('block') is not None:
+            segments.append(('code', match.group('block'), match.group('language')))
+
+        elif match.group('span') is not None:
+            segments.append(('code', match.group('span'), None))
+
+        else:
+            if ((match.start() == 0 or note[match.start() - 1] == '\n') and
+                    (match.end() == len(note) or note[match.end()] == '\n')):
+                paragraph = note.count('\n', 0, match.start())
+            else:
+                paragraph = None
+
+            segments.append(('formula', match.group('formula').strip(), paragraph))
+
+        position = match.end()
+
+    if position < len(note):
+        segments.append(('text', note[position:], None))
+
+    return segments
+
+
+def display_formula(paragraph):
+    """Returns the TeX source of a paragraph that is a single display formula, or None."""
+
+    match = MARKUP.fullmatch(paragraph)
+
+    if match is None or match.group('formula') is None:
+        return None
+
+    return match.group('formula').strip()
+
+
+def open_fence(text):
+    """Returns the opening fence, e.g. '```python', of a code block left open at the end of the text, or None.
+
+    A fence that isn't closed never matches MARKUP, so it's the first one found between the matches.
+    """
+
+    position = 0
+
+    for match in list(MARKUP.finditer(text)) + [None]:
+
+        end = len(text) if match is None else match.start()
+        index = text.find('```', position, end)
+
+        if index >= 0:
+            return '```' + LANGUAGE.match(text, index + 3).group()
+
+        if match is not None:
+            position = match.end()
+
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def highlight(source, language, style=CODE_STYLE):
+    """Returns the runs of a highlighted code, which are memoized by the source, the language and the style.
+
+    Noted that Pygments is only imported here, once a note has code. Without Pygments, or without a known language,
+    the code is a single run without color.
+
+    Args:
+        source: A string of the code.
+        language: A string of the language's name or alias for Pygments, e.g. 'python', or None.
+        style: A string of the name of Pygments' style.
+
+    Returns:
+        A tuple of tuples of (text, color, bold, italic), in which color is a hex string of RGB, e.g. '008000', or
+        None. The consecutive tokens of the same format, and the whitespace, are merged into a single run.
+    """
+
+    try:
+        from pygments import lex
+        from pygments.lexers import get_lexer_by_name
+        from pygments.styles import get_style_by_name
+        from pygments.util import ClassNotFound
+
+    except ImportError:
+        return ((source, None, False, False),)
+
+    if not language:
+        return ((source, None, False, False),)
+
+    try:
+        lexer = get_lexer_by_name(language, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return ((source, None, False, False),)
+
+    style_class = get_style_by_name(style)
+    runs = []
+
+    for token, text in lex(source, lexer):
+
+        token_style = style_class.style_for_token(token)
+        run_format = (token_style['color'] or None, bool(token_style['bold']), bool(token_style['italic']))
+
+        if runs and (runs[-1][1:] == run_format or text.isspace()):
+            runs[-1] = (runs[-1][0] + text,) + runs[-1][1:]
+        else:
+            runs.append((text,) + run_format)
+
+    return tuple(runs)
+
+
+@functools.lru_cache(maxsize=1024)
+def code_runs(source, language, size, style=CODE_STYLE):
+    """Returns the runs of a highlighted code in the code font, see highlight(), as <a:r> elements.
+
+    The runs are made once by python-pptx and memoized by the source, the language, the font size and the style, then
+    copied into each slide that shows the code, see copy_runs(). Since setting the font of a run through python-pptx
+    takes far longer than copying its element.
+    """
+
+    paragraph = _Paragraph(parse_xml('<a:p {}/>'.format(nsdecls('a'))), None)
+
+    for text, color, bold, italic in highlight(source, language, style):
+        run = paragraph.add_run()
+        run.text = text
+        run.font.size = Pt(size)
+        run.font.color.rgb = RGBColor.from_string(color or '000000')
+        run.font.name = CODE_FONT
+        run.font.bold = bold or None
+        run.font.italic = italic or None
+
+    return tuple(paragraph._p.r_lst)
+
+
+def copy_runs(paragraph, runs):
+    """Appends the copies of <a:r> elements to a paragraph, before its end paragraph properties if any."""
+
+    end = paragraph._p.find(qn('a:endParaRPr'))
+
+    for run in runs:
+
+        if end is None:
+            paragraph._p.append(copy.deepcopy(run))
+        else:
+            end.addprevious(copy.deepcopy(run))
+
+
+def render_formula(tex, size, color, dpi):
+    """Renders a formula by matplotlib's mathtext into a transparent PNG.
+
+    Noted that matplotlib is optional and only imported here, once a formula is rendered.
+
+    Args:
+        tex: A string of the TeX source of the formula, without the "$$".
+        size: A number of the font size in pt.
+        color: A hex string of RGB, e.g. '000000'.
+        dpi: An integer count of the pixels per inch.
+
+    Returns:
+        The bytes of the PNG, or None if matplotlib isn't installed or can't parse the formula.
+    """
+
+    try:
+        from matplotlib import mathtext
+        from matplotlib.font_manager import FontProperties
+
+    except ImportError:
+        return None
+
+    output = io.BytesIO()
+
+    try:
+        mathtext.math_to_image('$' + tex + '$', output, prop=FontProperties(size=size), dpi=dpi, format='png',
+                               color='#' + color)
+
+    except ValueError: # Which mathtext raises for the TeX it doesn't support.
+        return None
+
+    return output.getvalue()
+
+
+class FormulaCache(object):
+    """Class of the content-addressed cache of the rendered formulas.
+
+    A formula's picture is keyed by the hash of its TeX source and its style, i.e. the font size, the color and the
+    resolution. So a formula is rendered once however many slides and presentations use it, and is embedded only once
+    into each presentation, see imagelibrary.embed(). The recent pictures are kept in memory, while all of them are
+    kept in the cache folder. A formula that can't be rendered, e.g. without matplotlib, is only remembered in memory,
+    so that it's rendered once matplotlib is installed.
+
+    Attributes:
+        location: A string that indicates folder that contains the pictures, or None to keep them in memory only.
+        dpi: An integer count of the pixels per inch the formulas are rendered at.
+        hits: An integer count of the pictures read from the cache.
+        misses: An integer count of the formulas rendered.
+    """
+
+    def __init__(self, location='.autopre_cache/formulas/', dpi=300):
+
+        self.location = location
+        self.dpi = dpi
+
+        self.hits = 0
+        self.misses = 0
+
+        self._pictures = OrderedDict()
+        self._lock = threading.Lock()
+
+        if location is not None:
+            os.makedirs(location, exist_ok=True)
+
+    def key(self, tex, size, color):
+        """Returns the hash string of a formula and its style."""
+
+        content = '{}:{}:{}:{}:{}'.format(FORMULA_VERSION, size, color, self.dpi, tex)
+
+        return hashlib.sha256(content.encode('UTF-8')).hexdigest()
+
+    def picture(self, tex, size, color='000000'):
+        """Returns the picture of a formula.
+
+        Args:
+            tex: A string of the TeX source of the formula, without the "$$".
+            size: A number of the font size in pt.
+            color: A hex string of RGB.
+
+        Returns:
+            A tuple of (the bytes of the PNG, its width and height in EMU at the font size), or None if the formula
+            can't be rendered.
+        """
+
+        key = self.key(tex, size, color)
+
+        with self._lock:
+
+            if key in self._pictures:
+                self._pictures.move_to_end(key)
+                self.hits += 1
+                return self._pictures[key]
+
+        blob = self.read(key)
+
+        if blob is None:
+
+            with profiler.stage('formulas'):
+                blob = render_formula(tex, size, color, self.dpi)
+
+            if blob is not None:
+                self.write(key, blob)
+
+            with self._lock:
+                self.misses += 1
+
+        else:
+            with self._lock:
+                self.hits += 1
+
+        if blob is None:
+            picture = None
+
+        else:
+            width, height = PackageImage.from_blob(blob).size
+            picture = (blob, round(width * 914400 / self.dpi), round(height * 914400 / self.dpi))
+
+        with self._lock:
+            self._pictures[key] = picture
+
+            while len(self._pictures) > 1024:
+                self._pictures.popitem(last=False)
+
+        return picture
+
+    def read(self, key):
+        """Reads a picture from the cache folder, or returns None if it isn't there."""
+
+        if self.location is None:
+            return None
+
+        try:
+            with open(os.path.join(self.location, key + '.png'), 'rb') as file:
+                return file.read()
+
+        except OSError:
+            return None
+
+    def write(self, key, blob):
+        """Writes a picture into the cache folder."""
+
+        if self.location is None:
+            return
+
+        path = os.path.join(self.location, key + '.png')
+
+        # Writes a temporary file first, so that other processes never read a partial picture.
+
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(temporary, 'wb') as file:
+            file.write(blob)
+
+        os.replace(temporary, path)
+
+
+# The formula cache of the process, which is only created once a formula is rendered.
+
+FORMULAS = None
+
+
+def formulas():
+    """Returns the formula cache of the process."""
+
+    global FORMULAS
+
+    if FORMULAS is None:
+        FORMULAS = FormulaCache()
+
+    return FORMULAS
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    note = ('Euler:\n$$e^{i\\pi} + 1 = 0$$\nIn Python, `cmath.exp(1j * cmath.pi)`:\n'
+            '```python\nimport cmath\nprint(cmath.exp(1j * cmath.pi) + 1)\n```')
+
+    for segment in split(note):
+        print(segment)
+
+    print(highlight('import cmath\nprint(cmath.exp(1j * cmath.pi) + 1)', 'python'))
+    print(FormulaCache(None).picture('e^{i\\pi} + 1 = 0', 16))
@@ -0,0 +1,207 @@
+import os
+import zipfile
+import hashlib
+
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.parts.image import ImagePart
+from pptx.parts.media import MediaPart
+
+from . import profiler
+
+# The compression of the parts keyed by their file extensions, as tuples of (compression method, compression level).
+# The images, videos and embedded fonts are compressed already, so deflating them costs time and saves next to nothing.
+
+COMPRESSION = {
+    '.png': (zipfile.ZIP_STORED, None),
+    '.jpg': (zipfile.ZIP_STORED, None),
+    '.jpeg': (zipfile.ZIP_STORED, None),
+    '.gif': (zipfile.ZIP_STORED, None),
+    '.mp4': (zipfile.ZIP_STORED, None),
+    '.m4a': (zipfile.ZIP_STORED, None),
+    '.mp3': (zipfile.ZIP_STORED, None),
+    '.fntdata': (zipfile.ZIP_STORED, None)
+    }
+
+# The compression of any other part, i.e. the XML parts and the relationships, which shrink a lot.
+
+DEFAULT_COMPRESSION = (zipfile.ZIP_DEFLATED, 6)
+
+
+def write_member(archive, name, blob, compression=None):
+    """Writes a member into a zip file, compressed according to its file extension.
+
+    Args:
+        archive: The writable ZipFile object.
+        name: A string of the member's name.
+        blob: The bytes of the member.
+        compression: A dictory maps the file extension to the compression, which defaults to COMPRESSION.
+    """
+
+    if compression is None:
+        compression = COMPRESSION
+
+    method, level = compression.get(os.path.splitext(name)[1].lower(), DEFAULT_COMPRESSION)
+
+    archive.writestr(name, blob, compress_type=method, compresslevel=level)
+
+
+def dedupe_media(package, keep=()):
+    """Makes the relationships to identical media parts point to a single one of them.
+
+    The media parts are compared by the hash of their content. The duplicates are no longer related to, so they are
+    left out of the package when it's written.
+
+    Args:
+        package: The package object of the presentation.
+        keep: A collection of the parts whose relationships can't change anymore, e.g. the slides written by the
+            StreamWriter already. The media they relate to are preferred over their duplicates.
+
+    Returns:
+        An integer count of the relationships redirected.
+    """
+
+    parts = list(package.iter_parts())
+    digests = {}
+    canonical = {}
+
+    def digest(part):
+
+        if part not in digests:
+            digests[part] = hashlib.sha1(part.blob).hexdigest()
+
+        return digests[part]
+
+    def media_rels(part):
+        return [rel for rel in part.rels.values()
+                if not rel.is_external and isinstance(rel.target_part, (ImagePart, MediaPart))]
+
+    for part in parts:
+        if part in keep:
+            for rel in media_rels(part):
+                canonical.setdefault(digest(rel.target_part), rel.target_part)
+
+    redirected = 0
+
+    for part in parts:
+
+        if part in keep:
+            continue
+
+        for rel in media_rels(part):
+            target = canonical.setdefault(digest(rel.target_part), rel.target_part)
+
+            if target is not rel.target_part:
+                rel._target = target
+                redirected += 1
+
+    return redirected
+
+
+def prune_layouts(prs):
+    """Drops the slide layouts that no slide of the presentation uses, together with the media only they relate to.
+
+    Noted that the layouts left are indexed again, so the presentation can no longer be filled by the slide makers
+    afterwards, whose layout indices are those of the templates. It's only for the final output.
+
+    Returns:
+        An integer count of the layouts dropped.
+    """
+
+    used = set()
+
+    for rel in prs.part.rels.values():
+        if rel.reltype == RT.SLIDE:
+            used.add(rel.target_part.part_related_by(RT.SLIDE_LAYOUT))
+
+    dropped = 0
+
+    for master in prs.slide_masters:
+
+        sldLayoutIdLst = master._element.get_or_add_sldLayoutIdLst()
+
+        for sldLayoutId in list(sldLayoutIdLst):
+
+            if master.part.related_part(sldLayoutId.rId) in used:
+                continue
+
+            sldLayoutIdLst.remove(sldLayoutId)
+            master.part.drop_rel(sldLayoutId.rId)
+            dropped += 1
+
+    return dropped
+
+
+def save(prs, output, prune=False, compression=None):
+    """Saves the presentation like prs.save(), as a packaging stage that makes the output smaller and faster to write.
+
+    The identical media parts are written once, see dedupe_media(), each part is compressed according to its type,
+    see write_member(), and the layouts no slide uses may be dropped, see prune_layouts(). The stage is timed and the
+    bytes written are counted, see profiler.
+
+    Args:
+        prs: The presentation object.
+        output: A string that contains the location of the output presentation file, or a writable binary file object.
+        prune: A boolean indicates if the unused layouts are dropped. Noted that the presentation is changed then.
+        compression: A dictory maps the file extension to the compression, which defaults to COMPRESSION.
+    """
+
+    with profiler.stage('save'):
+
+        package = prs.part.package
+
+        profiler.count('media_deduped', dedupe_media(package))
+
+        if prune:
+            profiler.count('layouts_dropped', prune_layouts(prs))
+
+        parts = tuple(package.iter_parts())
+
+        with zipfile.ZipFile(output, 'w', strict_timestamps=False) as archive:
+
+            write_member(archive, CONTENT_TYPES_URI.membername, serialize_part_xml(_ContentTypesItem.xml_for(parts)),
+                         compression)
+            write_member(archive, PACKAGE_URI.rels_uri.membername, package._rels.xml, compression)
+
+            for part in parts:
+                write_member(archive, part.partname.membername, part.blob, compression)
+
+                if part._rels:
+                    write_member(archive, part.partname.rels_uri.membername, part.rels.xml, compression)
+
+    if isinstance(output, str):
+        profiler.count('bytes_written', os.path.getsize(output))
+    else:
+        profiler.count('bytes_written', output.tell())
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import io
+    import time
+
+    from . import load
+    from . import strategy
+    from . import templatecache
+    from . import templateregistry
+
+    templatecache.TEMPLATES.location = '../templates/'
+    templateregistry.REGISTRY.location = '../templates/'
+
+    root_node = load.read_file('../documents/OpmlExample.opml')
+
+    for template in templateregistry.names():
+
+        prs_info = {'title': 'Title', 'date': 'Date', 'part_num': 0, 'part_title': None,
+                    'color': templateregistry.color(template), 'author': 'Author'}
+        prs = strategy.make_presentation(root_node, prs_info, template, True, False)
+
+        for name, write in [('prs.save', prs.save), ('packaged', lambda output: save(prs, output, prune=True))]:
+            output = io.BytesIO()
+            start = time.perf_counter()
+            write(output)
+            print("  {} {}: {} bytes in {:.3f}s".format(template, name, len(output.getvalue()), time.perf_counter() - start))
@@ -0,0 +1,288 @@
+import re
+import math
+import functools
+import unicodedata
+
+from pptx.util import Pt
+
+from . import layoutschema
+from . import notemarkup
+from . import profiler
+
+# The advance widths of the printable ASCII characters in Times New Roman, the latin font of the templates' main body,
+# in thousandths of an em. Any other character is measured by its east asian width, see char_width().
+
+ASCII_WIDTHS = [
+    250, 333, 408, 500, 500, 833, 778, 180, 333, 333, 500, 564, 250, 333, 250, 278,    # ' ' to '/'
+    500, 500, 500, 500, 500, 500, 500, 500, 500, 500, 278, 278, 564, 564, 564, 444,    # '0' to '?'
+    921, 722, 667, 667, 722, 611, 556, 722, 722, 333, 389, 722, 611, 889, 722, 722,    # '@' to 'O'
+    556, 722, 667, 556, 611, 722, 722, 944, 722, 722, 611, 333, 278, 333, 469, 500,    # 'P' to '_'
+    333, 444, 500, 444, 500, 444, 333, 500, 500, 278, 278, 500, 278, 778, 500, 500,    # '`' to 'o'
+    500, 500, 333, 389, 278, 500, 500, 722, 500, 500, 444, 480, 200, 480, 541          # 'p' to '~'
+    ]
+
+# The font sizes of the main body: the title line inherits the template's size, while the note is set by the slide makers.
+
+TITLE_SIZE = 18
+NOTE_SIZE = 16
+
+# The line height in ratio of the font size, i.e. single line spacing, and the default insets of a text frame in EMU.
+
+LINE_SPACING = 1.2
+INSET_X = 91440
+INSET_Y = 45720
+
+# A token is either a single wide character, which can be broken anywhere, or a word with its trailing spaces.
+
+WIDE = '\u1100-\u115f\u2e80-\ua4cf\uac00-\ud7a3\uf900-\ufaff\ufe30-\ufe4f\uff00-\uff60\uffe0-\uffe6'
+TOKEN = re.compile('[{0}]|[^\\s{0}]*\\s*'.format(WIDE))
+
+
+@functools.lru_cache(maxsize=None)
+def char_width(char):
+    """Returns the advance width of a character in thousandths of an em.
+
+    The wide and ambiguous east asian characters, which fall back to the east asian font, take a whole em.
+    """
+
+    code = ord(char)
+
+    if 32 <= code < 127:
+        return ASCII_WIDTHS[code - 32]
+
+    if unicodedata.east_asian_width(char) in ('W', 'F', 'A'):
+        return 1000
+
+    if unicodedata.combining(char) or unicodedata.category(char) == 'Cf':
+        return 0
+
+    return 500
+
+
+@functools.lru_cache(maxsize=65536)
+def token_width(token):
+    """Returns the advance widths of a token in thousandths of an em, which are memoized since words repeat a lot.
+
+    Returns:
+        A tuple of (the width with the trailing spaces, the width without them).
+    """
+
+    word = token.rstrip()
+    width = sum(map(char_width, word))
+
+    return width + sum(map(char_width, token[len(word):])), width
+
+
+def wrap(text, width, size):
+    """Wraps the text into lines, the way a text frame does.
+
+    Args:
+        text: A string of the text, whose '\\n' starts a new paragraph.
+        width: An integer width of the lines in EMU.
+        size: A number of the font size in pt.
+
+    Returns:
+        A list of the lines, each one as a tuple of (paragraph number, text of the line).
+    """
+
+    limit = width * 1000 / Pt(size) # The width in thousandths of an em.
+    lines = []
+
+    for number, paragraph in enumerate(text.split('\n')):
+
+        line = ''
+        used = 0
+
+        for token in TOKEN.findall(paragraph):
+
+            if not token:
+                continue
+
+            advance, visible = token_width(token)
+
+            # The trailing spaces may hang over the right edge of the line.
+
+            if line and used + visible > limit:
+                lines.append((number, line))
+                line = ''
+                used = 0
+
+            line += token
+            used += advance
+
+        lines.append((number, line))
+
+    return lines
+
+
+def line_height(size):
+    """Returns the height of a line in EMU."""
+
+    return Pt(size) * LINE_SPACING
+
+
+def formula_box(tex, width):
+    """Returns the picture of a display formula rendered at the note's font size, see notemarkup.FormulaCache.
+
+    Returns:
+        A tuple of (the bytes of the picture, its width and height in EMU), in which the picture is shrunk to the width
+        of the lines if it's wider, or None if the formula can't be rendered.
+    """
+
+    picture = notemarkup.formulas().picture(tex, NOTE_SIZE)
+
+    if picture is None:
+        return None
+
+    blob, picture_width, picture_height = picture
+
+    if picture_width > width:
+        return blob, width, round(picture_height * width / picture_width)
+
+    return blob, picture_width, picture_height
+
+
+def note_lines(note, width):
+    """Wraps a note into lines like wrap(), in which a display formula takes the lines its picture covers.
+
+    Returns:
+        A list of the lines as wrap()'s. The first line of a formula's picture holds the formula, and the others
+        hold None instead of any text.
+    """
+
+    if '$$' not in note:
+        return wrap(note, width, NOTE_SIZE)
+
+    lines = []
+
+    for number, paragraph in enumerate(note.split('\n')):
+
+        tex = notemarkup.display_formula(paragraph)
+        box = None if tex is None else formula_box(tex, width)
+
+        if box is None:
+            lines.extend((number, line) for paragraph_number, line in wrap(paragraph, width, NOTE_SIZE))
+            continue
+
+        lines.append((number, paragraph))
+        lines.extend((number, None) for n in range(math.ceil(box[2] / line_height(NOTE_SIZE)) - 1))
+
+    return lines
+
+
+def paginate(node, prs, layout_idx, note=None):
+    """Splits the note of a node into the pages of a text slide, so that each page fits the main body placeholder.
+
+    The text is measured against the placeholder's geometry in the layout schema, with the memoized glyph widths above
+    instead of rendering the slides. The first page holds the title line followed by an empty line, then the note, and
+    the note is followed by another empty line, as the slide makers fill it. Every page repeats the title, so that the
+    continuation slides look the same as the first one.
+
+    A display formula takes the lines its picture covers, which are kept on the same page, see note_lines(). And a code
+    block split by a page is closed at the end of the page and opened again on the next page, see notemarkup.
+
+    Args:
+        node: The OutlineNode object whose note is split.
+        prs: The presentation object, whose layout schema gives the geometry.
+        layout_idx: An integer index of the text slide's layout.
+        note: A string of the note to be split instead of the node's note, e.g. without its image references.
+
+    Returns:
+        A list of the notes of the pages, which only contains the note if it fits a single slide.
+    """
+
+    if note is None:
+        note = node.note
+
+    with profiler.stage('paginate'):
+
+        info = layoutschema.schema_of(prs).placeholder(layout_idx, 'main_body')
+        width = info.width - 2 * INSET_X
+        height = info.height - 2 * INSET_Y
+
+        # The height left for the note, after the title line, the empty line below it and the trailing empty line.
+
+        title_lines = len(wrap('◤' + node.title, width, TITLE_SIZE)) + 1
+        capacity = int((height - title_lines * line_height(TITLE_SIZE)) // line_height(NOTE_SIZE)) - 1
+        capacity = max(capacity, 1)
+
+        lines = note_lines(note, width)
+
+        if len(lines) <= capacity:
+            return [note]
+
+        # Joins the lines back page by page, the lines of the same paragraph without a separator.
+
+        pages = []
+        start = 0
+
+        while start < len(lines):
+
+            end = min(start + capacity, len(lines))
+
+            # Moves the page break before a formula whose picture would be split, unless it's taller than a page.
+
+            back = end
+            while back < len(lines) and back > start and lines[back][1] is None:
+                back -= 1
+
+            if back > start:
+                end = back
+
+            page = ''
+            last = None
+
+            for number, line in lines[start:end]:
+
+                if last is not None and number != last:
+                    page = page.rstrip(' ') + '\n'
+
+                page += line or ''
+                last = number
+
+            pages.append(page.rstrip(' '))
+            start = end
+
+        if '```' in note:
+            close_fences(pages)
+
+        return pages
+
+
+def close_fences(pages):
+    """Closes each code block split by a page at the end of the page, and opens it again on the next page."""
+
+    fence = None
+
+    for n in range(len(pages)):
+
+        if fence is not None:
+            pages[n] = fence + '\n' + pages[n]
+
+        fence = notemarkup.open_fence(pages[n])
+
+        if fence is not None:
+            pages[n] += '\n```'
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import time
+
+    from pptx import Presentation
+
+    from . import load
+
+    prs = Presentation('../templates/Marxist.pptx')
+    node = load.OutlineNode('Long note', 'AutoPre fills the slides from the outline. ' * 200 + '让我们专注于内容本身。' * 100, 3)
+
+    start = time.perf_counter()
+    pages = paginate(node, prs, 3)
+    print("{} pages in {:.3f}ms".format(len(pages), (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    for n in range(100):
+        paginate(node, prs, 3)
+    print("Again 100 times: {:.3f}ms".format((time.perf_counter() - start) * 1000))
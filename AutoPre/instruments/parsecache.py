@@ -0,0 +1,234 @@
+import os
+import zlib
+import pickle
+import hashlib
+import threading
+import contextlib
+
+from . import load
+
+
+def flatten(root_node):
+    """Flattens a nodes' tree into compact parallel lists.
+
+    Returns:
+        A tuple of (titles, notes, layers, fathers) in pre-order, in which fathers contains the index of each node's
+        father, or -1 for the node the tree is flattened from, e.g. a section of a larger tree. The lists are empty if
+        the root node is None, i.e. the file is empty.
+    """
+
+    titles = []
+    notes = []
+    layers = []
+    fathers = []
+
+    if root_node is None:
+        return titles, notes, layers, fathers
+
+    # The columns of a whole columnar tree are the lists already.
+
+    if isinstance(root_node, load.TreeNode) and root_node.index == 0:
+        tree = root_node.tree
+        return list(tree.titles), list(tree.notes), tree.layers.tolist(), tree.fathers.tolist()
+
+    index = {}
+
+    for node, part_num, part_title in root_node.walk():
+        index[node] = len(titles)
+
+        titles.append(node.title)
+        notes.append(node.note)
+        layers.append(node.layer)
+        fathers.append(index.get(node.father, -1))
+
+    return titles, notes, layers, fathers
+
+
+def unflatten(titles, notes, layers, fathers):
+    """Builds the nodes' tree back from the lists made by flatten() as a columnar store, see load.OutlineTree.
+
+    Returns:
+        The view of the root node, or None if the lists are empty.
+    """
+
+    if not titles:
+        return None
+
+    return load.OutlineTree(titles, notes, layers, fathers).node()
+
+
+class ParseCache(object):
+    """Class of the on-disk cache of the parsed nodes' trees.
+
+    A tree is keyed by the hash of the file's content, the reader and load.PARSER_VERSION, so that an unchanged file
+    is never parsed twice, wherever it's located. The trees are stored as compressed parallel lists, see flatten(),
+    and read back as columnar trees, see unflatten(). Once the cache grows beyond its size bound, the least recently
+    used trees are removed.
+
+    Attributes:
+        location: A string that indicates folder that contains the cached trees.
+        max_bytes: An integer count of the bytes the cached trees may take in total.
+        hits: An integer count of the trees read from the cache.
+        misses: An integer count of the trees parsed from the files.
+    """
+
+    def __init__(self, location='.autopre_cache/', max_bytes=256 * 2**20):
+
+        self.location = location
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+        os.makedirs(location, exist_ok=True)
+
+    def key(self, location, reader):
+        """Returns the key of the tree of a file read by the reader.
+
+        The bytes of a file are hashed as they are. A file object is hashed from its current position, then put back
+        to it for the reader, so it should be seekable.
+        """
+
+        digest = hashlib.sha256()
+        digest.update('{}:{}:'.format(reader.__name__, load.PARSER_VERSION).encode('UTF-8'))
+
+        if isinstance(location, (bytes, bytearray, memoryview)):
+            digest.update(location)
+            return digest.hexdigest()
+
+        with load.open_source(location) as file:
+            position = file.tell()
+
+            for chunk in iter(lambda: file.read(2**20), b''):
+                digest.update(chunk)
+
+            file.seek(position)
+
+        return digest.hexdigest()
+
+    def read(self, location, reader):
+        """Returns the tree of a file from the cache, or parses the file with the reader and caches its tree.
+
+        An empty file, whose reader returns None, is cached as empty lists, see flatten(), and read back as None.
+
+        Args:
+            location: A string that contains the location of the content file, the bytes of the file,
+                or a binary file object.
+            reader: The function that parses the file and returns the root node, e.g. load.read_opml.
+        """
+
+        reader = getattr(reader, '__wrapped__', reader) # Parses the file directly even if a cached reader is given.
+
+        path = os.path.join(self.location, self.key(location, reader) + '.tree')
+
+        try:
+            with open(path, 'rb') as file:
+                lists = pickle.loads(zlib.decompress(file.read()))
+
+        except (OSError, ValueError, zlib.error, pickle.UnpicklingError, EOFError):
+            lists = None
+
+        if lists is not None:
+
+            with self._lock:
+                self.hits += 1
+
+            os.utime(path) # Marks it as recently used.
+            return unflatten(*lists)
+
+        with self._lock:
+            self.misses += 1
+
+        root_node = reader(location)
+        self.write(path, root_node)
+
+        return root_node
+
+    def write(self, path, root_node):
+        """Writes a tree into the cache and evicts the least recently used ones beyond the size bound."""
+
+        content = zlib.compress(pickle.dumps(flatten(root_node), protocol=pickle.HIGHEST_PROTOCOL))
+
+        # Writes a temporary file first, so that other processes never read a partial tree.
+
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(temporary, 'wb') as file:
+            file.write(content)
+
+        os.replace(temporary, path)
+
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used trees until the cache fits its size bound."""
+
+        entries = []
+        total = 0
+
+        with os.scandir(self.location) as scan:
+            for entry in scan:
+
+                if not entry.name.endswith('.tree'):
+                    continue
+
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+
+        for mtime, size, path in entries:
+
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total -= size
+
+
+# The parse caches of the process, keyed by their folders.
+
+CACHES = {}
+
+
+def enable(location='.autopre_cache/', max_bytes=256 * 2**20):
+    """Makes the readers of load use the parse cache of the folder, and returns it."""
+
+    if location not in CACHES:
+        CACHES[location] = ParseCache(location, max_bytes)
+
+    load.PARSE_CACHE = CACHES[location]
+
+    return load.PARSE_CACHE
+
+
+def disable():
+    """Makes the readers of load always parse the files."""
+
+    load.PARSE_CACHE = None
+
+
+@contextlib.contextmanager
+def using(location='.autopre_cache/', max_bytes=256 * 2**20):
+    """Makes the readers of load use the parse cache of the folder within the block only, see enable(), and gives the
+    cache. The cache the readers used before, if any, is restored after the block, so that a job of a long-running
+    process, e.g. a worker of the watch mode, doesn't change how the next jobs read their files."""
+
+    previous = load.PARSE_CACHE
+
+    try:
+        yield enable(location, max_bytes)
+
+    finally:
+        load.PARSE_CACHE = previous
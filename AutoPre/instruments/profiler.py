@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import cProfile
+import tracemalloc
+
+
+class NullStage(object):
+    """The stage handed out while no recorder is active, which does nothing at all."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage(object):
+    """Class of a timed stage, which adds its seconds to the recorder on exit."""
+
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder, name):
+
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.recorder.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Recorder(object):
+    """Class of the recorder of the stage timings and counters of a presentation.
+
+    Attributes:
+        stages: A dictory maps the stage name to a list of [seconds, calls].
+        counters: A dictory maps the counter name to its value.
+    """
+
+    def __init__(self):
+
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, name, seconds):
+        """Adds the seconds of a call to a stage."""
+
+        stage = self.stages.get(name)
+
+        if stage is None:
+            self.stages[name] = [seconds, 1]
+        else:
+            stage[0] += seconds
+            stage[1] += 1
+
+    def count(self, name, value=1):
+        """Adds the value to a counter."""
+
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+# The active recorder of the process. The instrumentation only looks it up while it's None.
+
+RECORDER = None
+
+
+def stage(name):
+    """Returns the context manager timing a stage on the active recorder.
+
+    It's NULL_STAGE while no recorder is active, so that the instrumentation costs almost nothing when disabled.
+    """
+
+    if RECORDER is None:
+        return NULL_STAGE
+
+    return Stage(RECORDER, name)
+
+
+def count(name, value=1):
+    """Adds the value to a counter of the active recorder, if any."""
+
+    if RECORDER is not None:
+        RECORDER.count(name, value)
+
+
+class Capture(object):
+    """Class of the capture of a presentation's instrumentation.
+
+    Within the capture, a recorder is active, and optionally cProfile and tracemalloc are running.
+    After it, report holds the machine-readable report, see make_report().
+
+    Attributes:
+        name: A string contains the name of the document.
+        profile: A boolean indicates if cProfile is run.
+        memory: A boolean indicates if tracemalloc is run.
+        recorder: The recorder object.
+        stats: The pstats.Stats object of cProfile, or None.
+        report: The dictory of the report, which is None until the capture ends.
+    """
+
+    def __init__(self, name, profile=False, memory=False):
+
+        self.name = name
+        self.profile = profile
+        self.memory = memory
+
+        self.recorder = Recorder()
+        self.stats = None
+        self.report = None
+
+    def __enter__(self):
+
+        global RECORDER
+
+        self._previous = RECORDER
+        RECORDER = self.recorder
+
+        if self.memory:
+            tracemalloc.start()
+
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+
+        global RECORDER
+
+        seconds = time.perf_counter() - self._start
+
+        if self.profile:
+            import pstats # Only imported once asked for, since it's slow to import.
+
+            self._profiler.disable()
+            self.stats = pstats.Stats(self._profiler)
+
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        RECORDER = self._previous
+
+        self.report = make_report(self.name, self.recorder, seconds, peak)
+        return False
+
+    def write(self, location):
+        """Writes the report as [name].profile.json into the folder, and the cProfile stats as [name].prof if any. The
+        folder is created if it doesn't exist."""
+
+        os.makedirs(location, exist_ok=True)
+        base = os.path.join(location, self.name)
+
+        with open(base + '.profile.json', 'w', encoding='UTF-8') as file:
+            json.dump(self.report, file, indent=2)
+
+        if self.stats is not None:
+            self.stats.dump_stats(base + '.prof')
+
+
+def make_report(name, recorder, seconds, peak=None):
+    """Makes the machine-readable report of a presentation.
+
+    Args:
+        name: A string contains the name of the document.
+        recorder: The recorder object.
+        seconds: The seconds of the whole capture.
+        peak: The peak bytes traced by tracemalloc, or None.
+
+    Returns:
+        A dictory of the total seconds, the slides, the slides per second, the seconds per slide type, the bytes
+        written, the peak bytes, the stages and the counters.
+    """
+
+    slide_types = {}
+    slides = 0
+
+    for stage_name, (stage_seconds, calls) in recorder.stages.items():
+
+        if stage_name.startswith('slide/'):
+            slide_types[stage_name[len('slide/'):]] = {'slides': calls, 'seconds': stage_seconds,
+                                                       'seconds_per_slide': stage_seconds / calls}
+            slides += calls
+
+    return {
+        'document': name,
+        'seconds': seconds,
+        'slides': slides,
+        'slides_per_second': slides / seconds if seconds > 0 else None,
+        'slide_types': slide_types,
+        'bytes_written': recorder.counters.get('bytes_written', 0),
+        'peak_bytes': peak,
+        'stages': {stage_name: {'seconds': stage_seconds, 'calls': calls}
+                   for stage_name, (stage_seconds, calls) in recorder.stages.items()},
+        'counters': dict(recorder.counters)
+        }
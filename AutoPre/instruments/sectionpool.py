@@ -0,0 +1,240 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+from . import imagelibrary
+from . import parsecache
+from . import profiler
+from . import strategy
+from . import templatecache
+from . import xmlrender
+
+
+def split_sections(node, part_num=0, part_title=None):
+    """Splits a nodes' tree at its first level sections.
+
+    Args:
+        node: The root OutlineNode object of the nodes' tree.
+        part_num: An integer count of the parts before the tree.
+        part_title: A string contains the title of the part before the tree.
+
+    Returns:
+        A list of tuples of (section node, part_num, part_title), in which part_num and part_title indicate the part
+        before the section, so that its slides are numbered the same as OutlineNode.walk() does for the whole tree.
+    """
+
+    sections = []
+
+    for child in node.child:
+        sections.append((child, part_num, part_title))
+
+        if child.layer == 1:
+            part_num += 1
+            part_title = child.title
+
+    return sections
+
+
+def extract_slides(prs):
+    """Takes the slides of a presentation out as plain data, which is sent back from a worker process.
+
+    Returns:
+        A list of tuples of (layout index, serialized XML, pictures) in the order of the slides, in which pictures is a
+        list of tuples of (relationship id, bytes, file name) of the images the slide relates to.
+
+    Raises:
+        ValueError: A slide relates to a part other than its layout and images, which can't be merged.
+    """
+
+    layouts = {layout.part: layout_idx for layout_idx, layout in enumerate(prs.slide_layouts)}
+    slides = []
+
+    for sldId in prs.part._element.get_or_add_sldIdLst():
+
+        part = prs.part.related_part(sldId.rId)
+        layout_idx = None
+        pictures = []
+
+        for rId, rel in sorted(part.rels.items(), key=lambda item: int(item[0][3:])):
+
+            if rel.reltype == RT.SLIDE_LAYOUT:
+                layout_idx = layouts[rel.target_part]
+
+            elif rel.reltype == RT.IMAGE and not rel.is_external:
+                pictures.append((rId, rel.target_part.blob, rel.target_part.desc))
+
+            else:
+                raise ValueError("The relationship {} of {} can't be merged.".format(rel.reltype, part.partname))
+
+        slides.append((layout_idx, part.blob, pictures))
+
+    return slides
+
+
+def merge_slides(renderer, slides):
+    """Appends the slides taken out by extract_slides() to the presentation of a renderer.
+
+    The slides are added as their serialized XML, the same way the XmlRenderer adds its slides, and each picture is
+    embedded once however many sections use it, see imagelibrary.embed().
+
+    Args:
+        renderer: The XmlRenderer object of the presentation.
+        slides: A list of the slides, see extract_slides().
+
+    Raises:
+        ValueError: The relationships of a slide can't be numbered the same as they were.
+    """
+
+    package = renderer.prs.part.package
+
+    for layout_idx, blob, pictures in slides:
+
+        part = renderer.add_slide(layout_idx, blob)
+
+        # The layout is related first, as rId1, and the images follow in the order of their ids.
+
+        for rId, picture, name in pictures:
+
+            if part.relate_to(imagelibrary.embed(package, picture, name), RT.IMAGE) != rId:
+                raise ValueError("The relationships of {} can't be numbered as {}.".format(part.partname, rId))
+
+
+def start_worker(location, template):
+    """Parses the template into the template cache of a worker process once it starts."""
+
+    templatecache.TEMPLATES.location = location
+    templatecache.TEMPLATES.prototype(template)
+
+
+def render_section(lists, part_num, part_title, prs_info, template, level_mode, img_mode, engine, images):
+    """Renders the slides of a section on a fresh copy of the template, which runs on a worker process.
+
+    Args:
+        lists: The section's nodes' tree as the lists made by parsecache.flatten().
+        part_num, part_title: The part before the section, see split_sections().
+        prs_info: A dictory that contains the basic information of the presentation, without the image library.
+        template, level_mode, img_mode, engine: The same as strategy.make_presentation()'s.
+        images: A tuple of the folder and the cache folder of the image library, or None.
+
+    Returns:
+        A tuple of (the slides, see extract_slides(), the part_num and the part_title after the section).
+    """
+
+    section = parsecache.unflatten(*lists)
+
+    prs_info = dict(prs_info, part_num=part_num, part_title=part_title)
+
+    if images is not None:
+        prs_info['images'] = imagelibrary.open_library(*images)
+
+    prs = templatecache.open_template(template)
+    renderer = strategy.make_renderer(prs, template, engine)
+
+    strategy.standard_strategy(section, prs_info, prs, level_mode, img_mode, renderer=renderer)
+
+    return extract_slides(prs), prs_info['part_num'], prs_info['part_title']
+
+
+class SectionPool(object):
+    """Class of the pool of worker processes that render the first level sections of a presentation in parallel.
+
+    A long presentation is a single document, so it can't be spread over the processes of a batch. Instead, its tree
+    is split at the first level sections, see split_sections(), and each section is rendered on a worker process
+    against its own copy of the same template. The slides are sent back as serialized XML and merged into the
+    presentation in the order of the tree, while the layouts and the media stay those of the presentation.
+    The cover slide, which lists all the sections, is made in the current process.
+
+    Use it as a context manager, e.g. "with SectionPool('Marxist') as pool: standard_strategy(..., pool=pool)".
+
+    Attributes:
+        template: A string contains the name of the template.
+        engine: A string contains the render engine of the workers, see strategy.ENGINES.
+        workers: An integer count of the worker processes.
+        executor: The process pool, which is created on entering.
+    """
+
+    def __init__(self, template, engine='pptx', workers=None):
+
+        self.template = template
+        self.engine = engine
+        self.workers = workers
+        self.executor = None
+
+    def __enter__(self):
+
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=start_worker,
+                                            initargs=(templatecache.TEMPLATES.location, self.template))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+
+        return False
+
+    def render(self, node, prs_info, prs, level_mode, img_mode, writer=None, renderer=None):
+        """Makes the slides of the sections of a nodes' tree on the workers and merges them into the presentation.
+
+        The sections are merged as soon as each one and those before it are done, and flushed by the writer if any.
+
+        Args:
+            node: The root OutlineNode object, whose own slides are already made.
+            The others are the same as strategy.standard_strategy()'s.
+        """
+
+        if renderer is None:
+            renderer = xmlrender.XmlRenderer(prs, self.template)
+
+        info = {key: value for key, value in prs_info.items() if key != 'images'}
+
+        if prs_info.get('images') is not None:
+            images = (prs_info['images'].location, prs_info['images'].cache_location)
+        else:
+            images = None
+
+        futures = [self.executor.submit(render_section, parsecache.flatten(section), part_num, part_title, info,
+                                        self.template, level_mode, img_mode, self.engine, images)
+                   for section, part_num, part_title in split_sections(node, prs_info['part_num'], prs_info['part_title'])]
+
+        for future in futures:
+
+            slides, part_num, part_title = future.result()
+
+            with profiler.stage('merge'):
+                merge_slides(renderer, slides)
+
+            profiler.count('sections_merged')
+
+            prs_info['part_num'] = part_num
+            prs_info['part_title'] = part_title
+
+            if writer is not None:
+                writer.flush()
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import io
+    import os
+    import time
+
+    from . import benchmark
+
+    templatecache.TEMPLATES.location = '../templates/'
+
+    root_node = benchmark.make_tree(benchmark.make_outline(40, 3, 3, 200))
+
+    start = time.perf_counter()
+    strategy.stream_presentation(root_node, benchmark.prs_info('SZU'), 'SZU', True, False, io.BytesIO())
+    print("In a single process: {:.3f}s".format(time.perf_counter() - start))
+
+    for workers in [2, 4, os.cpu_count()]:
+
+        with SectionPool('SZU', workers=workers) as pool:
+
+            start = time.perf_counter()
+            strategy.stream_presentation(root_node, benchmark.prs_info('SZU'), 'SZU', True, False, io.BytesIO(), pool=pool)
+            print("On {} workers: {:.3f}s".format(workers, time.perf_counter() - start))
@@ -0,0 +1,291 @@
+import io
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from . import load
+from . import batch
+from . import strategy
+from . import templateregistry
+from . import watcher
+
+# The default options of a request. The format of the outline is one of load.READERS, e.g. 'opml' or 'docx', or None
+# to detect it from the outline's first bytes, see load.detect_format(). With prune set, the layouts no slide uses are
+# dropped from the presentation, see packaging.prune_layouts().
+
+DEFAULT_OPTIONS = {
+    'format': None,
+    'title': '',
+    'date': '',
+    'author': '',
+    'template': 'Marxist',
+    'level_mode': True,
+    'img_mode': False,
+    'engine': 'pptx',
+    'prune': False
+    }
+
+# Stands for the service's default timeout in RenderService.render(), as None stands for no limit.
+
+_DEFAULT_TIMEOUT = object()
+
+
+def render_outline(outline, options):
+    """Renders the presentation of an outline, which runs on a worker of the service.
+
+    The outline is parsed from its bytes and the presentation is written into a buffer, without any temporary file.
+
+    Args:
+        outline: The bytes of the outline file.
+        options: A dictory of the options, whose missing keys take the values of DEFAULT_OPTIONS.
+
+    Returns:
+        The bytes of the presentation file (.pptx).
+
+    Raises:
+        ValueError: The options are invalid, or the outline is empty or of an unsupported format.
+    """
+
+    spec = dict(DEFAULT_OPTIONS)
+    spec.update(options)
+
+    if spec['format'] is not None and spec['format'] not in load.READERS:
+        raise ValueError("Format {} is invalid, which should be one of {}.".format(spec['format'], list(load.READERS)))
+
+    if spec['template'] not in templateregistry.names():
+        raise ValueError("Template {} is invalid, which should be one of {}.".format(
+            spec['template'], templateregistry.names()))
+
+    root_node = load.read_file(outline, spec['format'])
+
+    if root_node is None:
+        raise ValueError("The outline is empty or of an unsupported format.")
+
+    prs_info = {
+        'title': spec['title'],
+        'date': spec['date'],
+        'part_num': 0,
+        'part_title': None,
+        'color': templateregistry.color(spec['template']),
+        'author': spec['author']
+        }
+
+    output = io.BytesIO()
+    strategy.stream_presentation(root_node, prs_info, spec['template'], batch.to_bool(spec['level_mode']),
+                                 batch.to_bool(spec['img_mode']), output, spec['engine'], batch.to_bool(spec['prune']))
+
+    return output.getvalue()
+
+
+class RenderService(object):
+    """Class of the asyncio service that renders presentations on a pool of workers.
+
+    The requests wait in a bounded queue. Once it's full, render() waits for a free place before queueing another
+    request, so that a burst of requests applies backpressure on the callers instead of piling up. A fixed count of
+    consumers take the requests from the queue and run them on the executor, whose worker processes parse the
+    templates once when they start and reuse them from their template cache afterwards.
+
+    A request cancelled or timed out while it's queued is dropped without being rendered. Once it's running on a worker,
+    it can't be interrupted, but its result is discarded and isn't counted as rendered.
+
+    Use it as an async context manager, e.g. "async with RenderService() as service: await service.render(...)".
+
+    Attributes:
+        workers: An integer count of the requests rendered at the same time.
+        queue_size: An integer count of the requests waiting at most.
+        timeout: The default seconds a request may take, including its waiting, or None for no limit.
+        executor: The executor the requests are rendered on. A process pool of the workers is created by default.
+        rendered: An integer count of the presentations delivered to the callers.
+        discarded: An integer count of the presentations rendered after their requests are cancelled or timed out.
+        dropped: An integer count of the requests cancelled or timed out before they're rendered.
+    """
+
+    def __init__(self, workers=2, queue_size=8, timeout=60, executor=None):
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.executor = executor
+
+        self.rendered = 0
+        self.discarded = 0
+        self.dropped = 0
+
+        self._own_executor = executor is None
+        self._queue = None
+        self._consumers = []
+
+    async def __aenter__(self):
+
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+
+        await self.close()
+        return False
+
+    async def start(self):
+        """Starts the executor and the consumers."""
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=watcher.warm_up,
+                                                initargs=(templateregistry.names(),))
+
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._consumers = [asyncio.create_task(self._consume()) for n in range(self.workers)]
+
+    async def close(self):
+        """Stops the consumers, cancels the queued requests and shuts the executor down."""
+
+        for consumer in self._consumers:
+            consumer.cancel()
+
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+
+        while not self._queue.empty():
+            future, outline, options = self._queue.get_nowait()
+            future.cancel()
+
+        if self._own_executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    @property
+    def pending(self):
+        """The count of the requests waiting in the queue."""
+
+        return self._queue.qsize()
+
+    async def render(self, outline, options=None, timeout=_DEFAULT_TIMEOUT):
+        """Renders the presentation of an outline.
+
+        Args:
+            outline: The bytes of the outline file.
+            options: A dictory of the options, see DEFAULT_OPTIONS.
+            timeout: The seconds the request may take, including its waiting, or None for no limit. Defaults to the
+                service's timeout.
+
+        Returns:
+            The bytes of the presentation file (.pptx).
+
+        Raises:
+            asyncio.TimeoutError: The request takes longer than the timeout.
+            asyncio.CancelledError: The request is cancelled.
+            ValueError: The options are invalid, or the outline is empty or of an unsupported format.
+        """
+
+        if timeout is _DEFAULT_TIMEOUT:
+            timeout = self.timeout
+
+        future = asyncio.get_running_loop().create_future()
+
+        async def request():
+            await self._queue.put((future, outline, options or {})) # Waits here while the queue is full.
+            return await future
+
+        try:
+            return await asyncio.wait_for(request(), timeout)
+
+        finally:
+            future.cancel() # Lets the consumers drop the request if it's still queued.
+
+    async def _consume(self):
+        """Takes the requests from the queue one by one and renders them on the executor."""
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            future, outline, options = await self._queue.get()
+
+            try:
+                if future.done():
+                    self.dropped += 1
+                    continue
+
+                try:
+                    result = await loop.run_in_executor(self.executor, render_outline, outline, options)
+
+                except asyncio.CancelledError: # The service is closed while the request is being rendered.
+                    future.cancel()
+                    raise
+
+                except Exception as error:
+                    if not future.done():
+                        future.set_exception(error)
+
+                else:
+                    if future.done():
+                        self.discarded += 1
+                    else:
+                        future.set_result(result)
+                        self.rendered += 1
+
+            finally:
+                self._queue.task_done()
+
+
+class LocalClient(object):
+    """Class of a stand-in client that sends the requests to a service in the same process, with no network.
+
+    Attributes:
+        service: The RenderService object.
+    """
+
+    def __init__(self, service):
+
+        self.service = service
+
+    async def post(self, location, options=None, timeout=_DEFAULT_TIMEOUT):
+        """Sends the outline file as the request, like uploading it.
+
+        The timeout is passed to RenderService.render(), i.e. the service's timeout by default, or None for no limit.
+
+        Returns:
+            A tuple of (status, body): 200 and the presentation bytes, 400 for invalid requests, 504 for time outs,
+            or 500 and the error message.
+        """
+
+        with open(location, 'rb') as file:
+            outline = file.read()
+
+        options = dict(options or {})
+        options.setdefault('format', load.detect_format(location))
+
+        try:
+            return 200, await self.service.render(outline, options, timeout)
+
+        except asyncio.TimeoutError:
+            return 504, b'Timed out.'
+
+        except ValueError as error:
+            return 400, str(error).encode('UTF-8')
+
+        except Exception as error:
+            return 500, repr(error).encode('UTF-8')
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import time
+
+    async def main():
+
+        async with RenderService(workers=2, queue_size=2) as service:
+            client = LocalClient(service)
+
+            start = time.perf_counter()
+            requests = [client.post('documents/OpmlExample.opml', {'title': 'Opml {}'.format(n)}) for n in range(6)]
+            requests += [client.post('documents/DocxExample.docx', {'title': 'Docx', 'template': 'SZU'})]
+            requests += [client.post('documents/OpmlExample.opml', {'template': 'Unknown'})]
+            requests += [client.post('documents/OpmlExample.opml', timeout=0.001)]
+
+            for status, body in await asyncio.gather(*requests):
+                print("  {}  {} bytes".format(status, len(body)))
+
+            print("  {} rendered, {} discarded, {} dropped in {:.3f}s.".format(
+                service.rendered, service.discarded, service.dropped, time.perf_counter() - start))
+
+    asyncio.run(main())
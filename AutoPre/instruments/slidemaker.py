@@ -1,6 +1,15 @@
+import math
+
 from   pptx.dml.color   import RGBColor
+from   pptx.opc.constants import RELATIONSHIP_TYPE as RT
 from   pptx.util        import Pt
 
+from   .                import imagelibrary
+from   .                import layoutschema
+from   .                import notemarkup
+from   .                import pagination
+from   .                import profiler
+
 class BasicSlideMaker(object):
     """The basic slide maker class.
     
@@ -15,8 +24,11 @@ class BasicSlideMaker(object):
             part_title: A string contains the title of the current part.
             color: A list that contains the main theme color in RGB format.
             author: A string contains the name of the author, usually formatted in "Report [name]".
+            images: An optional ImageLibrary object that fills the pictures of the text with image slides, see imagelibrary.
         prs: The presentation object it works on.
         slide: The slide object it creates and works on.
+        layout_idx: An integer index of the slide's layout.
+        placeholders: A dictory maps the placeholder roles of the layout to their information, see layoutschema.
     """
     
     def __init__(self, node, prs_info, prs, layout_idx):
@@ -26,16 +38,96 @@ class BasicSlideMaker(object):
         self.node = node
         self.prs_info = prs_info
         self.prs = prs
+        self.layout_idx = layout_idx
+        self.placeholders = layoutschema.schema_of(prs).layouts[layout_idx]
         
         # Creates a new slide, according to the layout index, in the presentation.
         
-        layout = self.prs.slide_layouts[layout_idx]
-        self.slide = self.prs.slides.add_slide(layout)
+        with profiler.stage('add_slide'):
+            layout = self.prs.slide_layouts[layout_idx]
+            self.slide = self.prs.slides.add_slide(layout)
+            self.shapes = list(self.slide.shapes._spTree.iter_shape_elms())
+
+
+    def get_item(self, role):
+        """Returns the first paragraph of the placeholder according to its role, see layoutschema.ROLES."""
+        with profiler.stage('get_item'):
+            return layoutschema.first_paragraph(self.slide, self.shapes, self.placeholders[role])
 
+    def note_runs(self, item, note):
+        """Outputs a note after the title of the main body, with its code highlighted and its formulas rendered.
+        
+        A note without any code or formula is a single run. Otherwise it's split by notemarkup.split(): a code block
+        becomes a run per highlighted token and a code span a single run, both in the code font. A display formula
+        becomes a picture over the empty lines left for it, at the position its line is measured to be, see
+        pagination.note_lines(). A formula within a line, or one that can't be rendered, is shown as its TeX source.
+        
+        Args:
+            item: The first paragraph of the main body placeholder, which holds the title already.
+            note: A string contains the note.
+        """
+        
+        if not notemarkup.has_markup(note):
+            run = item.add_run()
+            run.text = note + '\n'
+            run.font.size = Pt(16)
+            run.font.color.rgb = RGBColor(*[0,0,0]) # [0,0,0] is black.
+            return
+        
+        with profiler.stage('markup'):
+            
+            info = self.placeholders['main_body']
+            width = info.width - 2 * pagination.INSET_X
+            
+            # The lines above the note, i.e. the title lines and the empty line below them, then the lines of the note.
+            
+            title_lines = len(pagination.wrap('◤' + self.node.title, width, pagination.TITLE_SIZE)) + 1
+            top = info.top + pagination.INSET_Y + title_lines * pagination.line_height(pagination.TITLE_SIZE)
+            lines = pagination.note_lines(note, width)
+            
+            for kind, content, option in notemarkup.split(note) + [('text', '\n', None)]:
+                
+                if kind == 'text':
+                    self.note_run(item, content)
+                
+                elif kind == 'code':
+                    notemarkup.copy_runs(item, notemarkup.code_runs(content, option, 16))
+                
+                else:
+                    box = None if option is None else pagination.formula_box(content, width)
+                    
+                    if box is None:
+                        run = self.note_run(item, content)
+                        run.font.name = notemarkup.FORMULA_FONT
+                        run.font.italic = True
+                        continue
+                    
+                    # The formula's own line and the lines its picture covers below are left empty.
+                    
+                    row = [number for number, line in lines].index(option)
+                    count = math.ceil(box[2] / pagination.line_height(pagination.NOTE_SIZE))
+                    
+                    self.add_formula(box[0], info.left + pagination.INSET_X,
+                                     round(top + row * pagination.line_height(pagination.NOTE_SIZE)), box[1], box[2])
+                    self.note_run(item, '\n' * (count - 1))
 
-    def get_item(self, idx):
-        """Returns the placeholder object according to the placeholder index"""
-        return self.slide.shapes.placeholders[idx].text_frame.paragraphs[0]
+    def note_run(self, item, text):
+        """Adds a run of a note's text in the note's size and color, and returns it."""
+        
+        run = item.add_run()
+        run.text = text
+        run.font.size = Pt(16)
+        run.font.color.rgb = RGBColor(*[0,0,0]) # [0,0,0] is black.
+        
+        return run
+
+    def add_formula(self, blob, left, top, width, height):
+        """Adds the picture of a formula onto the slide, which is embedded once per presentation, see imagelibrary.embed()."""
+        
+        image_part = imagelibrary.embed(self.slide.part.package, blob, 'formula.png')
+        rId = self.slide.part.relate_to(image_part, RT.IMAGE)
+        
+        self.slide.shapes._add_pic_from_image_part(image_part, rId, left, top, width, height)
     
     
 class CoverSlideMaker(BasicSlideMaker):
@@ -59,28 +151,28 @@ class CoverSlideMaker(BasicSlideMaker):
     def title(self):
         """Outputs the title.
         
-        Noted that the index of title placeholder is 10.
+        Noted that the role of title placeholder is 'title'.
         """
         
-        item = self.get_item(10)
+        item = self.get_item('title')
         item.text = self.prs_info['title']
 
     def date(self):
         """Outputs the date.
         
-        Noted that the index of date placeholder is 19.
+        Noted that the role of date placeholder is 'date'.
         """
         
-        item = self.get_item(19)
+        item = self.get_item('date')
         item.text = self.prs_info['date']
 
     def abstract(self):
         """Outputs the abstract.
         
-        Noted that the index of abstract placeholder is 22.
+        Noted that the role of abstract placeholder is 'abstract'.
         """
         
-        item=self.get_item(22)
+        item=self.get_item('abstract')
         num = 1
         
         for child in self.node.child:
@@ -113,36 +205,26 @@ class SectionSlideMaker(BasicSlideMaker):
     def header(self):
         """Outputs the header.
         
-        Noted that the index of header placeholder of first level section slice is 11.
-        While the index of header placeholder of second level section slice is 13.
+        Noted that the role of header placeholder is 'header', whose index is 11 in first level section slice
+        while 13 in second level section slice.
         """
         
-        if self.level == 1:
-            
-            item = self.get_item(11)
-            item.text = self.prs_info['title'] + '\n'
-
-            run = item.add_run()
-            run.text = 'Part ' + str(self.prs_info['part_num']) + ' '+self.prs_info['part_title']
-            
-        else:
-            
-            item = self.get_item(13)
-            item.text = self.prs_info['title'] + '\n'
+        item = self.get_item('header')
+        item.text = self.prs_info['title'] + '\n'
 
-            run = item.add_run()
-            run.text = 'Part ' + str(self.prs_info['part_num']) + ' '+self.prs_info['part_title']
+        run = item.add_run()
+        run.text = 'Part ' + str(self.prs_info['part_num']) + ' '+self.prs_info['part_title']
 
     def section(self):
         """Outputs the section.
         
-        Noted that the index of section placeholder of first level section slice is 13.
-        While the index of section placeholder of second level section slice is 11.
+        Noted that the role of section placeholder is 'section', whose index is 13 in first level section slice
+        while 11 in second level section slice.
         """
         
         if self.level == 1:
             
-            item = self.get_item(13)
+            item = self.get_item('section')
             item.text = '• ' + self.node.title + ' •'
       
             run = item.add_run()
@@ -151,7 +233,7 @@ class SectionSlideMaker(BasicSlideMaker):
             
         else:
             
-            item = self.get_item(11)
+            item = self.get_item('section')
             item.text = '• ' + self.node.title + ' •'
       
             run = item.add_run()
@@ -165,12 +247,21 @@ class TextSlideMaker(BasicSlideMaker):
     Noted that the index of pure text slide slide is 3.
     
     Attributes:
+        note: A string contains the note shown in the main body, which is a page of the node's note on a
+            continuation slide, see pagination.paginate().
         The attributes inherited from the BasicSlideMaker class aren't shown.
     """
     
-    def __init__(self, node, prs_info, prs):
+    layout_idx = 3
+    
+    def __init__(self, node, prs_info, prs, note=None):
+        
+        BasicSlideMaker.__init__(self, node, prs_info, prs, self.layout_idx)
         
-        BasicSlideMaker.__init__(self, node, prs_info, prs, 3)
+        if note is None:
+            self.note = node.note
+        else:
+            self.note = note
 
         self.header()
         self.main_body()
@@ -178,30 +269,27 @@ class TextSlideMaker(BasicSlideMaker):
     def header(self):
         """Outputs the header.
         
-        Noted that the index of header placeholder is 11.
+        Noted that the role of header placeholder is 'header'.
         """
         
-        item = self.get_item(11)
+        item = self.get_item('header')
         item.text = self.prs_info['title'] + '\n'
 
         run = item.add_run()
         run.text = 'Part ' + str(self.prs_info['part_num']) + ' '+self.prs_info['part_title']
 
     def main_body(self):
-        """Outputs the main body.
+        """Outputs the main body, see BasicSlideMaker.note_runs() for the note.
         
-        Noted that the index of header placeholder is 13.
+        Noted that the role of main body placeholder is 'main_body'.
         """
         
-        item = self.get_item(13)
+        item = self.get_item('main_body')
         
         item.text = '◤' + self.node.title + '\n\n'
         item.font.color.rgb = RGBColor(*self.prs_info['color'])
         
-        run = item.add_run()
-        run.text = self.node.note + '\n'
-        run.font.size = Pt(16)
-        run.font.color.rgb = RGBColor(*[0,0,0]) # [0,0,0] is black.
+        self.note_runs(item, self.note)
         
         
 class ImgTextSlideMaker(BasicSlideMaker):
@@ -210,24 +298,37 @@ class ImgTextSlideMaker(BasicSlideMaker):
     Noted that the index of pure text slide slide is 4.
     
     Attributes:
+        note: A string contains the note shown in the main body, which is a page of the node's note on a
+            continuation slide, see pagination.paginate().
+        image: A string that contains the location of the image shown in the picture placeholder, or None to leave it empty.
         The attributes inherited from the BasicSlideMaker class aren't shown.
     """
     
-    def __init__(self, node, prs_info, prs):
+    layout_idx = 4
+    
+    def __init__(self, node, prs_info, prs, note=None, image=None):
         
-        BasicSlideMaker.__init__(self, node, prs_info, prs, 4)
+        BasicSlideMaker.__init__(self, node, prs_info, prs, self.layout_idx)
+        
+        if note is None:
+            self.note = node.note
+        else:
+            self.note = note
+
+        self.image = image
 
         self.header()
         self.legend()
         self.main_body()
+        self.picture()
 
     def header(self):
         """Outputs the header.
         
-        Noted that the index of header placeholder is 11.
+        Noted that the role of header placeholder is 'header'.
         """
         
-        item = self.get_item(11)
+        item = self.get_item('header')
         item.text = self.prs_info['title'] + '\n'
 
         run = item.add_run()
@@ -236,27 +337,36 @@ class ImgTextSlideMaker(BasicSlideMaker):
     def legend(self):
         """Outputs the image's legend.
         
-        Noted that the index of header placeholder is 12.
+        Noted that the role of legend placeholder is 'legend'.
         """
         
-        item = self.get_item(12)
+        item = self.get_item('legend')
         item.text = '◤' + self.node.title
 
     def main_body(self):
-        """Outputs the main body.
+        """Outputs the main body, see BasicSlideMaker.note_runs() for the note.
         
-        Noted that the index of header placeholder is 13.
+        Noted that the role of main body placeholder is 'main_body'.
         """
         
-        item = self.get_item(13)
+        item = self.get_item('main_body')
         
         item.text = '◤' + self.node.title + '\n\n'
         item.font.color.rgb = RGBColor(*self.prs_info['color'])
         
-        run = item.add_run()
-        run.text = self.node.note + '\n'
-        run.font.size = Pt(16)
-        run.font.color.rgb = RGBColor(*[0,0,0]) # [0,0,0] is black.
+        self.note_runs(item, self.note)
+
+    def picture(self):
+        """Outputs the image, which is prepared and embedded by the image library of prs_info['images'].
+        
+        Noted that the role of picture placeholder is 'picture', which is left empty without an image.
+        """
+        
+        if self.image is None:
+            return
+        
+        with profiler.stage('picture'):
+            self.prs_info['images'].insert(self.slide, self.shapes, self.placeholders['picture'], self.image)
         
         
 class BackCoverSlideMaker(BasicSlideMaker):
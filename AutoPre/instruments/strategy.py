@@ -1,96 +1,227 @@
+from . import imagelibrary
 from . import load
+from . import pagination
+from . import profiler
 from . import slidemaker
-from pptx import Presentation
+from . import streamwriter
+from . import templatecache
+from . import templateregistry
+from . import xmlrender
 
-# The theme colors of the templates
+# The render engines: 'pptx' fills the slides with the slide makers through python-pptx objects, while 'xml' fills
+# precompiled slide XML, see xmlrender.XmlRenderer. Both output the same presentation.
 
-THEME_AND_COLORS = {
-    'SWU': [33,39,113],
-    'SZU': [145,25,65],
-    'PolyU': [161,35,56],
-    'Marxist': [160,1,2]
-    }
+ENGINES = ['pptx', 'xml']
 
 
-def standard_strategy(node, prs_info, prs, level_mode, img_mode):
-    """The standard strategy for ppt formated filling.
+def make(maker_class, *args):
+    """Makes a slide with the slide maker class, as a stage timed per class, see profiler.stage()."""
     
-    Noted that the function outputs the information from a nodes' tree.
-    Therefore, this function is called traversally.
+    with profiler.stage('slide/' + maker_class.__name__):
+        return maker_class(*args)
+
+
+def make_slides(node, prs_info, prs, level_mode, img_mode, renderer=None):
+    """Makes the slides of a single node, according to its layer.
+    
+    Noted that prs_info['part_num'] and prs_info['part_title'] should already indicate the part the node belongs to.
     
     Args:
         node: The OutlinNode object that this slide contains.
-        prs_info: A dictory that contains the basic information of the presentation for content filling.
-            title: A string contains the title of the presentation.
-            date: A string contains the data of the presentation, usually formatted in "Date [day/month/year]".
-            part_num: A string that indicates the serial number of the current part, usually formatted in "Part [num]".
-            part_title: A string contains the title of the current part.
-            color: A list that contains the main theme color in RGB format.
-            author: A string contains the name of the author, usually formatted in "Report [name]".
+        prs_info: A dictory that contains the basic information of the presentation for content filling, see standard_strategy().
         prs: The presentation object it works on.
         level_mode: A boolean indicates if we use second level sections or not.
         img_mode: A boolean indicates if we use image in text pages or not.
+        renderer: An optional XmlRenderer object, which makes the slides instead of the slide makers.
         
+    Returns:
+        A list of the slide maker objects it creates, in the order of the slides.
+        The XmlRenderer makes xmlrender.RenderedSlide objects instead.
     """
     
+    if renderer is None:
+        make_slide = make
+    else:
+        make_slide = renderer.make
+    
+    makers = []
+    
     # If the node's layer is 0, makes a cover slide.
     
     if node.layer == 0:
         
-        slidemaker.CoverSlideMaker(node, prs_info, prs)
+        makers.append(make_slide(slidemaker.CoverSlideMaker, node, prs_info, prs))
+        return makers
         
     # If the node's layer is 1, makes a first level section slide
     # And if the node's note is not empty, makes a pure text slide or text with image slide following it.
         
-    elif node.layer == 1:
+    if node.layer == 1:
         
-        prs_info['part_num'] +=  1
-        prs_info['part_title'] = node.title
+        makers.append(make_slide(slidemaker.SectionSlideMaker, node, prs_info, prs, 1))
         
-        slidemaker.SectionSlideMaker(node, prs_info, prs, 1)
-        
-        if node.note != '':
-            if img_mode:
-                slidemaker.ImgTextSlideMaker(node, prs_info, prs)
-            else:
-                slidemaker.TextSlideMaker(node, prs_info, prs)
+        if node.note == '':
+            return makers
     
     # If the node's layer is 2 and the level_mode is true, makes a second level section slide
     # At the same time, if the node's note is not empty, make a pure text slide or text with an image slide following it.
     # Otherwise, if the level_mode is false, treat it like a normal node.
     
-    elif node.layer == 2:
+    elif node.layer == 2 and level_mode:
         
-        if level_mode:
+        makers.append(make_slide(slidemaker.SectionSlideMaker, node, prs_info, prs, 2))
         
-            slidemaker.SectionSlideMaker(node, prs_info, prs, 2)
-            
-            if node.note != '':
-                if img_mode:
-                    slidemaker.ImgTextSlideMaker(node, prs_info, prs)
-                else:
-                    slidemaker.TextSlideMaker(node, prs_info, prs)
-                    
-        else:
-            
-            if img_mode:
-                slidemaker.ImgTextSlideMaker(node, prs_info, prs)
-            else:
-                slidemaker.TextSlideMaker(node, prs_info, prs)
+        if node.note == '':
+            return makers
             
     # Otherwise, makes a pure text slide or text with image slide.
-            
+    # If the note overflows the main body, it's split into continuation slides with the same header, see pagination.paginate().
+    # With an image library, the image referenced by the note is shown on each of them, see imagelibrary.ImageLibrary.split().
+    
+    if img_mode:
+        maker_class = slidemaker.ImgTextSlideMaker
     else:
+        maker_class = slidemaker.TextSlideMaker
+    
+    image = None
+    note = node.note
+    
+    if img_mode and prs_info.get('images') is not None:
+        image, note = prs_info['images'].split(note)
+    
+    for page in pagination.paginate(node, prs, maker_class.layout_idx, note):
         
-        if img_mode:
-            slidemaker.ImgTextSlideMaker(node, prs_info, prs)
+        if image is None:
+            makers.append(make_slide(maker_class, node, prs_info, prs, page))
+        else:
+            makers.append(make_slide(maker_class, node, prs_info, prs, page, image))
+    
+    return makers
+
+
+def standard_strategy(node, prs_info, prs, level_mode, img_mode, writer=None, renderer=None, pool=None):
+    """The standard strategy for ppt formated filling.
+    
+    Noted that the function outputs the information from a nodes' tree.
+    The tree is traversed in pre-order with an explicit stack, see OutlineNode.walk(), so that deep outlines
+    don't hit the recursion limit. The part numbering continues from prs_info['part_num'].
+    
+    Args:
+        node: The OutlinNode object that this slide contains.
+        prs_info: A dictory that contains the basic information of the presentation for content filling.
+            title: A string contains the title of the presentation.
+            date: A string contains the data of the presentation, usually formatted in "Date [day/month/year]".
+            part_num: A string that indicates the serial number of the current part, usually formatted in "Part [num]".
+            part_title: A string contains the title of the current part.
+            color: A list that contains the main theme color in RGB format.
+            author: A string contains the name of the author, usually formatted in "Report [name]".
+            images: An optional ImageLibrary object that fills the pictures of the text with image slides, see imagelibrary.
+        prs: The presentation object it works on.
+        level_mode: A boolean indicates if we use second level sections or not.
+        img_mode: A boolean indicates if we use image in text pages or not.
+        writer: An optional StreamWriter object, which writes the slides of each node as soon as they are made.
+        renderer: An optional XmlRenderer object, which makes the slides instead of the slide makers.
+        pool: An optional SectionPool object. If the node is the root node, only the cover slide is made here, while
+            the first level sections are rendered on the pool's worker processes and merged in order, see sectionpool.
+        
+    """
+    
+    if pool is not None and node.layer == 0:
+        
+        make_slides(node, prs_info, prs, level_mode, img_mode, renderer)
+        pool.render(node, prs_info, prs, level_mode, img_mode, writer, renderer)
+        
+        return
+    
+    for current, part_num, part_title in node.walk(prs_info['part_num'], prs_info['part_title']):
+        
+        prs_info['part_num'] = part_num
+        prs_info['part_title'] = part_title
+        
+        make_slides(current, prs_info, prs, level_mode, img_mode, renderer)
+        
+        if writer is not None:
+            writer.flush()
+
+
+def make_renderer(prs, template, engine):
+    """Returns the renderer of the engine for the presentation made from the template, which is None for the slide makers."""
+    
+    if engine not in ENGINES:
+        raise ValueError("Render engine {} is invalid, which should be one of {}.".format(engine, ENGINES))
+    
+    if engine == 'xml':
+        return xmlrender.XmlRenderer(prs, template)
+    
+    return None
+
+
+def make_presentation(root_node, prs_info, template, level_mode, img_mode, engine='pptx', pool=None):
+    """Makes a whole presentation from a nodes' tree.
+    
+    Opens the template from the process' template cache, fills it with the standard strategy and appends the back cover slide.
+    
+    Args:
+        root_node: The root OutlineNode object of the nodes' tree.
+        prs_info: A dictory that contains the basic information of the presentation for content filling.
+        template: A string contains the name of the template, which should be one of templateregistry.names().
+        level_mode: A boolean indicates if we use second level sections or not.
+        img_mode: A boolean indicates if we use image in text pages or not.
+        engine: A string contains the render engine, which should be one of ENGINES.
+        pool: An optional SectionPool object of the template, which renders the sections in parallel.
+        
+    Returns:
+        The presentation object.
+    """
+    
+    with profiler.stage('template'):
+        prs = templatecache.open_template(template)
+    
+    renderer = make_renderer(prs, template, engine)
+    
+    with profiler.stage('strategy'):
+        standard_strategy(root_node, prs_info, prs, level_mode, img_mode, renderer=renderer, pool=pool)
+        
+        if renderer is None:
+            make(slidemaker.BackCoverSlideMaker, prs)
         else:
-            slidemaker.TextSlideMaker(node, prs_info, prs)
+            renderer.make(slidemaker.BackCoverSlideMaker, prs)
+    
+    return prs
 
-    # Traversally calls this function for all the children of the node.
 
-    for child in node.child:
-        standard_strategy(child, prs_info, prs, level_mode, img_mode)
+def stream_presentation(root_node, prs_info, template, level_mode, img_mode, output, engine='pptx', prune=False,
+                        pool=None):
+    """Makes a whole presentation like make_presentation(), but writes its slides into the output as they are made.
+    
+    So that the peak memory stays flat however long the presentation is, and there is no long save at the end.
+    See streamwriter.StreamWriter.
+    
+    Args:
+        The same as make_presentation()'s, and:
+        output: A string that contains the location of the output presentation file, or a writable binary file object.
+        prune: A boolean indicates if the layouts no slide uses are dropped from the output, see packaging.prune_layouts().
+        
+    Returns:
+        The presentation object, whose slides are left empty once written.
+    """
+    
+    with profiler.stage('template'):
+        prs = templatecache.open_template(template)
+    
+    renderer = make_renderer(prs, template, engine)
+    
+    with streamwriter.StreamWriter(prs, output, prune) as writer:
+        
+        with profiler.stage('strategy'):
+            standard_strategy(root_node, prs_info, prs, level_mode, img_mode, writer, renderer, pool)
+            
+            if renderer is None:
+                make(slidemaker.BackCoverSlideMaker, prs)
+            else:
+                renderer.make(slidemaker.BackCoverSlideMaker, prs)
+    
+    return prs
 
 
 def guide_through(loc_in, loc_out):
@@ -99,7 +230,7 @@ def guide_through(loc_in, loc_out):
     And it now serves as the default way of exploiting the capacity of AutoPre.
     
     Args:
-        loc_in: A string that indicates folder that contains the content files (.opml or .docx).
+        loc_in: A string that indicates folder that contains the content files (.opml, .docx or .md).
         loc_out: A string that indicates folder that contains the output files (.pptx).
     """
     
@@ -163,14 +294,14 @@ def guide_through(loc_in, loc_out):
         # Sets the template of the presentation.
           
         names = ''
-        for name in THEME_AND_COLORS.keys():
+        for name in templateregistry.names():
             names = names + name + '  '
         
         print("\n  Please enter the template name. Here are the choices:", end = '')
         
         template = input("  请输入模板名称，以下为选择范围:\n  {}\n  ".format(names))
             
-        if template not in THEME_AND_COLORS.keys():
+        if template not in templateregistry.names():
             
             print("\n  Input is invalid. Please note the case. Now using default template Marxist.")
             
@@ -180,7 +311,7 @@ def guide_through(loc_in, loc_out):
         
         # Sets the themecolor according to the template used.
         
-        prs_info['color'] = THEME_AND_COLORS[template]
+        prs_info['color'] = templateregistry.color(template)
         
         # Defines whether the second level sections pages will be used.
             
@@ -226,14 +357,20 @@ def guide_through(loc_in, loc_out):
         else:
             img_mode = False
         
-        # Outputs the presentation file.
+        # Sets the folder of the images referenced by the notes, e.g. "![name]" or "![#tag]" in a line of its own.
         
-        prs = Presentation('templates/' + template + '.pptx')
+        if img_mode:
+            
+            print("\n  Please enter the folder of the images referenced by the notes, or leave it empty.", end = '')
+            
+            images = input("  请输入笔记中引用的图片所在的文件夹，或留空.\n  ")
+            
+            if images != '':
+                prs_info['images'] = imagelibrary.open_library(images)
         
-        standard_strategy(root_nodes[n], prs_info, prs, level_mode, img_mode)
-        slidemaker.BackCoverSlideMaker(prs)
+        # Outputs the presentation file.
         
-        prs.save(loc_out + prs_info['title'] + '.pptx')
+        stream_presentation(root_nodes[n], prs_info, template, level_mode, img_mode, loc_out + prs_info['title'] + '.pptx')
         
         print("\n  Presentation document is outputted to " + loc_out + prs_info['title'] + '.pptx')
         
@@ -0,0 +1,151 @@
+import os
+import zipfile
+
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.oxml.slide import CT_Slide
+
+from . import packaging
+from . import profiler
+
+
+class StreamWriter(object):
+    """Class of the writer that serializes the slides of a presentation into the output as they are made.
+
+    prs.save() keeps every slide in memory until the end and then writes the whole package at once. Instead, flush()
+    writes each slide made since the last call, together with its relationships, into the zip stream, and swaps its
+    XML for an empty slide, so that the memory taken by the slides stays flat however long the presentation is.
+    The package-level parts, i.e. presentation.xml, the masters, layouts, themes and media, the package relationships
+    and the content types, are kept in memory and only written by close(), the same way packaging.save() writes them.
+
+    A location is written through a temporary file in the same folder, which only replaces the output once the package
+    is completed by close(), so that a presentation that fails halfway never destroys the previous output.
+
+    Noted that a flushed slide is left empty in the presentation object, so the slides should be completed before
+    they are flushed, and the presentation object shouldn't be saved again afterwards.
+
+    Attributes:
+        prs: The presentation object it writes.
+        output: A string that contains the location of the output presentation file, or a writable binary file object.
+        prune: A boolean indicates if the layouts no slide uses are dropped on close, see packaging.prune_layouts().
+        flushed: An integer count of the slides written so far.
+    """
+
+    def __init__(self, prs, output, prune=False):
+
+        self.prs = prs
+        self.output = output
+        self.prune = prune
+        self.flushed = 0
+
+        self._written = set()
+        self._empty_slide = CT_Slide.new()
+
+        if isinstance(output, str):
+            self._temporary = '{}.{}.tmp'.format(output, os.getpid())
+            self._zip = zipfile.ZipFile(self._temporary, 'w', strict_timestamps=False)
+        else:
+            self._temporary = None
+            self._zip = zipfile.ZipFile(output, 'w', strict_timestamps=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        # The package is only completed when the presentation is; otherwise the partial output is discarded, so that
+        # the previous output is kept.
+
+        if exc_type is not None:
+            self.discard()
+            return False
+
+        try:
+            self.close()
+
+        except BaseException:
+            self.discard()
+            raise
+
+        return False
+
+    def discard(self):
+        """Closes the zip stream of a presentation that isn't completed, and removes its temporary file if any."""
+
+        self._zip.close()
+
+        if self._temporary is not None:
+            try:
+                os.remove(self._temporary)
+            except OSError:
+                pass
+
+    def write_part(self, part):
+        """Writes a part and its relationships into the zip stream."""
+
+        packaging.write_member(self._zip, part.partname.membername, part.blob)
+
+        if part._rels:
+            packaging.write_member(self._zip, part.partname.rels_uri.membername, part.rels.xml)
+
+        self._written.add(part)
+
+    def flush(self):
+        """Writes the slides made since the last call into the zip stream and releases their XML."""
+
+        sldIdLst = self.prs.part._element.get_or_add_sldIdLst()
+
+        if len(sldIdLst) == self.flushed:
+            return
+
+        with profiler.stage('save'):
+
+            for sldId in sldIdLst[self.flushed:]:
+
+                part = self.prs.part.related_part(sldId.rId)
+                self.write_part(part)
+
+                # Only an empty slide, shared by all the written slides, is kept. The part still holds the partname and
+                # the relationships, which are needed by the package-level parts.
+
+                part._element = self._empty_slide
+                part.__dict__.pop('slide', None)
+
+            self.flushed = len(sldIdLst)
+
+    def close(self):
+        """Writes the remaining slides and the package-level parts, then closes the zip stream."""
+
+        self.flush()
+
+        with profiler.stage('save'):
+
+            package = self.prs.part.package
+
+            # The slides written can't change anymore, but the layouts and media they relate to aren't written yet.
+
+            profiler.count('media_deduped', packaging.dedupe_media(package, self._written))
+
+            if self.prune:
+                profiler.count('layouts_dropped', packaging.prune_layouts(self.prs))
+
+            parts = tuple(package.iter_parts())
+
+            for part in parts:
+                if part not in self._written:
+                    self.write_part(part)
+
+            packaging.write_member(self._zip, PACKAGE_URI.rels_uri.membername, package._rels.xml)
+            packaging.write_member(self._zip, CONTENT_TYPES_URI.membername,
+                                   serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+
+            self._zip.close()
+
+            if self._temporary is not None:
+                os.replace(self._temporary, self.output)
+
+        if isinstance(self.output, str):
+            profiler.count('bytes_written', os.path.getsize(self.output))
+        else:
+            profiler.count('bytes_written', self.output.tell())
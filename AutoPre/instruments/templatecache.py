@@ -0,0 +1,134 @@
+import os
+import copy
+import threading
+from collections import OrderedDict
+
+from pptx import Presentation
+
+from . import layoutschema
+
+
+class TemplateCache(object):
+    """Class of the cache of parsed ppt templates.
+
+    Opening a template unzips the package and parses its masters, layouts, theme and media every time.
+    The cache parses each template once and keeps the pristine presentation object as a prototype,
+    then hands out deep copies of it, which are several times cheaper than parsing the package again.
+    The prototypes are never filled, so every copy starts from the template's original state.
+    The layout schema of each template, see layoutschema.LayoutSchema, is built and validated once it's parsed,
+    and is shared by all its copies.
+
+    Attributes:
+        location: A string that indicates folder that contains the templates (.pptx).
+        max_size: An integer count of the templates kept in the cache. The least recently used one is dropped beyond it.
+        hits: An integer count of the requests served by a cached prototype.
+        misses: An integer count of the requests that parsed the template file.
+    """
+
+    def __init__(self, location='templates/', max_size=8):
+
+        self.location = location
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._prototypes = OrderedDict() # Maps the template name to (modified time, presentation object, schema).
+        self._lock = threading.Lock()
+
+    def prototype(self, template):
+        """Returns the pristine presentation object of the template, which should not be modified.
+
+        The template is parsed again if its file is modified after it's cached.
+        """
+
+        return self.entry(template)[1]
+
+    def schema(self, template):
+        """Returns the layout schema of the template, which is shared by all its copies."""
+
+        return self.entry(template)[2]
+
+    def entry(self, template):
+        """Returns the cached tuple of (modified time, presentation object, schema) of the template.
+
+        Raises:
+            ValueError: The template misses a layout or a placeholder the slide makers need.
+        """
+
+        path = self.location + template + '.pptx'
+        mtime = os.stat(path).st_mtime_ns
+
+        with self._lock:
+
+            entry = self._prototypes.get(template)
+
+            if entry is not None and entry[0] == mtime:
+                self._prototypes.move_to_end(template)
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+
+        prs = Presentation(path)
+        entry = (mtime, prs, layoutschema.LayoutSchema(prs, template))
+
+        with self._lock:
+
+            self._prototypes[template] = entry
+            self._prototypes.move_to_end(template)
+
+            while len(self._prototypes) > self.max_size:
+                self._prototypes.popitem(last=False)
+
+        return entry
+
+    def open(self, template):
+        """Returns a fresh presentation object of the template.
+
+        Args:
+            template: A string contains the name of the template, e.g. 'Marxist'.
+        """
+
+        mtime, prototype, schema = self.entry(template)
+
+        prs = copy.deepcopy(prototype)
+        layoutschema.register(prs, schema)
+
+        return prs
+
+    def clear(self):
+        """Drops all the cached templates."""
+
+        with self._lock:
+            self._prototypes.clear()
+
+
+# The cache shared by the whole process.
+
+TEMPLATES = TemplateCache()
+
+
+def open_template(template):
+    """Returns a fresh presentation object of the template from the process' template cache."""
+
+    return TEMPLATES.open(template)
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import time
+
+    start = time.perf_counter()
+    for n in range(500):
+        Presentation('../templates/Marxist.pptx')
+    print("Parsing 500 times: {:.3f}s".format(time.perf_counter() - start))
+
+    cache = TemplateCache('../templates/')
+
+    start = time.perf_counter()
+    for n in range(500):
+        cache.open('Marxist')
+    print("Opening 500 times from the cache: {:.3f}s".format(time.perf_counter() - start))
@@ -0,0 +1,406 @@
+import os
+import json
+import zipfile
+import posixpath
+import threading
+from collections import Counter
+from xml.etree import ElementTree
+
+# Only the standard library is imported here. The templates are introspected from their package XML, without building
+# the presentation objects by python-pptx, so that listing and validating them takes milliseconds.
+
+NAMESPACES = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships'
+    }
+
+RELATIONSHIP_ID = '{%s}id' % NAMESPACES['r']
+
+# Increases it whenever the information read from a template changes, so that the older index is rebuilt.
+
+REGISTRY_VERSION = 1
+
+# The accent colors of the default Office theme, which the templates keep unless their theme is customized.
+
+OFFICE_ACCENTS = ['5B9BD5', 'ED7D31', 'A5A5A5', 'FFC000', '4472C4', '70AD47']
+
+# The placeholders of these types are never copied to a slide added with the layout, see python-pptx's
+# SlideLayout.iter_cloneable_placeholders().
+
+LATENT_TYPES = ('dt', 'ftr', 'sldNum')
+
+# A layout placeholder without its own position inherits it from the master placeholder of the base type.
+
+BASE_TYPES = {'chart': 'body', 'clipArt': 'body', 'ctrTitle': 'title', 'dgm': 'body', 'pic': 'body',
+              'subTitle': 'body', 'tbl': 'body'}
+
+# The least difference between the channels of a color that is not taken as a gray.
+
+CHROMA = 48
+
+
+def part_path(source, target):
+    """Returns the path of a part in the package from the target of a relationship of the source part."""
+
+    if target.startswith('/'):
+        return target[1:]
+
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+
+
+def relationships(package, source):
+    """Returns a dictory maps the relationship id to the path of the target part of the source part."""
+
+    rels = posixpath.join(posixpath.dirname(source), '_rels', posixpath.basename(source) + '.rels')
+    root = ElementTree.fromstring(package.read(rels))
+
+    return {rel.get('Id'): part_path(source, rel.get('Target'))
+            for rel in root.iterfind('rel:Relationship', NAMESPACES) if rel.get('TargetMode') != 'External'}
+
+
+def scheme_colors(theme):
+    """Returns the accent colors of a theme element, in hex strings of RGB, e.g. '5B9BD5'."""
+
+    colors = []
+
+    for n in range(1, 7):
+        accent = theme.find('a:themeElements/a:clrScheme/a:accent{}/*'.format(n), NAMESPACES)
+
+        if accent is None:
+            colors.append(None)
+        else:
+            colors.append((accent.get('val') if accent.get('lastClr') is None else accent.get('lastClr')).upper())
+
+    return colors
+
+
+def is_chromatic(color):
+    """Checks if a hex string of RGB is a color rather than a gray."""
+
+    channels = [int(color[n:n + 2], 16) for n in (0, 2, 4)]
+
+    return max(channels) - min(channels) >= CHROMA
+
+
+def placeholders(tree):
+    """Returns the placeholders among the top level shapes of a layout or master element.
+
+    Returns:
+        A list of dictories of the placeholders in the order of the shapes, each one has the keys 'idx', 'type', 'name'
+        and its position and size 'left', 'top', 'width', 'height' in EMU, which are None if it inherits them.
+    """
+
+    found = []
+
+    for shape in tree.find('p:cSld/p:spTree', NAMESPACES):
+
+        properties = shape.find('*/p:nvPr', NAMESPACES)
+        ph = None if properties is None else properties.find('p:ph', NAMESPACES)
+
+        if ph is None:
+            continue
+
+        name = shape.find('*/p:cNvPr', NAMESPACES)
+        offset = shape.find('*/a:xfrm/a:off', NAMESPACES)
+        extent = shape.find('*/a:xfrm/a:ext', NAMESPACES)
+
+        if offset is None:
+            offset = shape.find('p:xfrm/a:off', NAMESPACES)
+            extent = shape.find('p:xfrm/a:ext', NAMESPACES)
+
+        found.append({
+            'idx': int(ph.get('idx', 0)),
+            'type': ph.get('type', 'obj'),
+            'name': '' if name is None else name.get('name', ''),
+            'left': None if offset is None else int(offset.get('x')),
+            'top': None if offset is None else int(offset.get('y')),
+            'width': None if extent is None else int(extent.get('cx')),
+            'height': None if extent is None else int(extent.get('cy'))
+            })
+
+    return found
+
+
+def inspect_template(location):
+    """Introspects a template from its package XML.
+
+    The layouts are those of the first slide master, in the order python-pptx's prs.slide_layouts gives. The accent
+    color of the template, which fills the shapes the slide makers color, is the theme's first accent if the theme is
+    customized. Otherwise the template keeps the default Office theme and colors its shapes directly, so it's the
+    color used the most by the master and the layouts, apart from the grays. Then the roles in layoutschema.ROLES are
+    validated against the placeholders, see validate().
+
+    Args:
+        location: A string that indicates the template file (.pptx).
+
+    Returns:
+        A dictory of the template's information:
+            'color': A list of the RGB of the accent color, e.g. [160, 1, 2].
+            'accents': A list of the theme's accent colors in hex strings of RGB.
+            'layouts': A list of the layouts, each one as a dictory with its 'name' and its cloneable 'placeholders',
+                see placeholders(), whose 'ordinal' is its position among the shapes of a slide added with the layout.
+            'problems': A list of the strings describing what the template misses, which is empty if it's valid.
+
+    Raises:
+        OSError: The template file can't be read.
+    """
+
+    try:
+        with zipfile.ZipFile(location) as package:
+
+            presentation = 'ppt/presentation.xml'
+            root = ElementTree.fromstring(package.read(presentation))
+            master_id = root.find('p:sldMasterIdLst/p:sldMasterId', NAMESPACES).get(RELATIONSHIP_ID)
+            master = relationships(package, presentation)[master_id]
+
+            master_root = ElementTree.fromstring(package.read(master))
+            master_rels = relationships(package, master)
+
+            theme = next(path for path in master_rels.values() if posixpath.basename(path).startswith('theme'))
+            accents = scheme_colors(ElementTree.fromstring(package.read(theme)))
+
+            master_placeholders = placeholders(master_root)
+            used = Counter(element.get('val').upper()
+                           for element in master_root.iter('{%s}srgbClr' % NAMESPACES['a']))
+
+            layouts = []
+
+            for layout_id in master_root.iterfind('p:sldLayoutIdLst/p:sldLayoutId', NAMESPACES):
+
+                layout_root = ElementTree.fromstring(package.read(master_rels[layout_id.get(RELATIONSHIP_ID)]))
+                layout_name = layout_root.find('p:cSld', NAMESPACES).get('name', '')
+
+                used.update(element.get('val').upper() for element in layout_root.iter('{%s}srgbClr' % NAMESPACES['a']))
+
+                cloneable = []
+
+                for info in placeholders(layout_root):
+
+                    if info['type'] in LATENT_TYPES:
+                        continue
+
+                    if info['left'] is None:
+                        base_type = BASE_TYPES.get(info['type'], info['type'])
+                        base = next((base for base in master_placeholders if base['type'] == base_type), None)
+
+                        if base is not None:
+                            for key in ('left', 'top', 'width', 'height'):
+                                info[key] = base[key]
+
+                    info['ordinal'] = len(cloneable)
+                    cloneable.append(info)
+
+                layouts.append({'name': layout_name, 'placeholders': cloneable})
+
+    except (KeyError, AttributeError, StopIteration, zipfile.BadZipFile, ElementTree.ParseError) as error:
+        return {'color': None, 'accents': [], 'layouts': [],
+                'problems': ['a valid package ({}: {})'.format(type(error).__name__, error)]}
+
+    if accents[0] is not None and accents[0] != OFFICE_ACCENTS[0]:
+        color = accents[0]
+    else:
+        color = next((color for color, count in used.most_common() if is_chromatic(color)), accents[0])
+
+    return {
+        'color': None if color is None else [int(color[n:n + 2], 16) for n in (0, 2, 4)],
+        'accents': accents,
+        'layouts': layouts,
+        'problems': validate(layouts)
+        }
+
+
+def validate(layouts):
+    """Returns the strings describing the layouts and placeholders in layoutschema.ROLES the layouts miss.
+
+    Noted that layoutschema is only imported here, as it imports python-pptx, once a template's index entry is built.
+    """
+
+    from .layoutschema import ROLES
+
+    problems = []
+
+    for layout_idx, roles in ROLES.items():
+
+        if layout_idx >= len(layouts):
+            problems.append('layout {}'.format(layout_idx))
+            continue
+
+        indices = {info['idx'] for info in layouts[layout_idx]['placeholders']}
+
+        for role, idx in roles.items():
+            if idx not in indices:
+                problems.append('placeholder {} ({}) in layout {}'.format(idx, role, layout_idx))
+
+    return problems
+
+
+class TemplateRegistry(object):
+    """Class of the registry of the templates in the templates' folder.
+
+    Each template is introspected once, see inspect_template(), and its information is kept in an index file together
+    with the modified time and size of the template file. So a template is introspected again only when its file
+    changes, and the templates added or removed are found by listing the folder, which is all that a refresh costs.
+
+    Attributes:
+        location: A string that indicates folder that contains the templates (.pptx).
+        index: A string that indicates the index file, or None to keep the index in memory only.
+        inspected: An integer count of the templates introspected, i.e. not found in the index.
+    """
+
+    def __init__(self, location='templates/', index='.autopre_cache/templates.json'):
+
+        self.location = location
+        self.index = index
+
+        self.inspected = 0
+
+        self._templates = None # Maps the template name to its information, which is read from the index at first.
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Lists the templates' folder, introspects the templates that are new or changed, and updates the index file.
+
+        Returns:
+            A dictory maps the name of each template to its information, see inspect_template(), in which 'mtime'
+            and 'size' are added.
+        """
+
+        with self._lock:
+
+            if self._templates is None:
+                self._templates = self.read_index()
+
+            templates = {}
+            changed = False
+
+            with os.scandir(self.location) as entries:
+                for entry in entries:
+
+                    if not entry.name.endswith('.pptx') or entry.name.startswith(('~$', '.')) or not entry.is_file():
+                        continue
+
+                    name = entry.name[:-len('.pptx')]
+                    stat = entry.stat()
+                    info = self._templates.get(name)
+
+                    if info is None or info['mtime'] != stat.st_mtime_ns or info['size'] != stat.st_size:
+                        info = inspect_template(entry.path)
+                        info['mtime'] = stat.st_mtime_ns
+                        info['size'] = stat.st_size
+
+                        self.inspected += 1
+                        changed = True
+
+                    templates[name] = info
+
+            if changed or templates.keys() != self._templates.keys():
+                self.write_index(templates)
+
+            self._templates = templates
+
+            return templates
+
+    def names(self):
+        """Returns the sorted names of the valid templates."""
+
+        return sorted(name for name, info in self.refresh().items() if not info['problems'])
+
+    def info(self, template):
+        """Returns the information of a template, see inspect_template().
+
+        Raises:
+            ValueError: The template doesn't exist, or it misses a layout or a placeholder the slide makers need.
+        """
+
+        templates = self.refresh()
+        info = templates.get(template)
+
+        if info is None:
+            raise ValueError("Template {} is invalid, which should be one of {}.".format(template, self.names()))
+
+        if info['problems']:
+            raise ValueError("{} misses {}.".format(template, ', '.join(info['problems'])))
+
+        return info
+
+    def color(self, template):
+        """Returns the RGB of the accent color of a template, e.g. [160, 1, 2]."""
+
+        return list(self.info(template)['color'])
+
+    def read_index(self):
+        """Reads the templates' information from the index file, or returns an empty dictory if it doesn't exist, or
+        it's of another version or another templates' folder."""
+
+        if self.index is None:
+            return {}
+
+        try:
+            with open(self.index, 'r', encoding='UTF-8') as file:
+                content = json.load(file)
+
+        except (OSError, ValueError):
+            return {}
+
+        if content.get('version') != REGISTRY_VERSION or content.get('location') != os.path.abspath(self.location):
+            return {}
+
+        return content['templates']
+
+    def write_index(self, templates):
+        """Writes the templates' information into the index file."""
+
+        if self.index is None:
+            return
+
+        os.makedirs(os.path.dirname(self.index) or '.', exist_ok=True)
+
+        # Writes a temporary file first, so that other processes never read a partial index.
+
+        temporary = '{}.{}.tmp'.format(self.index, os.getpid())
+        content = {'version': REGISTRY_VERSION, 'location': os.path.abspath(self.location), 'templates': templates}
+
+        with open(temporary, 'w', encoding='UTF-8') as file:
+            json.dump(content, file, ensure_ascii=False)
+
+        os.replace(temporary, self.index)
+
+
+# The registry shared by the whole process.
+
+REGISTRY = TemplateRegistry()
+
+
+def names():
+    """Returns the sorted names of the valid templates from the process' registry."""
+
+    return REGISTRY.names()
+
+
+def color(template):
+    """Returns the RGB of the accent color of a template from the process' registry."""
+
+    return REGISTRY.color(template)
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import time
+
+    registry = TemplateRegistry('../templates/', None)
+
+    start = time.perf_counter()
+    registry.refresh()
+    print("Introspecting {} templates: {:.3f}ms".format(registry.inspected, (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    for n in range(100):
+        registry.refresh()
+    print("Refreshing 100 times: {:.3f}ms".format((time.perf_counter() - start) * 1000))
+
+    for name in registry.names():
+        print(name, registry.color(name), registry.info(name)['accents'])
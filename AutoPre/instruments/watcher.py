@@ -0,0 +1,136 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import load
+from . import batch
+from . import templatecache
+from . import templateregistry
+
+
+def snapshot(loc_in):
+    """Returns the modified time and size of every valid document in the input folder and its subfolders.
+
+    The temporary files, e.g. the "~$" lock files of MS Word, and the files of unsupported formats are ignored, see
+    load.scan_files().
+
+    Returns:
+        A dictory maps the file name to a tuple of (modified time, size).
+    """
+
+    stats = {}
+
+    for file in load.scan_files(loc_in):
+
+        try:
+            stat = os.stat(os.path.join(loc_in, file))
+        except OSError: # The file is removed in the meantime.
+            continue
+
+        stats[file] = (stat.st_mtime_ns, stat.st_size)
+
+    return stats
+
+
+def warm_up(templates):
+    """Parses the templates into the template cache of a worker process once it starts, and reads the index of the
+    templates' registry."""
+
+    templateregistry.REGISTRY.refresh()
+
+    for template in templates:
+        templatecache.TEMPLATES.prototype(template)
+
+
+def watch(loc_in, loc_out, manifest, workers=2, interval=0.1, debounce=0.3, stop=None):
+    """Watches the input folder and outputs the presentation of a document again whenever it's saved.
+
+    A burst of changes, e.g. MS Word writes a few temporary files when saving, is merged into a single rebuild once
+    the document stays unchanged for the debounce time. The rebuilds run on a long-running pool of worker processes
+    with the templates already parsed, and the documents are rebuilt incrementally unless the manifest says otherwise.
+    The latency from the detected change to the written output is printed for each rebuild.
+
+    Args:
+        loc_in: A string that indicates folder that contains the content files (.opml, .docx or .md).
+        loc_out: A string that indicates folder that contains the output files (.pptx).
+        manifest: A manifest dictory, see batch.load_manifest().
+        workers: An integer count of the worker processes.
+        interval: The seconds between two scans of the input folder.
+        debounce: The seconds a document should stay unchanged before it's rebuilt.
+        stop: A function that returns True when the watching should stop. It watches until interrupted by default.
+    """
+
+    manifest = dict(manifest)
+    manifest['defaults'] = dict(manifest.get('defaults', {}))
+    manifest['defaults'].setdefault('incremental', True)
+
+    print("AutoPre:\n  Watching {}. Press Ctrl+C to stop.".format(loc_in))
+
+    previous = {}    # The stats of the documents that have been outputted.
+    changed = {}     # Maps the file name to (the time its change is detected, the time of its latest change).
+    running = {}     # Maps the file name to (the future of its rebuild, the time its change is detected).
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up,
+                             initargs=(templateregistry.names(),)) as executor:
+
+        try:
+            while stop is None or not stop():
+
+                now = time.perf_counter()
+                current = snapshot(loc_in)
+
+                for file, stat in current.items():
+                    if previous.get(file) != stat:
+                        detected = changed.get(file, (now, now))[0]
+                        changed[file] = (detected, now)
+                        previous[file] = stat
+
+                for file in list(previous):
+                    if file not in current:
+                        del previous[file]
+                        changed.pop(file, None)
+
+                # Reports the finished rebuilds.
+
+                for file, (future, detected) in list(running.items()):
+
+                    if not future.done():
+                        continue
+
+                    del running[file]
+                    result = future.result()
+
+                    if 'error' in result:
+                        print("  {} failed:\n{}".format(file, result['error']))
+                    else:
+                        print("  {} -> {}  {} slides  latency {:.3f}s".format(
+                            file, result['output'], result['slides'], time.perf_counter() - detected))
+
+                # Rebuilds the documents that have settled, unless they're still being rebuilt.
+
+                ready = [file for file, (detected, latest) in changed.items()
+                         if now - latest >= debounce and file not in running]
+
+                if ready:
+                    jobs = {job['file']: job for job in batch.plan_jobs(loc_in, manifest)}
+
+                    for file in ready:
+                        detected = changed.pop(file)[0]
+
+                        if file in jobs:
+                            future = executor.submit(batch.run_job_safely, jobs[file], loc_in, loc_out)
+                            running[file] = (future, detected)
+
+                time.sleep(interval)
+
+        except KeyboardInterrupt:
+            pass
+
+    print("  Stopped watching {}.".format(loc_in))
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    watch("../documents/", "../outputs/", {})
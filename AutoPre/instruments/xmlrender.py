@@ -0,0 +1,388 @@
+import re
+import weakref
+
+from pptx.opc.constants import CONTENT_TYPE as CT
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.package import Part
+from pptx.opc.packuri import PackURI
+from pptx.oxml import parse_xml
+from pptx.parts.slide import SlidePart
+
+from . import load
+from . import notemarkup
+from . import profiler
+from . import slidemaker
+from . import templatecache
+
+# The fields are marked with private use characters while a skeleton is compiled, e.g. '\ue000title\ue001'.
+
+MARKER = re.compile('\ue000(\\w+)\ue001')
+
+# The fields python-pptx splits into runs and line breaks, see _Paragraph.text, and those of them that fill a paragraph
+# on their own, which has no run at all if they are empty.
+
+PARAGRAPH_FIELDS = {'prs_title', 'date', 'title'}
+STANDALONE_FIELDS = {'prs_title', 'date'}
+
+# The control characters python-pptx escapes as plain text, and the characters XML can't hold at all.
+
+CONTROL = re.compile('[\x00-\x08\x0b-\x1f]')
+INVALID = re.compile('[\ud800-\udfff\ufffe\uffff]')
+
+
+def mark(field):
+    """Returns the marker of a field."""
+
+    return '\ue000' + field + '\ue001'
+
+
+def escape(text):
+    """Escapes the text of a run the same way python-pptx and lxml do, see _Run.text."""
+
+    text = CONTROL.sub(lambda match: '_x%04X_' % ord(match.group()), text)
+
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;')
+
+
+class RenderedSlidePart(SlidePart):
+    """Class of a slide part made from its serialized XML.
+
+    The XML is only parsed if the slide is accessed through python-pptx, e.g. prs.slides[n].shapes. Otherwise the
+    serialized XML is saved as it is.
+    """
+
+    def __init__(self, partname, package, blob):
+
+        Part.__init__(self, partname, CT.PML_SLIDE, package)
+
+        self._xml = blob
+        self._parsed = None
+
+    @property
+    def _element(self):
+
+        if self._parsed is None:
+            self._parsed = parse_xml(self._xml)
+            self._xml = None # The parsed element is the one to be saved from now on.
+
+        return self._parsed
+
+    @_element.setter
+    def _element(self, element):
+
+        self._parsed = element
+        self._xml = None
+
+    @property
+    def blob(self):
+
+        if self._xml is not None:
+            return self._xml
+
+        return serialize_part_xml(self._parsed)
+
+
+class Skeleton(object):
+    """Class of the serialized XML of a slide, with the substitution points of its fields.
+
+    Attributes:
+        layout_idx: An integer index of the slide's layout.
+        segments: A list of tuples of (literal XML, field), of which the last field is None.
+        unit: The tuple of (XML before, XML after) the text of an abstract item on the cover slide, or None.
+    """
+
+    def __init__(self, layout_idx, xml):
+
+        self.layout_idx = layout_idx
+        self.unit = None
+
+        # The abstract items repeat, so the run of the only item is taken out as a unit, see compile().
+
+        item = mark('child')
+
+        if item in xml:
+            start = xml.rindex('<a:r>', 0, xml.index(item))
+            end = xml.index('</a:r>', xml.index(item)) + len('</a:r>')
+
+            run = xml[start:end]
+            self.unit = (run[:run.index('1. ' + item)], run[run.index(item) + len(item):])
+
+            xml = xml[:start] + mark('children') + xml[end:]
+
+        pieces = MARKER.split(xml)
+        self.segments = [(pieces[n], pieces[n + 1] if n + 1 < len(pieces) else None) for n in range(0, len(pieces), 2)]
+
+    def fill(self, values):
+        """Returns the serialized XML of the slide filled with the values, which are escaped already."""
+
+        parts = []
+
+        for literal, field in self.segments:
+            parts.append(literal)
+
+            if field is not None:
+                parts.append(values[field])
+
+        return ''.join(parts).encode('UTF-8')
+
+
+def compile(prs, maker_class, args, color):
+    """Compiles the skeleton of a slide maker by making a slide of marked fields on a scratch presentation.
+
+    Args:
+        prs: The scratch presentation object, whose slides are thrown away.
+        maker_class: The slide maker class.
+        args: The tuple of the extra arguments of the slide maker, i.e. the level of a section slide.
+        color: The theme color of the presentation, which is a part of the XML.
+
+    Returns:
+        The Skeleton object.
+    """
+
+    node = load.OutlineNode(mark('title'), mark('note'), 1, entities=False)
+    node.add_child(load.OutlineNode(mark('child'), '', 2, entities=False))
+
+    prs_info = {
+        'title': mark('prs_title'),
+        'date': mark('date'),
+        'part_num': mark('part_num'),
+        'part_title': mark('part_title'),
+        'color': color,
+        'author': mark('author')
+        }
+
+    if maker_class is slidemaker.BackCoverSlideMaker:
+        maker = maker_class(prs)
+    else:
+        maker = maker_class(node, prs_info, prs, *args)
+
+    return Skeleton(maker.layout_idx, serialize_part_xml(maker.slide.part._element).decode('UTF-8'))
+
+
+class RenderedSlide(object):
+    """Class of a slide made by the XmlRenderer, which stands for the slide maker object.
+
+    Attributes:
+        node: The OutlineNode object that this slide contains.
+        layout_idx: An integer index of the slide's layout.
+        part: The RenderedSlidePart object of the slide.
+    """
+
+    __slots__ = ('node', 'layout_idx', 'part')
+
+    def __init__(self, node, layout_idx, part):
+
+        self.node = node
+        self.layout_idx = layout_idx
+        self.part = part
+
+    @property
+    def slide(self):
+        """The python-pptx slide object, whose XML is parsed on the first access."""
+
+        return self.part.slide
+
+
+# The skeletons compiled for each template, keyed by the template's layout schema, see templatecache.TemplateCache.
+
+SKELETONS = weakref.WeakKeyDictionary()
+
+
+class XmlRenderer(object):
+    """Class of the render engine that fills precompiled slide XML instead of building python-pptx objects.
+
+    For each layout the slide makers use, a skeleton of the slide's XML is compiled once per template and theme color,
+    by running the slide maker itself on marked fields. Then each slide is made by substituting the escaped texts into
+    its skeleton and adding the serialized XML to the package as it is, so that the output is the same as the slide
+    maker's. Anything a skeleton can't express, e.g. a title that contains a line break, falls back to the slide maker.
+
+    Attributes:
+        prs: The presentation object it works on, which is made from the template.
+        template: A string contains the name of the template, whose fresh copy is the scratch of the skeletons.
+        fallbacks: An integer count of the slides made by the slide makers instead.
+    """
+
+    def __init__(self, prs, template):
+
+        self.prs = prs
+        self.template = template
+        self.fallbacks = 0
+
+        self.skeletons = SKELETONS.setdefault(templatecache.TEMPLATES.schema(template), {})
+
+        self._scratch = None
+        self._layout_parts = {}
+        self._count = None
+        self._next_id = None
+
+    def skeleton(self, maker_class, args, color):
+        """Returns the skeleton of a slide maker, which is compiled on the first call."""
+
+        key = (maker_class, args, tuple(color) if color is not None else None)
+        skeleton = self.skeletons.get(key)
+
+        if skeleton is None:
+
+            if self._scratch is None:
+                self._scratch = templatecache.open_template(self.template)
+
+            skeleton = compile(self._scratch, maker_class, args, color)
+            self.skeletons[key] = skeleton
+
+        return skeleton
+
+    def make(self, maker_class, *args):
+        """Makes a slide like strategy.make(), with the same arguments as the slide maker class.
+
+        Returns:
+            The RenderedSlide object, or the slide maker object if it falls back to the slide maker.
+        """
+
+        with profiler.stage('slide/' + maker_class.__name__):
+
+            values = self.values(maker_class, args)
+
+            if values is None:
+                self.fallbacks += 1
+                profiler.count('xml_fallbacks')
+                return maker_class(*args)
+
+            if maker_class is slidemaker.BackCoverSlideMaker:
+                skeleton = self.skeleton(maker_class, (), None)
+                node = None
+
+            elif maker_class is slidemaker.SectionSlideMaker:
+                skeleton = self.skeleton(maker_class, (args[3],), args[1]['color'])
+                node = args[0]
+
+            else:
+                skeleton = self.skeleton(maker_class, (), args[1]['color'])
+                node = args[0]
+
+            if skeleton.unit is not None:
+                before, after = skeleton.unit
+                values['children'] = ''.join(before + escape(str(num) + '. ' + child.title) + after
+                                             for num, child in enumerate(node.child, 1))
+
+            part = self.add_slide(skeleton.layout_idx, skeleton.fill(values))
+
+            return RenderedSlide(node, skeleton.layout_idx, part)
+
+    def values(self, maker_class, args):
+        """Returns the escaped values of the fields of a slide maker's arguments.
+
+        Returns:
+            A dictory maps the field to its escaped value, or None if the skeleton can't express the slide.
+        """
+
+        if maker_class is slidemaker.BackCoverSlideMaker:
+            return {}
+
+        if maker_class is slidemaker.CoverSlideMaker:
+            node, prs_info, prs = args
+            fields = {'prs_title': prs_info['title'], 'date': prs_info['date'], 'author': prs_info['author']}
+
+            if not all(isinstance(child.title, str) and not INVALID.search(child.title) for child in node.child):
+                return None
+
+        elif maker_class is slidemaker.SectionSlideMaker:
+            node, prs_info, prs, level = args
+            fields = {'prs_title': prs_info['title'], 'part_num': str(prs_info['part_num']),
+                      'part_title': prs_info['part_title'], 'title': node.title}
+
+        # A slide with a picture, i.e. given an image as its fifth argument, is left to the slide maker.
+
+        elif maker_class in (slidemaker.TextSlideMaker, slidemaker.ImgTextSlideMaker) and len(args) <= 4:
+            node, prs_info, prs = args[:3]
+            note = args[3] if len(args) == 4 and args[3] is not None else node.note
+
+            # A note with code or formulas is split into more runs and pictures by the slide maker.
+
+            if notemarkup.has_markup(note):
+                return None
+
+            fields = {'prs_title': prs_info['title'], 'part_num': str(prs_info['part_num']),
+                      'part_title': prs_info['part_title'], 'title': node.title, 'note': note}
+
+        else:
+            return None
+
+        values = {}
+
+        for field, value in fields.items():
+
+            # The slide maker raises the error of a value python-pptx can't take, or splits it into more runs.
+
+            if not isinstance(value, str) or INVALID.search(value):
+                return None
+
+            if field in PARAGRAPH_FIELDS and ('\n' in value or '\v' in value):
+                return None
+
+            if field in STANDALONE_FIELDS and value == '':
+                return None
+
+            values[field] = escape(value)
+
+        return values
+
+    def add_slide(self, layout_idx, blob):
+        """Adds a slide of the serialized XML to the presentation, the same way python-pptx adds a new slide.
+
+        Returns:
+            The RenderedSlidePart object.
+        """
+
+        prs_part = self.prs.part
+        sldIdLst = prs_part._element.get_or_add_sldIdLst()
+
+        layout_part = self._layout_parts.get(layout_idx)
+
+        if layout_part is None:
+            layout_part = self.prs.slide_layouts[layout_idx].part
+            self._layout_parts[layout_idx] = layout_part
+
+        part = RenderedSlidePart(PackURI('/ppt/slides/slide%d.xml' % (len(sldIdLst) + 1)), prs_part.package, blob)
+        part.relate_to(layout_part, RT.SLIDE_LAYOUT)
+
+        # The new part can't be related yet, so the relationship is added without looking for an existing one.
+
+        rId = prs_part.rels._add_relationship(RT.SLIDE, part)
+
+        # The next slide id is counted here, unless some slides are added by python-pptx in between.
+
+        if self._count != len(sldIdLst) or self._next_id > 2147483647:
+            self._next_id = sldIdLst._next_id
+
+        sldIdLst._add_sldId(id=self._next_id, rId=rId)
+
+        self._next_id += 1
+        self._count = len(sldIdLst)
+
+        return part
+
+
+# Functions testing.
+
+if __name__ == '__main__':
+
+    import time
+
+    templatecache.TEMPLATES.location = '../templates/'
+
+    prs = templatecache.open_template('Marxist')
+    renderer = XmlRenderer(prs, 'Marxist')
+
+    node = load.OutlineNode('Heading', 'AutoPre fills the slides from the outline. ' * 5, 3)
+    prs_info = {'title': 'Title', 'date': 'Date', 'part_num': 1, 'part_title': 'Part', 'color': [160, 1, 2], 'author': 'Author'}
+
+    start = time.perf_counter()
+    for n in range(500):
+        slidemaker.TextSlideMaker(node, prs_info, prs)
+    print("500 slides by the slide maker: {:.3f}s".format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    for n in range(500):
+        renderer.make(slidemaker.TextSlideMaker, node, prs_info, prs)
+    print("500 slides by the xml renderer: {:.3f}s".format(time.perf_counter() - start))